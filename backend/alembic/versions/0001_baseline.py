@@ -0,0 +1,25 @@
+"""المخطط الأساسي (الجداول كما ينشئها init_db)
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-17
+"""
+from alembic import op
+
+from app.db.database import Base
+import app.models.database  # noqa: F401
+
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # قواعد البيانات الموجودة أُنشئت بـ create_all قبل الترحيلات، فلا يُنشأ إلا الجدول الغائب
+    Base.metadata.create_all(bind=op.get_bind(), checkfirst=True)
+
+
+def downgrade():
+    pass
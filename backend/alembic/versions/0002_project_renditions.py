@@ -0,0 +1,28 @@
+"""عمود renditions للنسخ الإضافية المُرمَّزة
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+
+def _has_column(table: str, column: str) -> bool:
+    return column in {c["name"] for c in sa.inspect(op.get_bind()).get_columns(table)}
+
+
+def upgrade():
+    # قاعدة بيانات جديدة أنشأها 0001 من النماذج الحالية تحتوي العمود مسبقاً
+    if not _has_column("projects", "renditions"):
+        op.add_column("projects", sa.Column("renditions", sa.JSON(), nullable=True))
+
+
+def downgrade():
+    op.drop_column("projects", "renditions")
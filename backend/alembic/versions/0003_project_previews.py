@@ -0,0 +1,32 @@
+"""عمودا preview_sprite_path و thumbnail_path لملفات المعاينة المحلية
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+
+_COLUMNS = ("preview_sprite_path", "thumbnail_path")
+
+
+def _has_column(table: str, column: str) -> bool:
+    return column in {c["name"] for c in sa.inspect(op.get_bind()).get_columns(table)}
+
+
+def upgrade():
+    for column in _COLUMNS:
+        if not _has_column("projects", column):
+            op.add_column("projects", sa.Column(column, sa.String(1000), nullable=True))
+
+
+def downgrade():
+    for column in reversed(_COLUMNS):
+        op.drop_column("projects", column)
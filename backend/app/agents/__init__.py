@@ -1,9 +1,9 @@
 """وكلاء الذكاء الاصطناعي"""
-from .agents.script_writer import ScriptWriterAgent
-from .agents.image_generator import ImageGeneratorAgent
-from .agents.voice_generator import VoiceGeneratorAgent
-from .agents.video_editor import VideoEditorAgent
-from .agents.orchestrator import OrchestratorAgent
+from .script_writer import ScriptWriterAgent
+from .image_generator import ImageGeneratorAgent
+from .voice_generator import VoiceGeneratorAgent
+from .video_editor import VideoEditorAgent
+from .orchestrator import OrchestratorAgent
 
 
 __all__ = [
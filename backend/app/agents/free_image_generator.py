@@ -1,11 +1,15 @@
 """免费图片生成器 - 使用Hugging Face Diffusers"""
-import os
 import asyncio
 from typing import List, Optional
 from PIL import Image
 import io
 import base64
 
+from app.core.media_cache import image_cache, cache_key
+from app.core.rate_limiter import get_limiter
+from app.core.http_pool import get_session
+from app.core.metrics import stage_timer
+
 # 尝试导入，如果不可用则跳过
 try:
     from diffusers import StableDiffusionXLPipeline, EulerAncestralDiscreteScheduler
@@ -19,9 +23,12 @@ except ImportError:
 class FreeImageGenerator:
     """免费图片生成器"""
     
+    MODEL_ID = "stabilityai/stable-diffusion-xl-base-1.0"
+    RATE_LIMIT_RETRIES = 2  # 429时按Retry-After等待后重试的次数
+    
     def __init__(self):
-        self.cache_dir = "generated_images"
-        os.makedirs(self.cache_dir, exist_ok=True)
+        self.cache = image_cache
+        self.cache_dir = image_cache.cache_dir
         self.pipe = None
         self._init_pipeline()
     
@@ -40,7 +47,7 @@ class FreeImageGenerator:
             )
             
             self.pipe = StableDiffusionXLPipeline.from_pretrained(
-                "stabilityai/stable-diffusion-xl-base-1.0",
+                self.MODEL_ID,
                 torch_dtype=torch.float16,
                 variant="fp16"
             )
@@ -62,6 +69,12 @@ class FreeImageGenerator:
         # 增强提示词
         enhanced_prompt = self._enhance_prompt(prompt)
         
+        # 命中缓存则直接返回, 不再调用模型
+        if save_to_disk:
+            cached_path = self.cache.get(self._cache_key(enhanced_prompt, size))
+            if cached_path:
+                return cached_path
+        
         if self.pipe and not DIFFUSERS_AVAILABLE:
             # 本地生成
             return await self._generate_local(enhanced_prompt, size, save_to_disk)
@@ -69,6 +82,10 @@ class FreeImageGenerator:
             # 使用Hugging Face API
             return await self._generate_via_api(enhanced_prompt, size, save_to_disk)
     
+    def _cache_key(self, enhanced_prompt: str, size: tuple) -> str:
+        """图片缓存键 (提示词 + 模型 + 尺寸)"""
+        return cache_key(enhanced_prompt, self.MODEL_ID, f"{size[0]}x{size[1]}")
+    
     def _enhance_prompt(self, prompt: str) -> str:
         """增强提示词以获得更好的图片"""
         
@@ -106,13 +123,14 @@ class FreeImageGenerator:
             )
             return result.images[0]
         
-        image = await loop.run_in_executor(None, run_inference)
+        async with get_limiter("local-sd"), stage_timer("image", "local-sd"):
+            image = await loop.run_in_executor(None, run_inference)
         
         if save_to_disk:
-            filename = f"img_{hash(prompt)}.png"
-            filepath = os.path.join(self.cache_dir, filename)
+            key = self._cache_key(prompt, size)
+            filepath = self.cache.path_for(key, ".png")
             image.save(filepath, "PNG")
-            return filepath
+            return self.cache.add(key, filepath, meta={'model': self.MODEL_ID})
         
         # 返回Base64
         buffered = io.BytesIO()
@@ -127,47 +145,62 @@ class FreeImageGenerator:
     ) -> str:
         """使用Hugging Face Inference API"""
         
-        import aiohttp
+        session = get_session("huggingface")
+        # 使用免费的FLUX模型或其他免费模型
+        # https://huggingface.co/spaces/black-forest-labs/FLUX.1-schnell
         
-        async with aiohttp.ClientSession() as session:
-            # 使用免费的FLUX模型或其他免费模型
-            # https://huggingface.co/spaces/black-forest-labs/FLUX.1-schnell
-            
-            headers = {"Authorization": f"Bearer {settings.HF_TOKEN}"}
-            
-            payload = {
-                "inputs": prompt,
-                "parameters": {
-                    "width": size[0],
-                    "height": size[1],
-                    "guidance_scale": 7.5
-                }
+        headers = {"Authorization": f"Bearer {settings.HF_TOKEN}"}
+        
+        payload = {
+            "inputs": prompt,
+            "parameters": {
+                "width": size[0],
+                "height": size[1],
+                "guidance_scale": 7.5
             }
-            
-            try:
-                async with session.post(
-                    "https://api-inference.huggingface.co/models/stabilityai/stable-diffusion-xl-base-1.0",
-                    headers=headers,
-                    json=payload
-                ) as response:
-                    if response.status == 200:
-                        image_bytes = await response.read()
-                        image = Image.open(io.BytesIO(image_bytes))
+        }
+        
+        limiter = get_limiter("huggingface")
+        
+        try:
+            for attempt in range(self.RATE_LIMIT_RETRIES + 1):
+                async with limiter, stage_timer("image", "huggingface"):
+                    async with session.post(
+                        f"https://api-inference.huggingface.co/models/{self.MODEL_ID}",
+                        headers=headers,
+                        json=payload
+                    ) as response:
+                        if response.status == 200:
+                            image_bytes = await response.read()
+                            image = Image.open(io.BytesIO(image_bytes))
+                            
+                            if save_to_disk:
+                                key = self._cache_key(prompt, size)
+                                filepath = self.cache.path_for(key, ".png")
+                                image.save(filepath, "PNG")
+                                return self.cache.add(key, filepath, meta={'model': self.MODEL_ID})
+                            
+                            return f"data:image/png;base64,{base64.b64encode(image_bytes).decode()}"
                         
-                        if save_to_disk:
-                            filename = f"img_{hash(prompt)}.png"
-                            filepath = os.path.join(self.cache_dir, filename)
-                            image.save(filepath, "PNG")
-                            return filepath
+                        if response.status == 429 and attempt < self.RATE_LIMIT_RETRIES:
+                            # 被限流: 暂停该提供商的所有请求, 然后重试
+                            limiter.pause(self._retry_after(response.headers.get("Retry-After")))
+                            continue
                         
-                        return f"data:image/png;base64,{base64.b64encode(image_bytes).decode()}"
-                    else:
                         # 如果HF API失败，使用占位图
                         return self._create_placeholder(prompt, save_to_disk)
-                        
-            except Exception as e:
-                print(f"❌ HF API错误: {e}")
-                return self._create_placeholder(prompt, save_to_disk)
+                    
+        except Exception as e:
+            print(f"❌ HF API错误: {e}")
+            return self._create_placeholder(prompt, save_to_disk)
+    
+    def _retry_after(self, header: Optional[str], default: float = 10.0) -> float:
+        """解析Retry-After头 (秒)"""
+        
+        try:
+            return max(1.0, float(header))
+        except (TypeError, ValueError):
+            return default
     
     def _create_placeholder(self, prompt: str, save_to_disk: bool) -> str:
         """创建占位图"""
@@ -175,11 +208,12 @@ class FreeImageGenerator:
         # 创建简单的占位图片
         img = Image.new('RGB', (1024, 1024), color=(73, 109, 137))
         
+        # 占位图使用独立的缓存键: 参与LRU淘汰, 但不会被当作真实图片命中
         if save_to_disk:
-            filename = f"placeholder_{hash(prompt)}.png"
-            filepath = os.path.join(self.cache_dir, filename)
+            key = cache_key("placeholder", prompt)
+            filepath = self.cache.path_for(key, ".png")
             img.save(filepath, "PNG")
-            return filepath
+            return self.cache.add(key, filepath, meta={'placeholder': True})
         
         buffered = io.BytesIO()
         img.save(buffered, format="PNG")
@@ -193,6 +227,7 @@ class FreeImageGenerator:
         """批量生成图片"""
         
         if parallel:
+            # 实际并发由各提供商的共享限流器控制
             tasks = [self.generate_image(p) for p in prompts]
             results = await asyncio.gather(*tasks)
         else:
@@ -1,128 +1,229 @@
 """免费AI写作代理 - 支持多种免费模型"""
-import json
+import re
+import time
 import asyncio
-import aiohttp
-from typing import Dict, List, Optional
+import weakref
+from typing import AsyncIterator, Dict, List
 from abc import ABC, abstractmethod
 
 from app.core.config_free import settings
+from app.core.script_cache import script_cache
+from app.core.http_pool import get_session
+from app.core.metrics import stage_timer
+from app.core.rate_limiter import get_limiter
+from app.core.provider_health import ProviderRouter, ProviderUnavailable, get_health
+from app.agents.script_parser import ScriptStream, ndjson_deltas, parse_script, sse_deltas
+
+
+# 脚本 JSON 的第一个键; 错误响应 (以 200 返回并作为第一个片段流出) 的常见键
+_FIRST_KEY = re.compile(r'\{\s*"([^"\\]*)"\s*:')
+_ERROR_KEYS = {"error", "errors", "detail"}
+
+
+def _script_started(head: str) -> bool:
+    """开头片段中已出现脚本 JSON 的第一个键; 错误响应抛出 ValueError"""
+    
+    match = _FIRST_KEY.search(head)
+    if not match:
+        return False
+    if match.group(1).lower() in _ERROR_KEYS:
+        raise ValueError(f"提供商返回错误: {head[:200]}")
+    return True
 
 
 class BaseLLM(ABC):
     """LLM基类"""
     
+    name = "llm"  # 提供商名称 (用于限流和指标)
+    
     @abstractmethod
     async def generate(self, prompt: str, max_tokens: int = 1000) -> str:
         pass
+    
+    async def stream(self, prompt: str, max_tokens: int = 1000) -> AsyncIterator[str]:
+        """流式生成 (不支持流式的提供商一次性返回全部文本)"""
+        yield await self.generate(prompt, max_tokens)
 
 
 class OllamaLLM(BaseLLM):
     """Ollama本地免费模型"""
     
+    name = "ollama"
+    
     def __init__(self, base_url: str = None, model: str = None):
         self.base_url = base_url or settings.OLLAMA_BASE_URL
         self.model = model or settings.OLLAMA_MODEL
     
     async def generate(self, prompt: str, max_tokens: int = 2000) -> str:
         """调用Ollama生成文本"""
-        async with aiohttp.ClientSession() as session:
-            payload = {
-                "model": self.model,
-                "prompt": prompt,
-                "stream": False,
-                "options": {
-                    "num_predict": max_tokens
-                }
+        session = get_session("ollama")
+        payload = {
+            "model": self.model,
+            "prompt": prompt,
+            "stream": False,
+            "options": {
+                "num_predict": max_tokens
             }
-            
-            async with session.post(
-                f"{self.base_url}/api/generate",
-                json=payload
-            ) as response:
-                result = await response.json()
-                return result.get("response", "")
+        }
+        
+        async with session.post(
+            f"{self.base_url}/api/generate",
+            json=payload
+        ) as response:
+            result = await response.json()
+            return result.get("response", "")
+    
+    async def stream(self, prompt: str, max_tokens: int = 2000) -> AsyncIterator[str]:
+        """Ollama流式生成 (NDJSON, 每行一个片段)"""
+        session = get_session("ollama")
+        payload = {
+            "model": self.model,
+            "prompt": prompt,
+            "stream": True,
+            "options": {
+                "num_predict": max_tokens
+            }
+        }
+        
+        async with session.post(
+            f"{self.base_url}/api/generate",
+            json=payload
+        ) as response:
+            response.raise_for_status()
+            async for text in ndjson_deltas(response):
+                yield text
 
 
 class HuggingFaceLLM(BaseLLM):
     """Hugging Face免费推理API"""
     
+    name = "huggingface"
+    
     def __init__(self, api_key: str = None, model: str = None):
         self.api_key = api_key or settings.HUGGINGFACE_API_KEY
         self.model = model or settings.HUGGINGFACE_MODEL
     
     async def generate(self, prompt: str, max_tokens: int = 1000) -> str:
         """调用Hugging Face API"""
-        async with aiohttp.ClientSession() as session:
-            headers = {"Authorization": f"Bearer {self.api_key}"}
-            
-            payload = {
-                "inputs": prompt,
-                "parameters": {
-                    "max_new_tokens": max_tokens,
-                    "temperature": 0.7,
-                    "do_sample": True
-                }
+        session = get_session("huggingface")
+        headers = {"Authorization": f"Bearer {self.api_key}"}
+        
+        payload = {
+            "inputs": prompt,
+            "parameters": {
+                "max_new_tokens": max_tokens,
+                "temperature": 0.7,
+                "do_sample": True
             }
+        }
+        
+        async with session.post(
+            f"https://api-inference.huggingface.co/models/{self.model}",
+            headers=headers,
+            json=payload
+        ) as response:
+            result = await response.json()
             
-            async with session.post(
-                f"https://api-inference.huggingface.co/models/{self.model}",
-                headers=headers,
-                json=payload
-            ) as response:
-                result = await response.json()
-                
-                if isinstance(result, list):
-                    return result[0].get("generated_text", "")
-                return str(result)
+            if isinstance(result, list):
+                return result[0].get("generated_text", "")
+            return str(result)
 
 
 class GroqLLM(BaseLLM):
     """Groq免费Llama模型 (速度快)"""
     
+    name = "groq"
+    
     def __init__(self, api_key: str = None, model: str = None):
         self.api_key = api_key or settings.GROQ_API_KEY
         self.model = model or settings.GROQ_MODEL
     
+    def _request(self, prompt: str, max_tokens: int, stream: bool = False) -> Dict:
+        headers = {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json"
+        }
+        
+        payload = {
+            "model": self.model,
+            "messages": [{"role": "user", "content": prompt}],
+            "max_tokens": max_tokens,
+            "temperature": 0.7,
+            "stream": stream
+        }
+        
+        return {"headers": headers, "json": payload}
+    
     async def generate(self, prompt: str, max_tokens: int = 2000) -> str:
         """调用Groq API"""
-        async with aiohttp.ClientSession() as session:
-            headers = {
-                "Authorization": f"Bearer {self.api_key}",
-                "Content-Type": "application/json"
-            }
-            
-            payload = {
-                "model": self.model,
-                "messages": [{"role": "user", "content": prompt}],
-                "max_tokens": max_tokens,
-                "temperature": 0.7
-            }
-            
-            async with session.post(
-                "https://api.groq.com/openai/v1/chat/completions",
-                headers=headers,
-                json=payload
-            ) as response:
-                result = await response.json()
-                return result["choices"][0]["message"]["content"]
+        session = get_session("groq")
+        
+        async with session.post(
+            "https://api.groq.com/openai/v1/chat/completions",
+            **self._request(prompt, max_tokens)
+        ) as response:
+            result = await response.json()
+            return result["choices"][0]["message"]["content"]
+    
+    async def stream(self, prompt: str, max_tokens: int = 2000) -> AsyncIterator[str]:
+        """Groq流式生成 (SSE)"""
+        session = get_session("groq")
+        
+        async with session.post(
+            "https://api.groq.com/openai/v1/chat/completions",
+            **self._request(prompt, max_tokens, stream=True)
+        ) as response:
+            response.raise_for_status()
+            async for text in sse_deltas(response):
+                yield text
 
 
 class GeminiLLM(BaseLLM):
     """Google Gemini免费模型"""
     
+    name = "gemini"
+    
     def __init__(self, api_key: str = None, model: str = None):
         self.api_key = api_key or settings.GEMINI_API_KEY
         self.model = model or settings.GEMINI_MODEL
+        # 异步客户端的gRPC通道绑定创建它的事件循环 (Celery每个任务一个新循环), 所以按循环缓存
+        self._clients = weakref.WeakKeyDictionary()
+        self._configured = False
     
-    async def generate(self, prompt: str, max_tokens: int = 1000) -> str:
-        """调用Gemini API"""
+    def _get_client(self):
+        """当前事件循环的模型客户端 (同一循环内复用)"""
         import google.generativeai as genai
         
-        genai.configure(api_key=self.api_key)
+        if not self._configured:
+            genai.configure(api_key=self.api_key)
+            self._configured = True
         
-        model = genai.GenerativeModel(self.model)
-        response = model.generate_content(prompt)
+        loop = asyncio.get_running_loop()
+        client = self._clients.get(loop)
+        if client is None:
+            client = genai.GenerativeModel(self.model)
+            self._clients[loop] = client
+        return client
+    
+    async def generate(self, prompt: str, max_tokens: int = 1000) -> str:
+        """调用Gemini API (异步接口, 不阻塞事件循环)"""
+        response = await self._get_client().generate_content_async(
+            prompt,
+            generation_config={"max_output_tokens": max_tokens}
+        )
         return response.text
+    
+    async def stream(self, prompt: str, max_tokens: int = 1000) -> AsyncIterator[str]:
+        """Gemini流式生成"""
+        response = await self._get_client().generate_content_async(
+            prompt,
+            generation_config={"max_output_tokens": max_tokens},
+            stream=True
+        )
+        async for chunk in response:
+            # 被安全过滤的片段没有文本
+            if chunk.parts:
+                yield chunk.text
 
 
 class FreeLLMManager:
@@ -131,6 +232,8 @@ class FreeLLMManager:
     def __init__(self):
         self.providers = {}
         self._init_providers()
+        # 按延迟和错误率排序, 失败自动切换, 可选对冲请求
+        self.router = ProviderRouter()
     
     def _init_providers(self):
         """初始化可用的提供商"""
@@ -150,29 +253,146 @@ class FreeLLMManager:
         if settings.GEMINI_API_KEY:
             self.providers["gemini"] = GeminiLLM()
     
+    def preference(self) -> List[str]:
+        """提供商优先顺序: 配置的提供商在前, 其余按注册顺序"""
+        
+        if not self.providers:
+            raise ValueError("没有可用的AI提供商！请配置至少一个免费模型。")
+        
+        names = list(self.providers)
+        if settings.AI_PROVIDER in self.providers:
+            names.remove(settings.AI_PROVIDER)
+            names.insert(0, settings.AI_PROVIDER)
+        return names
+    
     def get_best_provider(self) -> BaseLLM:
-        """获取最佳可用的提供商"""
-        provider = settings.AI_PROVIDER
+        """获取当前最健康的提供商 (全部熔断时返回首选提供商)"""
         
-        if provider in self.providers:
-            return self.providers[provider]
+        preference = self.preference()
+        ranked = self.router.ranked(preference)
         
-        # 回退到第一个可用的
-        for name, llm in self.providers.items():
+        name = ranked[0] if ranked else preference[0]
+        if name != settings.AI_PROVIDER:
             print(f"⚠️ 使用回退提供商: {name}")
-            return llm
-        
-        raise ValueError("没有可用的AI提供商！请配置至少一个免费模型。")
+        return self.providers[name]
+    
+    def health(self) -> List[Dict]:
+        """各提供商的健康状态 (延迟、错误率、熔断状态)"""
+        return [get_health(llm.name).stats() for llm in self.providers.values()]
     
     async def generate_script(
         self,
         topic: str,
         duration_minutes: int = 5,
-        language: str = "zh"
+        language: str = "zh",
+        use_cache: bool = True
+    ) -> Dict:
+        """生成视频脚本 (相同请求复用缓存, 并发的相同请求只调用一次模型)"""
+        
+        async def _generate():
+            # 失败 (包括无法解析的输出) 时切换到下一个提供商
+            return await self.router.call(
+                self.preference(),
+                lambda name: self._generate_script(self.providers[name], topic, duration_minutes, language)
+            )
+        
+        if not use_cache:
+            return await _generate()
+        
+        key = self._script_key(topic, duration_minutes, language)
+        return await script_cache.get_or_create(key, _generate)
+    
+    async def stream_script(
+        self,
+        topic: str,
+        duration_minutes: int = 5,
+        language: str = "zh",
+        use_cache: bool = True
+    ) -> ScriptStream:
+        """流式生成视频脚本, 每个场景一完成就交给调用方 (缓存命中时立即交付全部场景)"""
+        
+        key = self._script_key(topic, duration_minutes, language)
+        prompt = self._script_prompt(topic, duration_minutes, language)
+        
+        # 与 generate_script 共用 single-flight: 缓存命中立即交付, 相同的进行中请求则等待其结果
+        return ScriptStream(
+            self._stream_deltas(prompt, max_tokens=3000),
+            flight=script_cache.flight(key) if use_cache else None
+        )
+    
+    def _script_key(self, topic: str, duration_minutes: int, language: str) -> str:
+        """脚本缓存键: 按配置的提供商顺序和模型, 而不是实时健康排名 (否则熔断或切换会使缓存失效)"""
+        
+        providers = [
+            f"{name}:{getattr(self.providers[name], 'model', '')}" for name in self.preference()
+        ]
+        return script_cache.key(topic, duration_minutes, language, *providers)
+    
+    async def _stream_deltas(self, prompt: str, max_tokens: int) -> AsyncIterator[str]:
+        """按健康顺序流式生成; 在确认响应是脚本 JSON 之前失败则切换提供商"""
+        
+        preference = self.preference()
+        last_error = None
+        
+        for name in self.router.ranked(preference):
+            health = get_health(name)
+            if not health.acquire():
+                continue
+            
+            llm = self.providers[name]
+            started = time.monotonic()
+            received = False
+            head = ""
+            try:
+                # 流式期间一直占用该提供商的并发名额
+                async with get_limiter(llm.name), stage_timer("script", llm.name):
+                    async for text in llm.stream(prompt, max_tokens=max_tokens):
+                        if not received:
+                            # 开头先缓存到出现第一个键 (在此之前没有可解析的场景, 不增加延迟),
+                            # 错误内容或非 JSON 响应因此仍可切换提供商
+                            head += text
+                            if not _script_started(head):
+                                continue
+                            received, text = True, head
+                        yield text
+                    if not received:
+                        raise ValueError(f"响应不是脚本 JSON: {head[:200]}")
+            except (asyncio.CancelledError, GeneratorExit):
+                health.release()
+                raise
+            except Exception as e:
+                health.record_failure(time.monotonic() - started)
+                # 已交付的片段无法撤回
+                if received:
+                    raise
+                print(f"⚠️ 提供商 {name} 失败, 切换: {str(e)}")
+                last_error = e
+                continue
+            
+            health.record_success(time.monotonic() - started)
+            return
+        
+        raise last_error or ProviderUnavailable(f"所有提供商暂时不可用: {', '.join(preference)}")
+    
+    async def _generate_script(
+        self,
+        llm: BaseLLM,
+        topic: str,
+        duration_minutes: int,
+        language: str
     ) -> Dict:
-        """生成视频脚本"""
+        """调用模型生成脚本"""
+        
+        prompt = self._script_prompt(topic, duration_minutes, language)
         
-        llm = self.get_best_provider()
+        async with get_limiter(llm.name), stage_timer("script", llm.name):
+            response = await llm.generate(prompt, max_tokens=3000)
+        
+        # 清理和解析JSON
+        return parse_script(response)
+    
+    def _script_prompt(self, topic: str, duration_minutes: int, language: str) -> str:
+        """脚本提示词"""
         
         # 根据语言生成提示
         lang_name = "中文" if language == "zh" else "English"
@@ -201,22 +421,11 @@ class FreeLLMManager:
 
 只输出JSON，不要有其他内容。"""
         
-        response = await llm.generate(prompt, max_tokens=3000)
-        
-        # 清理和解析JSON
-        response = response.strip()
-        if "```json" in response:
-            response = response.split("```json")[1].split("```")[0]
-        elif "```" in response:
-            response = response.split("```")[1].split("```")[0]
-        
-        return json.loads(response)
+        return prompt
     
     async def generate_ideas(self, niche: str, count: int = 10) -> List[str]:
         """生成内容创意"""
         
-        llm = self.get_best_provider()
-        
         prompt = f"""为以下领域生成{count}个视频内容创意：
 
 领域: {niche}
@@ -228,7 +437,11 @@ class FreeLLMManager:
 
 只输出创意列表，每行一个。"""
         
-        response = await llm.generate(prompt, max_tokens=1000)
+        async def _generate(name: str) -> str:
+            async with get_limiter(name):
+                return await self.providers[name].generate(prompt, max_tokens=1000)
+        
+        response = await self.router.call(self.preference(), _generate)
         
         ideas = [line.strip() for line in response.split('\n') if line.strip()]
         return ideas[:count]
@@ -8,7 +8,11 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from app.agents.free_llm import llm_manager
 from app.agents.free_image_generator import image_generator
 from app.agents.free_voice_generator import voice_generator
+from app.agents.scene_pipeline import SceneMediaPipeline
+from app.core.http_pool import get_session
+from app.core.workspace import render_workspace
 from app.services.project_service import ProjectService
+from app.services.progress_writer import ProgressWriter
 from app.core.config_free import settings
 
 
@@ -18,6 +22,7 @@ class FreeOrchestratorAgent:
     def __init__(self, db: AsyncSession):
         self.db = db
         self.project_service = ProjectService(db)
+        self.media_pipeline = SceneMediaPipeline()
     
     async def execute_pipeline(
         self,
@@ -33,77 +38,59 @@ class FreeOrchestratorAgent:
         
         start_time = datetime.utcnow()
         
+        # 相近的进度更新合并为一次写入
+        progress = ProgressWriter(self.project_service, project_id)
+        
         try:
             # 1. 更新项目状态
-            await self.project_service.update_status(project_id, "generating", 5)
+            await progress.set("generating", 5)
             print(f"🎬 开始处理: {topic}")
             
-            # 2. 生成脚本 (使用免费LLM)
-            await self.project_service.update_status(project_id, "generating", 10)
+            # 2. 生成脚本 (使用免费LLM, 流式输出)
+            await progress.set("generating", 10)
             
-            script_data = await llm_manager.generate_script(
+            script_stream = await llm_manager.stream_script(
                 topic=topic,
                 duration_minutes=duration_minutes,
                 language=language
             )
             
-            await self.project_service.update_script_data(project_id, script_data)
-            await self.project_service.update_project(
-                project_id,
-                title=script_data.get('title'),
-                description=script_data.get('description')
-            )
-            
-            await self.project_service.update_status(project_id, "generating", 25)
-            print(f"✅ 脚本生成完成: {script_data['title']}")
-            
             # 3. 生成图片和语音 (并行)
-            await self.project_service.update_status(project_id, "processing", 30)
+            # 每个场景的文字一完成就开始生成它的图片和语音, 不等模型写完整个脚本
+            print("🎨🎵 边生成脚本边生成场景的图片和语音...")
+            scene_media = await self._generate_scene_media(
+                self._streamed_scenes(script_stream, progress), language
+            )
             
+            script_data = script_stream.script
             scenes = script_data.get('scenes', [])
             
-            # 提取图片提示词
-            image_prompts = [
-                s.get('visual_prompt', s.get('text', '')) 
-                for s in scenes 
-                if s.get('visual_prompt') or s.get('text')
-            ]
+            images = [m['image_path'] for m in scene_media if m['image_path']]
+            audio_files = [m for m in scene_media if m['audio_path']]
             
-            # 生成图片 (免费)
-            print(f"🎨 正在生成 {len(image_prompts)} 张图片...")
-            images = await image_generator.generate_batch(image_prompts)
-            
-            # 生成语音 (免费)
-            print(f"🎵 正在生成语音...")
-            audio_files = await voice_generator.generate_scene_voices(scenes, language)
-            
-            await self.project_service.update_status(project_id, "processing", 60)
+            await progress.set("processing", 60)
             print(f"✅ 生成了 {len(images)} 张图片和 {len(audio_files)} 段语音")
             
             # 4. 视频编辑
-            await self.project_service.update_status(project_id, "editing", 70)
+            await progress.set("editing", 70)
             print(f("✂️ 正在合成视频..."))
             
             # 注意: 视频编辑需要FFmpeg完整安装
             video_path = await self._assemble_video(images, audio_files, scenes)
             
-            await self.project_service.update_video_path(project_id, video_path)
-            await self.project_service.update_status(project_id, "editing", 85)
+            await progress.set("editing", 85, video_path=video_path)
             print(f"✅ 视频合成完成: {video_path}")
             
             # 5. 发布 (可选)
             if auto_publish:
-                await self.project_service.update_status(project_id, "uploading", 90)
+                await progress.set("uploading", 90)
                 # YouTube上传逻辑
-                await self.project_service.update_status(project_id, "completed", 100)
-            else:
-                await self.project_service.update_status(project_id, "completed", 100)
             
             # 计算处理时间
             end_time = datetime.utcnow()
             processing_time = (end_time - start_time).total_seconds()
             
-            await self.project_service.update_processing_time(project_id, processing_time)
+            await progress.set("completed", 100, processing_time_seconds=int(processing_time))
             
             return {
                 "success": True,
@@ -115,14 +102,48 @@ class FreeOrchestratorAgent:
             
         except Exception as e:
             print(f"❌ 错误: {str(e)}")
-            await self.project_service.update_status(project_id, "failed", 0)
-            await self.project_service.update_error(project_id, str(e))
+            if not await progress.fail(str(e)):
+                # 项目已被用户取消, 不作为失败重试
+                return {"success": False, "cancelled": True, "error": str(e)}
             
             return {
                 "success": False,
                 "error": str(e)
             }
     
+    async def _streamed_scenes(self, script_stream, progress: ProgressWriter):
+        """按顺序交付流式脚本的场景, 脚本完成后保存脚本数据"""
+        
+        async for scene in script_stream:
+            yield scene
+        
+        script_data = script_stream.script
+        await progress.set(
+            "processing", 30,
+            script_data=script_data,
+            title=script_data.get('title'),
+            description=script_data.get('description')
+        )
+        print(f"✅ 脚本生成完成: {script_data['title']}")
+    
+    async def _generate_scene_media(
+        self,
+        scenes: list,
+        language: str
+    ) -> list:
+        """并行生成所有场景的图片和语音, 按场景汇总"""
+        
+        async def _image(index, scene):
+            prompt = scene.get('visual_prompt') or scene.get('text')
+            if not prompt:
+                return None
+            return await image_generator.generate_image(prompt)
+        
+        async def _voice(index, scene):
+            return await voice_generator.generate_scene_voice(scene, index, language)
+        
+        return await self.media_pipeline.run(scenes, _image, _voice)
+    
     async def _assemble_video(
         self,
         images: list,
@@ -139,48 +160,44 @@ class FreeOrchestratorAgent:
         
         # 检查是否有FFmpeg
         try:
-            import subprocess
-            
-            # 创建文件列表
-            with open("input_list.txt", "w") as f:
-                for img in images:
-                    duration = 5  # 默认5秒
-                    f.write(f"file '{img}'\n")
-                    f.write(f"duration {duration}\n")
-                # 重复最后一张
-                f.write(f"file '{images[-1]}'\n")
-            
-            # 如果有音频，合并音频
-            if audio_files:
-                with open("audio_list.txt", "w") as f:
-                    for audio in audio_files:
-                        f.write(f"file '{audio['audio_path']}'\n")
-                
-                # 使用FFmpeg合并
-                cmd = [
-                    "ffmpeg", "-y",
-                    "-f", "concat", "-safe", "0",
-                    "-i", "input_list.txt",
-                    "-f", "concat", "-safe", "0",
-                    "-i", "audio_list.txt",
-                    "-c:v", "libx264",
-                    "-c:a", "aac",
-                    output_path
-                ]
+            # 每次合成使用独立的工作目录 (并发任务互不覆盖, 退出时自动清理)
+            with render_workspace("free_assemble") as workspace:
+                input_list = os.path.join(workspace, "input_list.txt")
+                audio_list = os.path.join(workspace, "audio_list.txt")
                 
-                process = await asyncio.create_subprocess_exec(
-                    *cmd,
-                    stdout=asyncio.subprocess.PIPE,
-                    stderr=asyncio.subprocess.PIPE
-                )
-                await process.communicate()
+                # 创建文件列表 (工作目录在别处, 因此使用绝对路径)
+                with open(input_list, "w") as f:
+                    for img in images:
+                        duration = 5  # 默认5秒
+                        f.write(f"file '{os.path.abspath(img)}'\n")
+                        f.write(f"duration {duration}\n")
+                    # 重复最后一张
+                    f.write(f"file '{os.path.abspath(images[-1])}'\n")
                 
-                # 清理临时文件
-                for f in ["input_list.txt", "audio_list.txt"]:
-                    try:
-                        os.remove(f)
-                    except:
-                        pass
+                # 如果有音频，合并音频
+                if audio_files:
+                    with open(audio_list, "w") as f:
+                        for audio in audio_files:
+                            f.write(f"file '{os.path.abspath(audio['audio_path'])}'\n")
+                    
+                    # 使用FFmpeg合并
+                    cmd = [
+                        "ffmpeg", "-y",
+                        "-f", "concat", "-safe", "0",
+                        "-i", input_list,
+                        "-f", "concat", "-safe", "0",
+                        "-i", audio_list,
+                        "-c:v", "libx264",
+                        "-c:a", "aac",
+                        output_path
+                    ]
+                    
+                    process = await asyncio.create_subprocess_exec(
+                        *cmd,
+                        stdout=asyncio.subprocess.PIPE,
+                        stderr=asyncio.subprocess.PIPE
+                    )
+                    await process.communicate()
             
             return output_path
             
@@ -227,16 +244,15 @@ class FreeOrchestratorAgent:
         
         # 检查Ollama
         try:
-            import aiohttp
-            async with aiohttp.ClientSession() as session:
-                async with session.get(f"{settings.OLLAMA_BASE_URL}/api/tags") as resp:
-                    if resp.status == 200:
-                        providers.append({
-                            "name": "Ollama (本地)",
-                            "status": "available",
-                            "model": settings.OLLAMA_MODEL,
-                            "cost": "免费"
-                        })
+            session = get_session("ollama")
+            async with session.get(f"{settings.OLLAMA_BASE_URL}/api/tags") as resp:
+                if resp.status == 200:
+                    providers.append({
+                        "name": "Ollama (本地)",
+                        "status": "available",
+                        "model": settings.OLLAMA_MODEL,
+                        "cost": "免费"
+                    })
         except:
             pass
         
@@ -267,7 +283,8 @@ class FreeOrchestratorAgent:
         
         return {
             "current_provider": settings.AI_PROVIDER,
-            "available_providers": providers
+            "available_providers": providers,
+            "health": llm_manager.health()
         }
 
 
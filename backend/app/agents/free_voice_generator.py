@@ -1,19 +1,23 @@
 """免费语音合成 - 使用Edge TTS (完全免费)"""
 import os
 import asyncio
+import shutil
 import aiohttp
 from typing import Optional
 from pathlib import Path
 
 from app.core.config_free import settings
+from app.core.media_cache import audio_cache, cache_key
+from app.core.rate_limiter import get_limiter
+from app.core.metrics import stage_timer
 
 
 class FreeVoiceGenerator:
     """免费语音生成器 - 使用Microsoft Edge TTS"""
     
     def __init__(self):
-        self.cache_dir = "generated_audio"
-        os.makedirs(self.cache_dir, exist_ok=True)
+        self.cache = audio_cache
+        self.cache_dir = audio_cache.cache_dir
         
         # Edge TTS语音列表
         self.voices = {
@@ -48,18 +52,40 @@ class FreeVoiceGenerator:
         if not voice:
             voice = "zh-CN-XiaoxiaoNeural"  # 默认中文语音
         
-        # 构建Edge TTS API URL
-        # Edge TTS使用WebSocket API
-        audio_path = output_path or f"voice_{hash(text)}.mp3"
+        # 相同文本/语音/语速/音量直接复用缓存
+        key = cache_key(text, "edge-tts", voice, rate, volume)
+        
+        cached_path = self.cache.get(key)
+        if cached_path:
+            return self._deliver(cached_path, output_path)
         
         # 使用edge-tts库（如果可用）或直接调用API
         try:
             import edge_tts
-            return await self._generate_with_edge_tts(
-                text, voice, audio_path, rate, volume
-            )
         except ImportError:
+            # 占位符不登记到缓存
+            audio_path = output_path or os.path.join(self.cache_dir, f"placeholder_{key[:16]}.mp3")
             return await self._generate_with_http(text, voice, audio_path, rate, volume)
+        
+        partial_path = self.cache.partial_path(key, ".mp3")
+        await self._generate_with_edge_tts(text, voice, partial_path, rate, volume)
+        
+        audio_path = await self.cache.put_file(
+            key, partial_path, ".mp3",
+            meta={'provider': 'edge-tts', 'voice': voice, 'rate': rate, 'volume': volume},
+            probe=True
+        )
+        
+        return self._deliver(audio_path, output_path)
+    
+    def _deliver(self, cached_path: str, output_path: str = None) -> str:
+        """如指定了输出路径则从缓存复制"""
+        
+        if not output_path:
+            return cached_path
+        
+        shutil.copyfile(cached_path, output_path)
+        return output_path
     
     async def _generate_with_edge_tts(
         self,
@@ -74,7 +100,8 @@ class FreeVoiceGenerator:
         import edge_tts
         
         communicate = edge_tts.Communicate(text, voice, rate=rate, volume=volume)
-        await communicate.save(output_path)
+        async with get_limiter("edge-tts"), stage_timer("tts", "edge-tts"):
+            await communicate.save(output_path)
         
         return output_path
     
@@ -108,30 +135,50 @@ class FreeVoiceGenerator:
         Path(output_path).touch()
         return output_path
     
+    async def generate_scene_voice(
+        self,
+        scene: dict,
+        index: int,
+        language: str = "zh"
+    ) -> Optional[dict]:
+        """为单个场景生成语音"""
+        
+        text = scene.get('text', '')
+        if not text:
+            return None
+        
+        audio_path = await self.generate_voice(
+            text=text,
+            language=language
+        )
+        
+        # 优先使用缓存中实测的时长
+        entry = self.cache.entry_for_path(audio_path)
+        duration = (entry or {}).get('meta', {}).get('duration') or self._estimate_duration(text)
+        
+        return {
+            'scene_number': scene.get('scene_number', index),
+            'audio_path': audio_path,
+            'duration': duration
+        }
+    
     async def generate_scene_voices(
         self,
         scenes: list,
-        language: str = "zh"
+        language: str = "zh",
+        max_concurrency: int = 1
     ) -> list:
         """为每个场景生成语音"""
         
-        audio_files = []
-        
-        for i, scene in enumerate(scenes):
-            text = scene.get('text', '')
-            if text:
-                audio_path = await self.generate_voice(
-                    text=text,
-                    language=language,
-                    output_path=f"scene_{i+1}_voice.mp3"
-                )
-                audio_files.append({
-                    'scene_number': scene.get('scene_number', i+1),
-                    'audio_path': audio_path,
-                    'duration': self._estimate_duration(text)
-                })
-        
-        return audio_files
+        semaphore = asyncio.Semaphore(max_concurrency)
+        
+        async def _generate(i, scene):
+            async with semaphore:
+                return await self.generate_scene_voice(scene, i + 1, language)
+        
+        results = await asyncio.gather(*[_generate(i, s) for i, s in enumerate(scenes)])
+        
+        return [r for r in results if r]
     
     def _estimate_duration(self, text: str, wpm: int = 150) -> float:
         """估算语音时长"""
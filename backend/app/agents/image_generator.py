@@ -1,9 +1,11 @@
 """وكيل توليد الصور"""
-import base64
-import os
-from typing import List, Optional
+from typing import List
 from openai import AsyncOpenAI
-from .core.config import settings
+from app.core.config import settings
+from app.core.media_cache import image_cache, cache_key
+from app.core.rate_limiter import get_limiter
+from app.core.http_pool import get_httpx_client
+from app.core.metrics import stage_timer
 
 
 class ImageGeneratorAgent:
@@ -11,8 +13,8 @@ class ImageGeneratorAgent:
     
     def __init__(self, client: AsyncOpenAI = None):
         self.client = client or AsyncOpenAI(api_key=settings.OPENAI_API_KEY)
-        self.cache_dir = "generated_images"
-        os.makedirs(self.cache_dir, exist_ok=True)
+        self.cache = image_cache
+        self.cache_dir = image_cache.cache_dir
     
     async def generate_image(
         self,
@@ -25,19 +27,29 @@ class ImageGeneratorAgent:
         
         size = size or settings.DALL_E_SIZE
         quality = quality or settings.DALL_E_QUALITY
+        enhanced_prompt = self._enhance_prompt(prompt)
         
-        response = await self.client.images.generate(
-            model=settings.DALL_E_MODEL,
-            prompt=self._enhance_prompt(prompt),
-            size=size,
-            quality=quality,
-            n=1
-        )
+        key = cache_key(enhanced_prompt, settings.DALL_E_MODEL, size, quality)
+        
+        if save_to_disk:
+            cached_path = self.cache.get(key)
+            if cached_path:
+                return cached_path
+        
+        # الحد المشترك لـ DALL-E على مستوى العملية (كل المشاريع)
+        async with get_limiter("dall-e"), stage_timer("image", "dall-e"):
+            response = await self.client.images.generate(
+                model=settings.DALL_E_MODEL,
+                prompt=enhanced_prompt,
+                size=size,
+                quality=quality,
+                n=1
+            )
         
         image_url = response.data[0].url
         
         if save_to_disk:
-            image_path = await self._download_and_save(image_url, prompt)
+            image_path = await self._download_and_save(image_url, key, prompt)
             return image_path
         
         return image_url
@@ -50,7 +62,7 @@ class ImageGeneratorAgent:
         """توليد مجموعة صور"""
         
         if parallel:
-            # توليد متوازي
+            # توليد متوازي (التزامن الفعلي يضبطه محدِّد المزوّد)
             import asyncio
             tasks = [self.generate_image(p) for p in prompts]
             results = await asyncio.gather(*tasks)
@@ -87,28 +99,21 @@ class ImageGeneratorAgent:
     async def _download_and_save(
         self,
         image_url: str,
+        key: str,
         prompt: str
     ) -> str:
-        """تحميل الصورة وحفظها"""
-        
-        import httpx
-        from pathlib import Path
-        
-        # إنشاء اسم الملف
-        safe_name = "".join(c for c in prompt[:50] if c.isalnum() or c in (' ', '-', '_')).strip()
-        safe_name = safe_name.replace(' ', '_')
-        filename = f"{safe_name}_{hash(prompt)}.png"
-        filepath = Path(self.cache_dir) / filename
-        
-        # تحميل الصورة
-        async with httpx.AsyncClient() as client:
-            response = await client.get(image_url)
-            response.raise_for_status()
-            
-            with open(filepath, 'wb') as f:
-                f.write(response.content)
-        
-        return str(filepath)
+        """تحميل الصورة وحفظها في ذاكرة الصور"""
+        
+        # تحميل الصورة عبر عميل HTTP المشترك (keep-alive)
+        response = await get_httpx_client("dall-e").get(image_url)
+        response.raise_for_status()
+        
+        return self.cache.put_bytes(
+            key,
+            response.content,
+            ".png",
+            meta={'prompt': prompt[:200], 'model': settings.DALL_E_MODEL}
+        )
     
     async def generate_variations(
         self,
@@ -1,17 +1,22 @@
 """ال Orchestrator - المنسق الرئيسي"""
 import asyncio
-import json
+import os
 from datetime import datetime
 from typing import Dict, Optional
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from .agents.script_writer import ScriptWriterAgent
-from .agents.image_generator import ImageGeneratorAgent
-from .agents.voice_generator import VoiceGeneratorAgent
-from .agents.video_editor import VideoEditorAgent
-from .services.youtube_service import YouTubeService
-from .services.project_service import ProjectService
-from .core.config import settings
+from app.agents.script_writer import ScriptWriterAgent
+from app.agents.image_generator import ImageGeneratorAgent
+from app.agents.voice_generator import VoiceGeneratorAgent
+from app.agents.video_editor import RenderCancelled, RenderMonitor, VideoEditorAgent
+from app.agents.scene_pipeline import SceneMediaPipeline
+from app.agents.script_parser import number_scenes
+from app.services.youtube_service import YouTubeService
+from app.services.project_service import ProjectService
+from app.services.progress_writer import ProgressWriter
+from app.core.config import settings
+from app.core.metrics import StageTrace, metrics, stage_timer
+from app.core.media_cache import cache_key
 
 
 class OrchestratorAgent:
@@ -23,8 +28,11 @@ class OrchestratorAgent:
         self.image_generator = ImageGeneratorAgent()
         self.voice_generator = VoiceGeneratorAgent()
         self.video_editor = VideoEditorAgent()
+        self.media_pipeline = SceneMediaPipeline()
         self.youtube_service = YouTubeService()
         self.project_service = ProjectService(db)
+        # جلسة قاعدة البيانات لا تقبل عمليات متزامنة من مهام المشاهد
+        self._db_lock = asyncio.Lock()
     
     async def execute_pipeline(
         self,
@@ -34,97 +42,168 @@ class OrchestratorAgent:
         style: str = "documentary",
         duration_minutes: int = 5,
         language: str = "ar",
-        auto_publish: bool = False
+        auto_publish: bool = False,
+        streaming: bool = None,
+        resume: bool = False,
+        render_profile: str = None,
+        renditions: list = None
     ) -> Dict:
-        """تنفيذ خط الإنتاج الكامل"""
+        """تنفيذ خط الإنتاج الكامل (مع الاستئناف من أول مخرَج ناقص عند resume)"""
         
         start_time = datetime.utcnow()
+        streaming = settings.STREAMING_PIPELINE if streaming is None else streaming
+        
+        # ملف الترميز للمشروع (draft / standard / final) والنسخ الإضافية (None = الإعدادات)
+        self.video_editor = self.video_editor.with_profile(render_profile, renditions)
+        video_filename = f"project_{project_id}_{self.video_editor.profile['name']}.mp4"
+        
+        # أزمنة المراحل تُجمع من جميع مهام هذا التشغيل
+        stage_trace = StageTrace().start()
+        status = "error"
+        
+        # تحديثات التقدّم المتقاربة تُدمج في كتابة واحدة
+        progress = ProgressWriter(self.project_service, project_id, lock=self._db_lock)
         
         try:
             # 1. تحديث حالة المشروع
-            await self.project_service.update_status(project_id, "generating", 5)
+            await progress.set("generating", 5)
+            
+            # استرجاع مخرجات التشغيل السابق
+            checkpoint = await self._load_checkpoint(project_id) if resume else None
             
             # 2. توليد السكريبت
             print(f"🎬 بدء العمل على: {topic}")
-            await self.project_service.update_status(project_id, "generating", 10)
-            
-            script_data = await self.script_writer.generate_script(
-                topic=topic,
-                duration_minutes=duration_minutes,
-                style=style,
-                language=language
-            )
-            
-            # حفظ بيانات السكريبت
-            await self.project_service.update_script_data(project_id, script_data)
-            await self.project_service.update_project(
-                project_id,
-                title=script_data.get('title'),
-                description=script_data.get('description')
-            )
+            await progress.set("generating", 10)
             
-            await self.project_service.update_status(project_id, "generating", 25)
-            print(f"✅ تم توليد السكريبت: {script_data['title']}")
+            script_stream = None
+            if checkpoint:
+                script_data = checkpoint['script_data']
+                # مسح رسالة الخطأ السابقة من بيانات السكريبت
+                await progress.set("generating", 25, script_data=script_data)
+                print(f"♻️ استئناف من السكريبت المحفوظ: {script_data.get('title')}")
+            elif settings.STREAM_SCRIPT:
+                # المشاهد تُسلَّم لخط الوسائط أثناء كتابة النموذج لبقية السكريبت
+                script_stream = await self.script_writer.stream_script(
+                    topic=topic,
+                    duration_minutes=duration_minutes,
+                    style=style,
+                    language=language
+                )
+            else:
+                script_data = await self.script_writer.generate_script(
+                    topic=topic,
+                    duration_minutes=duration_minutes,
+                    style=style,
+                    language=language
+                )
+                
+                script_data['scenes'] = number_scenes(script_data.get('scenes', []))
+                
+                # حفظ بيانات السكريبت
+                await progress.set(
+                    "generating", 25,
+                    script_data=script_data,
+                    title=script_data.get('title'),
+                    description=script_data.get('description')
+                )
+                await self.project_service.save_script_scenes(
+                    project_id, script_data.get('scenes', [])
+                )
+                print(f"✅ تم توليد السكريبت: {script_data['title']}")
             
             # 3. توليد الصور والأصوات بالتوازي
-            await self.project_service.update_status(project_id, "processing", 30)
-            
-            scenes = script_data.get('scenes', [])
-            image_prompts = [s['visual_prompt'] for s in scenes if 'visual_prompt' in s]
+            if script_stream:
+                # التقدّم 30% يُكتب مع السكريبت عند اكتمال بثه
+                scenes = self._streamed_scenes(project_id, script_stream, progress)
+            else:
+                await progress.set("processing", 30)
+                scenes = script_data.get('scenes', [])
             
-            # توليد الصور
-            images = await self.image_generator.generate_batch(image_prompts)
+            # في وضع البث يُرمَّز كل مشهد فور جاهزية صورته وصوته
+            on_scene_ready = self._segment_encoder(project_id, checkpoint) if streaming else None
+            scene_media = await self._generate_scene_media(
+                project_id, scenes, language, checkpoint, on_scene_ready
+            )
             
-            # توليد الأصوات
-            audio_files = await self.voice_generator.generate_scene_voices(scenes, language)
+            if script_stream:
+                script_data = script_stream.script
             
-            # ربط الصور بالأصوات
-            await self._link_media_to_scenes(project_id, scenes, images, audio_files)
+            images = [m['image_path'] for m in scene_media if m['image_path']]
+            audio_files = [m for m in scene_media if m['audio_path']]
             
-            await self.project_service.update_status(project_id, "processing", 60)
+            await progress.set("processing", 60)
             print(f"✅ تم توليد {len(images)} صورة و {len(audio_files)} مقطع صوتي")
             
             # 4. المونتاج
-            await self.project_service.update_status(project_id, "editing", 70)
+            await progress.set("editing", 70)
+            if progress.cancelled:
+                raise RenderCancelled("تم إلغاء المشروع قبل المونتاج")
             
-            video_path = await self.video_editor.assemble_video(
-                images=images,
-                audio_files=[a['audio_path'] for a in audio_files],
-                subtitles=scenes
-            )
+            # تقدّم الترميز الفعلي يُعرض ضمن 70-85% مع إمكانية الإلغاء
+            monitor = self._render_monitor(project_id, progress, scene_media)
             
-            await self.project_service.update_video_path(project_id, video_path)
-            await self.project_service.update_status(project_id, "editing", 85)
+            if (
+                checkpoint
+                and os.path.basename(checkpoint['video_path']) == video_filename
+                and self._outputs_exist(checkpoint['video_path'])
+            ):
+                video_path = checkpoint['video_path']
+                print("♻️ استئناف: الفيديو مُركَّب مسبقاً")
+            elif streaming:
+                # المقاطع جاهزة مسبقاً، يتبقى دمجها فقط
+                video_path = await self._join_segments(project_id, scene_media, video_filename, monitor)
+            else:
+                # قوائم متوازية لكل مشهد له صورة، والمقاطع تُحفظ لإعادة استخدامها عند تعديل مشهد
+                rendered = [m for m in scene_media if m['image_path']]
+                video_path = await self.video_editor.assemble_video(
+                    images=[m['image_path'] for m in rendered],
+                    audio_files=[m['audio_path'] for m in rendered],
+                    output_filename=video_filename,
+                    subtitles=[{'text': m['text']} for m in rendered],
+                    durations=[m['duration'] for m in rendered],
+                    monitor=monitor,
+                    segment_dir=self.video_editor.segment_dir(project_id),
+                    scene_numbers=[m['scene_number'] for m in rendered]
+                )
+            
+            await progress.set(
+                "editing", 85,
+                video_path=video_path,
+                renditions=self.video_editor.rendition_outputs(video_path),
+                **self._preview_fields(video_path)
+            )
             print(f"✅ تم تركيب الفيديو: {video_path}")
             
             # 5. النشر (اختياري)
+            completed_fields = {}
             if auto_publish:
-                await self.project_service.update_status(project_id, "uploading", 90)
+                await progress.set("uploading", 90)
                 
-                youtube_result = await self.youtube_service.upload_video(
-                    video_path=video_path,
-                    title=script_data['title'],
-                    description=script_data['description'],
-                    tags=script_data.get('tags', []),
-                    channel_id=user_id
-                )
-                
-                await self.project_service.update_youtube_info(
-                    project_id,
-                    youtube_result['video_id'],
-                    youtube_result['url']
-                )
+                async with stage_timer("upload", "youtube"):
+                    youtube_result = await self.youtube_service.upload_video(
+                        video_path=video_path,
+                        title=script_data['title'],
+                        description=script_data['description'],
+                        tags=script_data.get('tags', []),
+                        channel_id=user_id
+                    )
                 
-                await self.project_service.update_status(project_id, "completed", 100)
+                completed_fields = {
+                    'youtube_video_id': youtube_result['video_id'],
+                    'video_url': youtube_result['url']
+                }
                 print(f"✅ تم النشر على يوتيوب: {youtube_result['url']}")
-            else:
-                await self.project_service.update_status(project_id, "completed", 100)
             
             # حساب الوقت والتكلفة
             end_time = datetime.utcnow()
             processing_time = (end_time - start_time).total_seconds()
             
-            await self.project_service.update_processing_time(project_id, processing_time)
+            await progress.set(
+                "completed", 100,
+                processing_time_seconds=int(processing_time),
+                **completed_fields
+            )
+            status = "ok"
             
             return {
                 "success": True,
@@ -133,42 +212,341 @@ class OrchestratorAgent:
                 "processing_time_seconds": processing_time
             }
             
+        except RenderCancelled as e:
+            # الحالة "cancelled" كتبتها الواجهة، فلا تُستبدل بـ failed
+            print(f"⏹️ تم إلغاء المشروع {project_id}: {str(e)}")
+            status = "cancelled"
+            
+            return {
+                "success": False,
+                "cancelled": True,
+                "error": str(e)
+            }
+        
         except Exception as e:
             print(f"❌ خطأ في خط الإنتاج: {str(e)}")
-            await self.project_service.update_status(project_id, "failed", 0)
-            await self.project_service.update_error(project_id, str(e))
+            if not await progress.fail(str(e)):
+                # أُلغي المشروع أثناء التنفيذ فلا يُعامَل كفشل يُعاد
+                status = "cancelled"
+                return {"success": False, "cancelled": True, "error": str(e)}
             
             return {
                 "success": False,
                 "error": str(e)
             }
+        
+        finally:
+            metrics.observe_stage(
+                "pipeline", "orchestrator",
+                (datetime.utcnow() - start_time).total_seconds(), status
+            )
+            await self._save_stage_timings(user_id, project_id, stage_trace.stop())
     
-    async def _link_media_to_scenes(
+    async def rerender_scene(
         self,
         project_id: int,
-        scenes: list,
-        images: list,
-        audio_files: list
-    ):
-        """ربط الوسائط بالمشاهد"""
-        
-        for i, scene in enumerate(scenes):
-            scene_data = {
-                'image_path': images[i] if i < len(images) else None,
-                'audio_path': audio_files[i]['audio_path'] if i < len(audio_files) else None,
-                'audio_duration': audio_files[i].get('duration', 5) if i < len(audio_files) else 5
+        user_id: int,
+        scene_number: int,
+        language: str = "ar",
+        render_profile: str = None,
+        renditions: list = None
+    ) -> Dict:
+        """إعادة توليد ما تغيّر في مشهد واحد وترميز مقطعه فقط ثم دمج كل المقاطع دون إعادة ترميز"""
+        
+        start_time = datetime.utcnow()
+        
+        self.video_editor = self.video_editor.with_profile(render_profile, renditions)
+        video_filename = f"project_{project_id}_{self.video_editor.profile['name']}.mp4"
+        
+        stage_trace = StageTrace().start()
+        status = "error"
+        progress = ProgressWriter(self.project_service, project_id, lock=self._db_lock)
+        
+        try:
+            await progress.set("editing", 70)
+            
+            checkpoint = await self._load_checkpoint(project_id)
+            if not checkpoint or scene_number not in checkpoint['scenes']:
+                raise Exception(f"المشهد {scene_number} غير موجود في المشروع")
+            
+            script_data = checkpoint['script_data']
+            scenes = script_data.get('scenes', [])
+            
+            # مقطع المشهد المعدَّل يُعاد ترميزه دائماً (حتى لو بقيت الصورة والصوت كما هما)
+            self._discard_segment(self.video_editor.segment_path(project_id, scene_number))
+            
+            # الوسائط المحفوظة ومقاطعها تُستخدم كما هي؛ يُولَّد فقط ما مُسح عند التعديل
+            # (الصوت عند تغيير النص، والصورة عند تغيير الوصف المرئي)
+            scene_media = await self._generate_scene_media(
+                project_id, scenes, language, checkpoint,
+                self._segment_encoder(project_id, checkpoint)
+            )
+            
+            if progress.cancelled:
+                raise RenderCancelled("تم إلغاء المشروع قبل الدمج")
+            monitor = self._render_monitor(project_id, progress, scene_media)
+            video_path = await self._join_segments(project_id, scene_media, video_filename, monitor)
+            
+            processing_time = (datetime.utcnow() - start_time).total_seconds()
+            await progress.set(
+                "completed", 100,
+                video_path=video_path,
+                renditions=self.video_editor.rendition_outputs(video_path),
+                processing_time_seconds=int(processing_time),
+                **self._preview_fields(video_path)
+            )
+            status = "ok"
+            print(f"✅ تم تحديث المشهد {scene_number} خلال {processing_time:.1f} ثانية")
+            
+            return {
+                "success": True,
+                "project_id": project_id,
+                "scene_number": scene_number,
+                "video_path": video_path,
+                "processing_time_seconds": processing_time
             }
+        
+        except RenderCancelled as e:
+            status = "cancelled"
+            return {"success": False, "cancelled": True, "error": str(e)}
+        
+        except Exception as e:
+            print(f"❌ خطأ في تحديث المشهد: {str(e)}")
+            if not await progress.fail(str(e)):
+                status = "cancelled"
+                return {"success": False, "cancelled": True, "error": str(e)}
             
-            # يمكن حفظ هذا في قاعدة البيانات
+            return {
+                "success": False,
+                "error": str(e)
+            }
         
-        return True
+        finally:
+            metrics.observe_stage(
+                "scene_rerender", "orchestrator",
+                (datetime.utcnow() - start_time).total_seconds(), status
+            )
+            await self._save_stage_timings(user_id, project_id, stage_trace.stop())
+    
+    async def _join_segments(
+        self,
+        project_id: int,
+        scene_media: list,
+        video_filename: str,
+        monitor: RenderMonitor = None
+    ) -> str:
+        """دمج مقاطع المشاهد الجاهزة (والمقدمة) بنسخ التدفقات، ثم الصور المصغّرة"""
+        
+        rendered = [m for m in scene_media if m.get('segment_path')]
+        segments = [m['segment_path'] for m in rendered]
+        
+        if settings.INTRO_VIDEO_PATH:
+            intro_segment = self.video_editor.segment_path(project_id, 0)
+            if not self._outputs_exist(intro_segment):
+                await self.video_editor.render_intro_segment(
+                    settings.INTRO_VIDEO_PATH, intro_segment, monitor
+                )
+            segments.insert(0, intro_segment)
+        
+        video_path = await self.video_editor.concat_segments(
+            segments,
+            output_filename=video_filename,
+            monitor=monitor
+        )
+        
+        await self.video_editor.build_previews(
+            video_path, rendered[0]['image_path'] if rendered else None
+        )
+        
+        return video_path
+    
+    def _discard_segment(self, segment_path: str):
+        """حذف مقطع مشهد ونسخه حتى يُعاد ترميزه"""
+        
+        paths = [r['path'] for r in self.video_editor.rendition_outputs(segment_path).values()]
+        for path in paths:
+            if self._file_exists(path):
+                os.remove(path)
+    
+    def _render_monitor(
+        self,
+        project_id: int,
+        progress: ProgressWriter,
+        scene_media: list
+    ) -> RenderMonitor:
+        """مراقب الترميز: موضع FFmpeg إلى 70-85% وفحص حالة المشروع لطلب الإلغاء"""
+        
+        total_seconds = sum(
+            m.get('duration') or settings.VIDEO_DURATION_PER_IMAGE
+            for m in scene_media if m['image_path']
+        )
+        
+        async def _on_progress(fraction: float):
+            await progress.set("editing", 70 + int(15 * fraction))
+        
+        async def _should_cancel() -> bool:
+            if progress.cancelled:
+                return True
+            async with self._db_lock:
+                return await self.project_service.get_status(project_id) == "cancelled"
+        
+        return RenderMonitor(total_seconds, on_progress=_on_progress, should_cancel=_should_cancel)
+    
+    async def _save_stage_timings(self, user_id: int, project_id: int, records: list):
+        """حفظ أزمنة المراحل دون أن يؤثر فشل الحفظ على نتيجة خط الإنتاج"""
+        
+        if not settings.PERSIST_STAGE_TIMINGS or not records:
+            return
+        
+        try:
+            await self.project_service.log_stage_timings(user_id, project_id, records)
+        except Exception as e:
+            await self.db.rollback()
+            print(f"⚠️ تعذر حفظ أزمنة المراحل: {e}")
+    
+    async def _load_checkpoint(self, project_id: int) -> Optional[Dict]:
+        """تحميل مخرجات المراحل المحفوظة من المشروع وصفوف Scene"""
+        
+        project = await self.project_service.get_project(project_id)
+        if not project or not project.script_data or not project.script_data.get('scenes'):
+            return None
+        
+        script_data = {k: v for k, v in project.script_data.items() if k != 'error'}
+        scenes = await self.project_service.get_project_scenes(project_id)
+        
+        return {
+            'script_data': script_data,
+            'scenes': {scene.scene_number: scene for scene in scenes},
+            'video_path': project.video_path
+        }
+    
+    def _file_exists(self, path: Optional[str]) -> bool:
+        """هل المخرَج موجود فعلاً على القرص"""
+        return bool(path) and os.path.exists(path)
+    
+    def _preview_fields(self, video_path: str) -> Dict:
+        """أعمدة الصورة المصغّرة وورقة المعاينة الموجودة بجانب الفيديو"""
+        
+        paths = self.video_editor.preview_paths(video_path)
+        fields = {}
+        if self._file_exists(paths['thumbnail']):
+            fields['thumbnail_path'] = paths['thumbnail']
+        if self._file_exists(paths['sprite']):
+            fields['preview_sprite_path'] = paths['sprite']
+        return fields
+    
+    def _outputs_exist(self, path: Optional[str]) -> bool:
+        """هل المخرَج وكل نسخه المطلوبة موجودة"""
+        return bool(path) and all(
+            self._file_exists(r['path']) for r in self.video_editor.rendition_outputs(path).values()
+        )
+    
+    async def _generate_scene_media(
+        self,
+        project_id: int,
+        scenes: list,
+        language: str,
+        checkpoint: Optional[Dict] = None,
+        on_scene_ready=None
+    ) -> list:
+        """توليد صور وأصوات المشاهد معاً (كل فرع بحد تزامن خاص به)"""
+        
+        saved_scenes = checkpoint['scenes'] if checkpoint else {}
+        
+        async def _image(index, scene):
+            if 'visual_prompt' not in scene:
+                return None
+            
+            saved = saved_scenes.get(scene['scene_number'])
+            if saved and self._file_exists(saved.image_path):
+                return saved.image_path
+            
+            image_path = await self.image_generator.generate_image(scene['visual_prompt'])
+            
+            async with self._db_lock:
+                await self.project_service.checkpoint_scene_image(
+                    project_id, scene['scene_number'], image_path
+                )
+            
+            return image_path
+        
+        async def _voice(index, scene):
+            saved = saved_scenes.get(scene['scene_number'])
+            if saved and self._file_exists(saved.audio_path):
+                return {'audio_path': saved.audio_path, 'duration': saved.duration_seconds}
+            
+            voice = await self.voice_generator.generate_scene_voice(scene, language)
+            
+            if voice:
+                async with self._db_lock:
+                    await self.project_service.checkpoint_scene_voice(
+                        project_id, scene['scene_number'], voice['audio_path'], voice['duration']
+                    )
+            
+            return voice
+        
+        return await self.media_pipeline.run(scenes, _image, _voice, on_scene_ready)
+    
+    async def _streamed_scenes(self, project_id: int, script_stream, progress: ProgressWriter):
+        """مشاهد السكريبت المبثوث بالترتيب، مع حفظ صف كل مشهد قبل أن تبدأ وسائطه"""
+        
+        # سكريبت جديد يُلغي مشاهد ووسائط التشغيل السابق
+        async with self._db_lock:
+            await self.project_service.save_script_scenes(project_id, [])
+        
+        async for scene in script_stream:
+            async with self._db_lock:
+                await self.project_service.add_script_scene(project_id, scene)
+            yield scene
+        
+        script_data = script_stream.script
+        await progress.set(
+            "processing", 30,
+            script_data=script_data,
+            title=script_data.get('title'),
+            description=script_data.get('description')
+        )
+        print(f"✅ تم توليد السكريبت: {script_data['title']}")
+    
+    def _segment_encoder(self, project_id: int, checkpoint: Optional[Dict] = None):
+        """دالة ترميز مقطع المشهد فور جاهزيته (المحرِّر يحدّ عدد عمليات الترميز المتزامنة)"""
+        
+        async def _encode(media: dict):
+            if not media['image_path']:
+                return None
+            
+            output_path = self.video_editor.segment_path(project_id, media['scene_number'])
+            
+            # المقاطع تُكتب بشكل ذري، فوجودها يعني اكتمالها؛ ويُعاد استخدامها
+            # فقط إن بُنيت من نفس الصورة والصوت المحفوظين
+            saved = checkpoint['scenes'].get(media['scene_number']) if checkpoint else None
+            if (
+                saved
+                and saved.image_path == media['image_path']
+                and saved.audio_path == media['audio_path']
+                and self._outputs_exist(output_path)
+            ):
+                return {'segment_path': output_path}
+            
+            segment_path = await self.video_editor.render_segment(
+                image_path=media['image_path'],
+                audio_path=media['audio_path'],
+                output_path=output_path,
+                duration=media['duration'],
+                subtitle_text=media['text']
+            )
+            
+            return {'segment_path': segment_path}
+        
+        return _encode
     
     async def quick_preview(
         self,
         topic: str,
-        num_scenes: int = 3
+        num_scenes: int = 3,
+        render_profile: str = None
     ) -> Dict:
-        """معاينة سريعة (توليد سكريبت وصورتين فقط)"""
+        """معاينة سريعة (سكريبت وصور، ومسودة فيديو بملف الترميز المحدد مثل draft)"""
         
         # توليد سكريبت مختصر
         script_data = await self.script_writer.generate_script(
@@ -184,9 +562,39 @@ class OrchestratorAgent:
         prompts = [s['visual_prompt'] for s in preview_scenes if 'visual_prompt' in s]
         images = await self.image_generator.generate_batch(prompts[:num_scenes])
         
-        return {
+        preview = {
             "title": script_data['title'],
             "description": script_data['description'],
             "scenes": preview_scenes,
             "preview_images": images
         }
+        
+        if render_profile:
+            # مسودة فيديو لمراجعة الإيقاع قبل الترميز النهائي المكلف
+            # (الصور أعلاه في ذاكرة الصور، فلا يُعاد توليدها)
+            scene_media = await self._generate_preview_media(preview_scenes)
+            rendered = [m for m in scene_media if m['image_path']]
+            
+            editor = self.video_editor.with_profile(render_profile, renditions=[])
+            preview["preview_video"] = await editor.assemble_video(
+                images=[m['image_path'] for m in rendered],
+                audio_files=[m['audio_path'] for m in rendered],
+                output_filename=f"preview_{cache_key(topic, num_scenes)[:16]}_{editor.profile['name']}.mp4",
+                subtitles=[{'text': m['text']} for m in rendered],
+                durations=[m['duration'] for m in rendered]
+            )
+        
+        return preview
+    
+    async def _generate_preview_media(self, scenes: list) -> list:
+        """صور وأصوات مشاهد المعاينة"""
+        
+        async def _image(index, scene):
+            if 'visual_prompt' not in scene:
+                return None
+            return await self.image_generator.generate_image(scene['visual_prompt'])
+        
+        async def _voice(index, scene):
+            return await self.voice_generator.generate_scene_voice(scene, "ar")
+        
+        return await self.media_pipeline.run(scenes, _image, _voice)
@@ -0,0 +1,104 @@
+"""خط إنتاج المشاهد - توليد الصور والأصوات بالتوازي"""
+import asyncio
+from typing import AsyncIterable, Awaitable, Callable, Dict, List, Optional, Union
+
+from app.core.config import settings
+
+
+# كل دالة تستقبل رقم المشهد (يبدأ من 1) والمشهد نفسه
+ImageFn = Callable[[int, Dict], Awaitable[Optional[str]]]
+VoiceFn = Callable[[int, Dict], Awaitable[Optional[Dict]]]
+# تُستدعى فور اكتمال صورة وصوت المشهد، ويُدمج ما تُرجعه في بيانات المشهد
+SceneReadyFn = Callable[[Dict], Awaitable[Optional[Dict]]]
+
+
+class SceneMediaPipeline:
+    """تشغيل فرعي الصور والأصوات معاً وربط النتائج لكل مشهد"""
+    
+    def __init__(
+        self,
+        image_concurrency: int = None,
+        voice_concurrency: int = None
+    ):
+        self.image_concurrency = image_concurrency or settings.IMAGE_CONCURRENCY
+        self.voice_concurrency = voice_concurrency or settings.VOICE_CONCURRENCY
+    
+    async def run(
+        self,
+        scenes: Union[List[Dict], AsyncIterable[Dict]],
+        generate_image: ImageFn,
+        generate_voice: VoiceFn,
+        on_scene_ready: SceneReadyFn = None
+    ) -> List[Dict]:
+        """توليد وسائط جميع المشاهد وإرجاعها مرتبة حسب المشهد"""
+        
+        # scenes قائمة، أو مصدر غير متزامن يُسلِّم كل مشهد فور اكتماله في السكريبت المبثوث
+        image_semaphore = asyncio.Semaphore(self.image_concurrency)
+        voice_semaphore = asyncio.Semaphore(self.voice_concurrency)
+        
+        async def _bounded(semaphore: asyncio.Semaphore, fn, index: int, scene: Dict):
+            async with semaphore:
+                return await fn(index, scene)
+        
+        # مهام كل مشهد تبدأ لحظة وصوله دون انتظار بقية السكريبت، والفرعان معاً
+        tasks: List[asyncio.Task] = []
+        joins: List[asyncio.Task] = []
+        
+        try:
+            async for index, scene in self._numbered(scenes):
+                image_task = asyncio.create_task(_bounded(image_semaphore, generate_image, index, scene))
+                voice_task = asyncio.create_task(_bounded(voice_semaphore, generate_voice, index, scene))
+                join_task = asyncio.create_task(
+                    self._join_scene(index, scene, image_task, voice_task, on_scene_ready)
+                )
+                tasks += [image_task, voice_task, join_task]
+                joins.append(join_task)
+            
+            scene_media = await asyncio.gather(*joins)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
+        
+        return list(scene_media)
+    
+    async def _numbered(self, scenes: Union[List[Dict], AsyncIterable[Dict]]):
+        index = 0
+        if hasattr(scenes, '__aiter__'):
+            async for scene in scenes:
+                index += 1
+                yield index, scene
+        else:
+            for scene in scenes:
+                index += 1
+                yield index, scene
+    
+    async def _join_scene(
+        self,
+        index: int,
+        scene: Dict,
+        image_task: asyncio.Task,
+        voice_task: asyncio.Task,
+        on_scene_ready: SceneReadyFn = None
+    ) -> Dict:
+        """انتظار صورة وصوت المشهد وربطهما"""
+        
+        image_path, voice = await asyncio.gather(image_task, voice_task)
+        
+        media = {
+            'scene_number': scene.get('scene_number', index),
+            'text': scene.get('text', ''),
+            'image_path': image_path,
+            'audio_path': voice['audio_path'] if voice else None,
+            'duration': (
+                voice.get('duration', settings.VIDEO_DURATION_PER_IMAGE) if voice
+                else settings.VIDEO_DURATION_PER_IMAGE
+            )
+        }
+        
+        if on_scene_ready:
+            extra = await on_scene_ready(media)
+            if extra:
+                media.update(extra)
+        
+        return media
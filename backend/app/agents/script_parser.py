@@ -0,0 +1,371 @@
+"""تحليل رد النموذج للسكريبت - استخراج JSON متسامح مع الإصلاح، وتسليم المشاهد أثناء البث فور اكتمالها"""
+import json
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+
+_CLOSERS = {'{': '}', '[': ']'}
+
+
+def parse_script(text: str) -> Dict:
+    """تحويل رد النموذج إلى قاموس السكريبت مع إصلاح العيوب الشائعة وإنقاذ المخرجات المقطوعة"""
+    
+    script, salvaged = extract_json(text)
+    if not isinstance(script, dict):
+        raise ValueError("رد النموذج لا يحتوي كائن JSON للسكريبت")
+    if salvaged:
+        # سكريبت ناقص: يُستخدم في هذا التشغيل لكن لا يُخزَّن في الذاكرة المؤقتة
+        script['salvaged'] = True
+    if isinstance(script.get('scenes'), list):
+        script['scenes'] = number_scenes(script['scenes'])
+    return script
+
+
+def number_scenes(scenes: List) -> List[Dict]:
+    """المشاهد (القواميس فقط) مرقّمة حسب موضعها"""
+    
+    # scene_number مفتاح صفوف Scene ونقاط الاستئناف وأسماء ملفات المقاطع، فلا يُؤخذ من النموذج:
+    # رقم نصي أو 0 (رقم المقدمة) أو مكرر يكسرها
+    scenes = [scene for scene in scenes if isinstance(scene, dict)]
+    for i, scene in enumerate(scenes, 1):
+        scene['scene_number'] = i
+    return scenes
+
+
+def extract_json(text: str) -> Tuple[Any, bool]:
+    """أول كائن JSON متوازن في النص (يتجاهل الأسوار والنص قبله وبعده)، وهل أُنقذ من رد ناقص"""
+    
+    start = text.find('{')
+    if start < 0:
+        raise ValueError("رد النموذج لا يحتوي JSON")
+    
+    repaired, complete, cuts = _repair(text[start:])
+    
+    error_pos = len(repaired)
+    error = None
+    if complete:
+        try:
+            return json.loads(repaired, strict=False), False
+        except json.JSONDecodeError as e:
+            error, error_pos = e, e.pos
+    
+    # الرد مقطوع أو معطوب: الإبقاء على ما اكتمل قبل موضع الخلل وإغلاق الأقواس المفتوحة عنده
+    for cut, stack in reversed(cuts):
+        if cut > error_pos:
+            continue
+        try:
+            value = json.loads(repaired[:cut] + ''.join(_CLOSERS[c] for c in reversed(stack)), strict=False)
+        except json.JSONDecodeError:
+            continue
+        print("⚠️ رد النموذج غير مكتمل أو معطوب، تم إنقاذ الأجزاء المكتملة منه")
+        return value, True
+    
+    raise error or json.JSONDecodeError("رد النموذج مقطوع قبل أي قيمة مكتملة", text, start)
+
+
+def _repair(text: str):
+    """حذف التعليقات والفواصل الزائدة قبل ] و }، وإضافة الفواصل الناقصة بين القيم، حتى إغلاق الكائن الأول"""
+    
+    # يُرجع (النص المُصلح، هل اكتمل الكائن، [(موضع بعد كل قيمة داخلية مكتملة، الأقواس المفتوحة عنده)])
+    out = []
+    stack = []
+    cuts = []
+    in_string = escape = False
+    # آخر حرف مُخرَج خارج السلاسل (لمعرفة هل انتهت قيمة قبل بداية أخرى)
+    last = ' '
+    i, n = 0, len(text)
+    
+    while i < n:
+        char = text[i]
+        
+        if in_string:
+            out.append(char)
+            if escape:
+                escape = False
+            elif char == '\\':
+                escape = True
+            elif char == '"':
+                in_string = False
+                last = char
+            i += 1
+            continue
+        
+        if (
+            (last in '"}]' and (char in '"{[-' or char.isalnum()))
+            or (last.isalnum() and (
+                char in '"{[' or (text[i - 1].isspace() and (char.isalnum() or char == '-'))
+            ))
+        ):
+            # قيمتان متجاورتان بلا فاصل (مثل }{ أو "..." "...")
+            out.append(',')
+            last = ','
+        
+        if char == '"':
+            in_string = True
+        elif char == '/' and text.startswith('//', i):
+            end = text.find('\n', i)
+            i = n if end < 0 else end
+            continue
+        elif char == '/' and text.startswith('/*', i):
+            end = text.find('*/', i + 2)
+            i = n if end < 0 else end + 2
+            continue
+        elif char == ',':
+            j = i + 1
+            while j < n and text[j].isspace():
+                j += 1
+            if j < n and text[j] in '}]':
+                i += 1
+                continue
+        elif char in '{[':
+            stack.append(char)
+        elif char in '}]':
+            if not stack:
+                break
+            stack.pop()
+            out.append(char)
+            last = char
+            if not stack:
+                return ''.join(out), True, cuts
+            cuts.append((len(out), list(stack)))
+            i += 1
+            continue
+        
+        out.append(char)
+        if not char.isspace():
+            last = char
+        i += 1
+    
+    return ''.join(out), False, cuts
+
+
+class SceneStreamParser:
+    """ماسح JSON تدريجي يتتبع السلاسل والأقواس ويُخرج عناصر مصفوفة scenes المكتملة"""
+    
+    def __init__(self, key: str = "scenes"):
+        self.key = key
+        self.text = ""
+        self.scenes: List[Dict] = []
+        
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        self._last_string: Optional[str] = None
+        # بعد "scenes": ينتظر الماسح فتح المصفوفة
+        self._expect_array = False
+        self._array_depth: Optional[int] = None
+        self._array_closed = False
+        self._item_start: Optional[int] = None
+        # عدد كائنات المصفوفة التي بدأت: موضع المشهد فيها (ومنه رقمه) كما في التحليل الكامل
+        self._items = 0
+    
+    def feed(self, chunk: str) -> List[Dict]:
+        """إضافة جزء من النص وإرجاع المشاهد التي اكتملت به"""
+        
+        self.text += chunk
+        completed = []
+        text = self.text
+        
+        # كل حرف يُمسح مرة واحدة فقط مهما كان عدد الأجزاء
+        for i in range(self._pos, len(text)):
+            char = text[i]
+            
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == '\\':
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    self._last_string = text[self._string_start + 1:i]
+                continue
+            
+            if char == '"':
+                self._in_string = True
+                self._string_start = i
+            elif char == ':':
+                self._expect_array = (
+                    self._array_depth is None and self._last_string == self.key
+                )
+            elif char in '{[':
+                self._depth += 1
+                if char == '[' and self._expect_array:
+                    self._array_depth = self._depth
+                elif (
+                    char == '{'
+                    and not self._array_closed
+                    and self._array_depth is not None
+                    and self._depth == self._array_depth + 1
+                ):
+                    self._item_start = i
+                    self._items += 1
+                self._expect_array = False
+            elif char in '}]':
+                if char == '}' and self._item_start is not None and self._depth == self._array_depth + 1:
+                    scene = self._scene(text[self._item_start:i + 1], self._items)
+                    if scene is not None:
+                        completed.append(scene)
+                    self._item_start = None
+                elif char == ']' and self._depth == self._array_depth and not self._array_closed:
+                    self._array_closed = True
+                self._depth -= 1
+            elif not char.isspace():
+                self._expect_array = False
+        
+        self._pos = len(text)
+        return completed
+    
+    def finish(self) -> Dict:
+        """السكريبت الكامل بعد انتهاء البث (المشاهد المُسلَّمة هي نفس كائنات scenes فيه)"""
+        
+        script = parse_script(self.text)
+        
+        # التحليل الكامل هو المرجع، ويُطابَق كل مشهد مُسلَّم بموضعه في المصفوفة لا بعددها:
+        # مقطع فشل تحليله أثناء البث لا يُزيح ما بعده
+        delivered = {scene['scene_number']: scene for scene in self.scenes}
+        scenes = [
+            delivered.pop(scene['scene_number'], scene) for scene in script.get(self.key) or []
+        ]
+        # مشاهد بعد موضع قطع التحليل الكامل سُلِّمت فعلاً فتبقى بأرقامها
+        script[self.key] = sorted(
+            scenes + list(delivered.values()), key=lambda scene: scene['scene_number']
+        )
+        return script
+    
+    def _scene(self, fragment: str, number: int) -> Optional[Dict]:
+        try:
+            scene, _ = extract_json(fragment)
+        except ValueError:
+            # يُترك للتحليل الكامل في finish
+            return None
+        if not isinstance(scene, dict):
+            return None
+        scene['scene_number'] = number
+        self.scenes.append(scene)
+        return scene
+
+
+class ScriptStream:
+    """سكريبت قيد البث: التكرار عليه يسلّم المشاهد فور اكتمالها، و script يحمل السكريبت بعد انتهائه"""
+    
+    def __init__(
+        self,
+        deltas: AsyncIterator[str] = None,
+        script: Dict = None,
+        on_complete: Callable[[Dict], None] = None,
+        parts: AsyncIterator[Dict] = None,
+        flight=None
+    ):
+        self._deltas = deltas
+        self._parts = parts
+        self._on_complete = on_complete
+        # ScriptFlight من الذاكرة المؤقتة: طلبات البث والتوليد الكامل المطابقة تشترك في استدعاء واحد
+        self._flight = flight
+        self.script = script
+        self.parser = SceneStreamParser()
+    
+    async def __aiter__(self) -> AsyncIterator[Dict]:
+        if self._flight is None:
+            async for scene in self._scenes():
+                yield scene
+            return
+        
+        shared = await self._flight.join()
+        if shared is not None:
+            # مخزّن أو ولّده طلب مطابق: المشاهد كلها تُسلَّم بعد اكتماله
+            self._deltas = self._parts = None
+            self.script = shared
+        
+        try:
+            async for scene in self._scenes():
+                yield scene
+        except BaseException as e:
+            self._flight.fail(e)
+            raise
+    
+    def _complete(self):
+        if self._flight is not None:
+            self._flight.done(self.script)
+        if self._on_complete:
+            self._on_complete(self.script)
+    
+    async def _scenes(self) -> AsyncIterator[Dict]:
+        if self._parts is not None:
+            # سكريبت من أجزاء (رأس ثم مشاهد كل قسم): تُدمج بالترتيب وتُرقَّم المشاهد عبر الأقسام
+            self.script = {'scenes': []}
+            async for part in self._parts:
+                scenes = part.pop('scenes', None) or []
+                self.script.update(part)
+                for scene in scenes:
+                    if not isinstance(scene, dict):
+                        continue
+                    self.script['scenes'].append(scene)
+                    scene['scene_number'] = len(self.script['scenes'])
+                    yield scene
+            
+            self._complete()
+            return
+        
+        if self._deltas is None:
+            # سكريبت جاهز (من الذاكرة المؤقتة): المشاهد كلها متاحة فوراً
+            self.script['scenes'] = number_scenes(self.script.get('scenes', []))
+            for scene in self.script['scenes']:
+                yield scene
+            return
+        
+        async for text in self._deltas:
+            for scene in self.parser.feed(text):
+                yield scene
+        
+        streamed = {scene['scene_number'] for scene in self.parser.scenes}
+        self.script = self.parser.finish()
+        self._complete()
+        
+        # المشاهد التي لم يُسلِّمها البث (بأرقام مواضعها في السكريبت)
+        for scene in self.script['scenes']:
+            if scene['scene_number'] not in streamed:
+                yield scene
+
+
+async def ndjson_deltas(response, field: str = "response") -> AsyncIterator[str]:
+    """نص كل سطر في بث NDJSON (Ollama /api/generate)"""
+    
+    async for line in response.content:
+        line = line.strip()
+        if not line:
+            continue
+        
+        data = json.loads(line)
+        if data.get("error"):
+            raise RuntimeError(data["error"])
+        if data.get(field):
+            yield data[field]
+        if data.get("done"):
+            break
+
+
+async def sse_deltas(response) -> AsyncIterator[str]:
+    """محتوى أحداث SSE بصيغة chat.completions (Groq وأي واجهة متوافقة مع OpenAI)"""
+    
+    async for line in response.content:
+        line = line.decode('utf-8').strip()
+        if not line.startswith("data:"):
+            continue
+        
+        data = line[5:].strip()
+        if data == "[DONE]":
+            break
+        
+        choices = json.loads(data).get("choices") or []
+        content = (choices[0].get("delta") or {}).get("content") if choices else None
+        if content:
+            yield content
+
+
+async def openai_deltas(stream) -> AsyncIterator[str]:
+    """نص أجزاء بث عميل OpenAI الرسمي"""
+    
+    async for chunk in stream:
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
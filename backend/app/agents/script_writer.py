@@ -1,8 +1,14 @@
 """وكيل كتابة السكريبت"""
+import asyncio
 import json
-from typing import Dict, List, Optional
+import math
+from typing import AsyncIterator, Dict, List, Optional
 from openai import AsyncOpenAI
-from .core.config import settings
+from app.core.config import settings
+from app.core.script_cache import script_cache
+from app.core.metrics import stage_timer
+from app.core.rate_limiter import get_limiter
+from app.agents.script_parser import ScriptStream, openai_deltas, parse_script
 
 
 class ScriptWriterAgent:
@@ -22,15 +28,101 @@ class ScriptWriterAgent:
 
     def __init__(self, client: AsyncOpenAI = None):
         self.client = client or AsyncOpenAI(api_key=settings.OPENAI_API_KEY)
+        self.cache = script_cache
     
     async def generate_script(
         self,
         topic: str,
         duration_minutes: int = 5,
         style: str = "documentary",
-        language: str = "ar"
+        language: str = "ar",
+        use_cache: bool = True
     ) -> Dict:
-        """توليد سكريبت كامل"""
+        """توليد سكريبت كامل (من الذاكرة المؤقتة إن وُجد)"""
+        
+        async def _generate():
+            return await self._generate_script(topic, duration_minutes, style, language)
+        
+        if not use_cache:
+            return await _generate()
+        
+        key = self.cache.key(topic, duration_minutes, style, language, settings.OPENAI_MODEL)
+        return await self.cache.get_or_create(key, _generate)
+    
+    async def stream_script(
+        self,
+        topic: str,
+        duration_minutes: int = 5,
+        style: str = "documentary",
+        language: str = "ar",
+        use_cache: bool = True
+    ) -> ScriptStream:
+        """توليد السكريبت بالبث: كل مشهد يُسلَّم فور اكتماله (وكلها فوراً من الذاكرة المؤقتة)"""
+        
+        # نفس single-flight الخاص بـ generate_script: المخزّن يُسلَّم فوراً، والطلب المطابق الجاري يُنتظر
+        key = self.cache.key(topic, duration_minutes, style, language, settings.OPENAI_MODEL)
+        flight = self.cache.flight(key) if use_cache else None
+        
+        if self._is_long(duration_minutes):
+            # أقسام السكريبت الطويل تُسلَّم بالترتيب فور اكتمال كل قسم
+            return ScriptStream(
+                parts=self._long_script_parts(topic, duration_minutes, style, language),
+                flight=flight
+            )
+        
+        messages = self._script_messages(topic, duration_minutes, style, language)
+        
+        async def _deltas():
+            # المكان في حد المزوّد محجوز طوال البث
+            async with get_limiter("openai"), stage_timer("script", "openai"):
+                stream = await self.client.chat.completions.create(
+                    model=settings.OPENAI_MODEL,
+                    messages=messages,
+                    max_tokens=settings.OPENAI_MAX_TOKENS,
+                    temperature=0.7,
+                    response_format={"type": "json_object"},
+                    stream=True
+                )
+                async for text in openai_deltas(stream):
+                    yield text
+        
+        return ScriptStream(_deltas(), flight=flight)
+    
+    async def _generate_script(
+        self,
+        topic: str,
+        duration_minutes: int,
+        style: str,
+        language: str
+    ) -> Dict:
+        """استدعاء النموذج لتوليد السكريبت"""
+        
+        if self._is_long(duration_minutes):
+            stream = ScriptStream(parts=self._long_script_parts(topic, duration_minutes, style, language))
+            async for _ in stream:
+                pass
+            return stream.script
+        
+        async with get_limiter("openai"), stage_timer("script", "openai"):
+            response = await self.client.chat.completions.create(
+                model=settings.OPENAI_MODEL,
+                messages=self._script_messages(topic, duration_minutes, style, language),
+                max_tokens=settings.OPENAI_MAX_TOKENS,
+                temperature=0.7,
+                response_format={"type": "json_object"}
+            )
+        
+        content = response.choices[0].message.content
+        return parse_script(content)
+    
+    def _script_messages(
+        self,
+        topic: str,
+        duration_minutes: int,
+        style: str,
+        language: str
+    ) -> List[Dict]:
+        """رسائل طلب السكريبت"""
         
         user_prompt = f"""
 الفكرة الرئيسية: {topic}
@@ -61,19 +153,171 @@ class ScriptWriterAgent:
 }}
 """
         
-        response = await self.client.chat.completions.create(
-            model=settings.OPENAI_MODEL,
-            messages=[
-                {"role": "system", "content": self.SYSTEM_PROMPT},
-                {"role": "user", "content": user_prompt}
-            ],
-            max_tokens=settings.OPENAI_MAX_TOKENS,
-            temperature=0.7,
-            response_format={"type": "json_object"}
+        return [
+            {"role": "system", "content": self.SYSTEM_PROMPT},
+            {"role": "user", "content": user_prompt}
+        ]
+    
+    def _is_long(self, duration_minutes: int) -> bool:
+        return 0 < settings.LONG_SCRIPT_MIN_MINUTES <= duration_minutes
+    
+    async def _long_script_parts(
+        self,
+        topic: str,
+        duration_minutes: int,
+        style: str,
+        language: str
+    ) -> AsyncIterator[Dict]:
+        """سكريبت طويل: مخطط مختصر ثم كل الأقسام بالتوازي، وتُسلَّم بالترتيب (الرأس ثم مشاهد كل قسم)"""
+        
+        # استدعاء واحد طويل يُقطع عند OPENAI_MAX_TOKENS ويكون أبطأ من أقسام متوازية
+        section_count = max(2, math.ceil(duration_minutes / max(1, settings.LONG_SCRIPT_SECTION_MINUTES)))
+        outline = await self._generate_outline(topic, duration_minutes, style, language, section_count)
+        
+        sections = [s for s in outline.get('sections', []) if isinstance(s, dict)]
+        if not sections:
+            raise ValueError("المخطط لا يحتوي أقساماً")
+        
+        # نفس كثافة السكريبت القصير (حوالي مشهدين لكل دقيقة) موزعة على الأقسام
+        scenes_per_section = max(2, round(duration_minutes * 2 / len(sections)))
+        
+        tasks = [
+            asyncio.create_task(
+                self._generate_section(topic, style, language, outline, sections, i, scenes_per_section)
+            )
+            for i in range(len(sections))
+        ]
+        
+        header = {
+            'title': outline.get('title', topic),
+            'description': outline.get('description', ''),
+            'tags': outline.get('tags', []),
+            'estimated_duration': duration_minutes
+        }
+        if outline.get('salvaged'):
+            header['salvaged'] = True
+        
+        try:
+            yield header
+            for task in tasks:
+                section = await task
+                # قسم واحد مُنقَذ يكفي لاستبعاد السكريبت كله من الذاكرة المؤقتة
+                part = {'scenes': section.get('scenes', [])}
+                if section.get('salvaged'):
+                    part['salvaged'] = True
+                yield part
+        finally:
+            for task in tasks:
+                task.cancel()
+    
+    async def _generate_outline(
+        self,
+        topic: str,
+        duration_minutes: int,
+        style: str,
+        language: str,
+        section_count: int
+    ) -> Dict:
+        """مخطط مختصر للسكريبت الطويل (العنوان والوصف وملخص كل قسم)"""
+        
+        user_prompt = f"""
+الفكرة الرئيسية: {topic}
+المدة المطلوبة: {duration_minutes} دقيقة
+أسلوب الفيديو: {style}
+اللغة: {"العربية" if language == "ar" else "English"}
+
+أنتج مخططاً مختصراً لفيديو طويل مقسماً إلى {section_count} أقسام متتالية بمدد متقاربة.
+لكل قسم: عنوان وملخص من جملتين بالأفكار التي يغطيها (دون كتابة النص نفسه).
+
+أخرج بتنسيق JSON:
+{{
+    "title": "عنوان الفيديو",
+    "description": "وصف الفيديو",
+    "tags": ["tag1", "tag2", "tag3"],
+    "sections": [
+        {{"title": "عنوان القسم", "summary": "ملخص القسم"}}
+    ]
+}}
+"""
+        
+        async with get_limiter("openai"), stage_timer("script_outline", "openai"):
+            response = await self.client.chat.completions.create(
+                model=settings.OPENAI_MODEL,
+                messages=[
+                    {"role": "system", "content": self.SYSTEM_PROMPT},
+                    {"role": "user", "content": user_prompt}
+                ],
+                max_tokens=1500,
+                temperature=0.7,
+                response_format={"type": "json_object"}
+            )
+        
+        return parse_script(response.choices[0].message.content)
+    
+    async def _generate_section(
+        self,
+        topic: str,
+        style: str,
+        language: str,
+        outline: Dict,
+        sections: List[Dict],
+        index: int,
+        scene_count: int
+    ) -> Dict:
+        """مشاهد قسم واحد من المخطط (مع سياق القسمين المجاورين حتى يتصل السرد)"""
+        
+        section = sections[index]
+        plan = "\n".join(
+            f"{i + 1}. {s.get('title', '')}: {s.get('summary', '')}" for i, s in enumerate(sections)
         )
         
-        content = response.choices[0].message.content
-        return json.loads(content)
+        if index == 0:
+            position = "هذا هو القسم الأول: ابدأ بمقدمة تشد المشاهد."
+        elif index == len(sections) - 1:
+            position = "هذا هو القسم الأخير: اختم الفيديو بخلاصة واضحة."
+        else:
+            position = "هذا قسم وسطي: لا تكتب مقدمة ولا خاتمة، وتابع السرد من القسم السابق."
+        
+        user_prompt = f"""
+الفكرة الرئيسية: {topic}
+عنوان الفيديو: {outline.get('title', topic)}
+أسلوب الفيديو: {style}
+اللغة: {"العربية" if language == "ar" else "English"}
+
+مخطط الفيديو كاملاً:
+{plan}
+
+اكتب القسم رقم {index + 1} فقط: {section.get('title', '')}
+{section.get('summary', '')}
+{position}
+
+قسّمه إلى حوالي {scene_count} مشاهد، لكل مشهد: النص المقروء + وصف الصورة المطلوبة.
+
+أخرج بتنسيق JSON:
+{{
+    "scenes": [
+        {{
+            "text": "النص المقروء في هذا المشهد",
+            "visual_prompt": "وصف دقيق للصورة المطلوبة بالإنجليزية",
+            "duration_seconds": 5
+        }}
+    ]
+}}
+"""
+        
+        async with get_limiter("openai"), stage_timer("script_section", "openai", section=index + 1):
+            response = await self.client.chat.completions.create(
+                model=settings.OPENAI_MODEL,
+                messages=[
+                    {"role": "system", "content": self.SYSTEM_PROMPT},
+                    {"role": "user", "content": user_prompt}
+                ],
+                max_tokens=settings.OPENAI_MAX_TOKENS,
+                temperature=0.7,
+                response_format={"type": "json_object"}
+            )
+        
+        return parse_script(response.choices[0].message.content)
     
     async def generate_ideas(
         self,
@@ -93,15 +337,16 @@ class ScriptWriterAgent:
 أخرج فقط قائمة أفكار (كل فكرة في سطر جديد).
 """
         
-        response = await self.client.chat.completions.create(
-            model=settings.OPENAI_MODEL,
-            messages=[
-                {"role": "system", "content": "أنت مسوق محتوى محترف"},
-                {"role": "user", "content": user_prompt}
-            ],
-            max_tokens=1000,
-            temperature=0.9
-        )
+        async with get_limiter("openai"):
+            response = await self.client.chat.completions.create(
+                model=settings.OPENAI_MODEL,
+                messages=[
+                    {"role": "system", "content": "أنت مسوق محتوى محترف"},
+                    {"role": "user", "content": user_prompt}
+                ],
+                max_tokens=1000,
+                temperature=0.9
+            )
         
         ideas = response.choices[0].message.content.strip().split('\n')
         return [idea.strip().lstrip('0123456789.- ') for idea in ideas if idea.strip()]
@@ -132,16 +377,17 @@ class ScriptWriterAgent:
 }}
 """
         
-        response = await self.client.chat.completions.create(
-            model=settings.OPENAI_MODEL,
-            messages=[
-                {"role": "system", "content": "أنت خبير سيو ليوتيوب"},
-                {"role": "user", "content": user_prompt}
-            ],
-            max_tokens=2000,
-            temperature=0.7,
-            response_format={"type": "json_object"}
-        )
+        async with get_limiter("openai"):
+            response = await self.client.chat.completions.create(
+                model=settings.OPENAI_MODEL,
+                messages=[
+                    {"role": "system", "content": "أنت خبير سيو ليوتيوب"},
+                    {"role": "user", "content": user_prompt}
+                ],
+                max_tokens=2000,
+                temperature=0.7,
+                response_format={"type": "json_object"}
+            )
         
         content = response.choices[0].message.content
         return json.loads(content)
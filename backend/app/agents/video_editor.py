@@ -1,17 +1,165 @@
 """وكيل المونتاج والفيديو"""
+import asyncio
+import copy
+import math
 import os
-import subprocess
-from typing import List, Dict
+import time
+from collections import deque
+from typing import AsyncIterator, Awaitable, Callable, List, Dict, Optional, Tuple
 from pathlib import Path
-from .core.config import settings
+from app.core.config import settings
+from app.core.metrics import stage_timer
+from app.core.workspace import render_workspace
+
+
+def resolve_render_profile(name: str = None) -> Dict:
+    """ملف الترميز بالاسم (أو بأحد أسمائه البديلة) مع إكمال القيم الغائبة من الإعدادات"""
+    
+    name = (name or settings.DEFAULT_RENDER_PROFILE).lower()
+    name = settings.RENDER_PROFILE_ALIASES.get(name, name)
+    if name not in settings.RENDER_PROFILES:
+        name = settings.DEFAULT_RENDER_PROFILE
+    
+    return {
+        'name': name,
+        'width': settings.VIDEO_WIDTH,
+        'height': settings.VIDEO_HEIGHT,
+        'fps': settings.VIDEO_FPS,
+        'preset': "fast",
+        'tune': "",
+        'crf': 23,
+        'audio_bitrate': "128k",
+        'ken_burns': True,
+        **settings.RENDER_PROFILES[name]
+    }
+
+
+def resolve_renditions(names: List[str] = None) -> List[Dict]:
+    """النسخ الإضافية المطلوبة بالاسم (None = الافتراضية في الإعدادات، والأسماء المجهولة تُتجاهل)"""
+    
+    names = settings.OUTPUT_RENDITIONS if names is None else names
+    return [
+        {'name': name, **settings.RENDITIONS[name]}
+        for name in dict.fromkeys(names)
+        if name in settings.RENDITIONS
+    ]
+
+
+class RenderCancelled(Exception):
+    """إيقاف الترميز بطلب إلغاء من المستخدم"""
+
+
+class RenderMonitor:
+    """ربط عمليات FFmpeg الجارية بتقدّم المشروع وبطلبات الإلغاء"""
+    
+    def __init__(
+        self,
+        total_seconds: float,
+        on_progress: Callable[[float], Awaitable] = None,
+        should_cancel: Callable[[], Awaitable[bool]] = None,
+        poll_interval: float = None
+    ):
+        self.total_seconds = max(total_seconds or 0, 0.001)
+        self.on_progress = on_progress
+        self.should_cancel = should_cancel
+        self.poll_interval = (
+            settings.RENDER_CANCEL_POLL_SECONDS if poll_interval is None else poll_interval
+        )
+        
+        # الثواني المُرمَّزة لكل عملية (المقاطع المتوازية تُجمع معاً)
+        self._done: Dict[str, float] = {}
+        self._cancelled = False
+        self._next_poll = 0.0
+    
+    async def report(self, key: str, seconds: float):
+        """تسجيل موضع عملية ترميز وإبلاغ النسبة الإجمالية"""
+        
+        self._done[key] = max(seconds, self._done.get(key, 0.0))
+        if self.on_progress:
+            await self.on_progress(min(1.0, sum(self._done.values()) / self.total_seconds))
+    
+    async def cancel_requested(self) -> bool:
+        """هل طُلب الإلغاء؟ (الاستعلام مرة كل poll_interval مهما كثرت العمليات المتوازية)"""
+        
+        if self._cancelled or not self.should_cancel:
+            return self._cancelled
+        
+        now = time.monotonic()
+        if now < self._next_poll:
+            return False
+        self._next_poll = now + self.poll_interval
+        
+        self._cancelled = bool(await self.should_cancel())
+        return self._cancelled
 
 
 class VideoEditorAgent:
     """وكيل متخصص في تركيب الفيديو"""
     
-    def __init__(self):
+    # خصائص الصوت الموحّدة لكل المقاطع
+    AUDIO_FORMAT = "aresample=44100,aformat=sample_fmts=fltp:channel_layouts=stereo"
+    SILENCE_SOURCE = "anullsrc=channel_layout=stereo:sample_rate=44100"
+    
+    WATERMARK_POSITIONS = {
+        'topleft': '10:10',
+        'topright': 'W-w-10:10',
+        'bottomleft': '10:H-h-10',
+        'bottomright': 'W-w-10:H-h-10'
+    }
+    
+    # أسطر stderr المحفوظة لرسالة الخطأ
+    STDERR_TAIL_LINES = 40
+    
+    def __init__(self, profile: str = None):
         self.output_dir = "output_videos"
         os.makedirs(self.output_dir, exist_ok=True)
+        
+        self.profile = resolve_render_profile(profile)
+        # نسخ بمقاسات أخرى تُرمَّز من نفس فك الترميز بجانب المخرج الأساسي
+        self.renditions = resolve_renditions()
+        # لقطات ورقة المعاينة تُستخرج من نفس مرور الترميز
+        self.preview_sprites = settings.PREVIEW_SPRITES
+        
+        # عدد عمليات الترميز المتزامنة وخيوط x264 لكل عملية
+        self.encode_threads = max(1, settings.SEGMENT_ENCODE_THREADS)
+        self.encode_concurrency = settings.SEGMENT_ENCODE_CONCURRENCY or max(
+            1, (os.cpu_count() or 1) // self.encode_threads
+        )
+        self._encode_slots = asyncio.Semaphore(self.encode_concurrency)
+    
+    def with_profile(self, profile: str = None, renditions: List[str] = None) -> "VideoEditorAgent":
+        """نسخة من المحرِّر بملف ترميز ونسخ أخرى (تشارك حد عمليات الترميز نفسه)"""
+        
+        editor = copy.copy(self)
+        editor.profile = resolve_render_profile(profile)
+        editor.renditions = resolve_renditions(renditions)
+        return editor
+    
+    def rendition_path(self, path: str, name: str) -> str:
+        """مسار نسخة من مخرَج (بجانبه مع اسم النسخة)"""
+        
+        root, ext = os.path.splitext(path)
+        return f"{root}_{name}{ext}"
+    
+    def rendition_outputs(self, output_path: str) -> Dict[str, Dict]:
+        """كل نسخ المخرَج (الأساسي أولاً) بمساراتها ومقاساتها، لتسجيلها في المشروع"""
+        
+        return {
+            spec['name']: {'path': path, 'width': spec['width'], 'height': spec['height']}
+            for spec, path in self._output_specs(output_path)
+        }
+    
+    def _output_specs(self, output_path: str) -> List[Tuple[Dict, str]]:
+        """المخرج الأساسي بمقاس ملف الترميز ثم كل نسخة إضافية بمسارها"""
+        
+        main = {
+            'name': self.profile['name'],
+            'width': self.profile['width'],
+            'height': self.profile['height']
+        }
+        return [(main, output_path)] + [
+            (r, self.rendition_path(output_path, r['name'])) for r in self.renditions
+        ]
     
     async def assemble_video(
         self,
@@ -19,47 +167,184 @@ class VideoEditorAgent:
         audio_files: List[str],
         output_filename: str = None,
         subtitles: List[Dict] = None,
-        add_ken_burns: bool = True
+        add_ken_burns: bool = True,
+        durations: List[float] = None,
+        segmented: bool = None,
+        watermark_path: str = None,
+        intro_path: str = None,
+        monitor: RenderMonitor = None,
+        segment_dir: str = None,
+        scene_numbers: List[int] = None
     ) -> str:
-        """تركيب الفيديو النهائي"""
+        """تركيب الفيديو النهائي (مقطع لكل مشهد بالتوازي ثم دمج دون إعادة ترميز عند segmented)"""
         
         output_filename = output_filename or f"video_{hash(str(images))}.mp4"
         output_path = os.path.join(self.output_dir, output_filename)
         
-        # إنشاء قائمة الصور مع المدد
-        input_file = await self._create_input_file(images)
+        watermark_path = settings.WATERMARK_PATH if watermark_path is None else watermark_path
+        intro_path = settings.INTRO_VIDEO_PATH if intro_path is None else intro_path
         
-        # بناء أمر FFmpeg
-        cmd = self._build_ffmpeg_command(
-            input_file=input_file,
-            audio_files=audio_files,
-            output_path=output_path,
-            subtitles=subtitles,
-            add_ken_burns=add_ken_burns
-        )
+        add_ken_burns = add_ken_burns and self.profile['ken_burns']
         
-        # تنفيذ الأمر
-        await self._run_ffmpeg(cmd)
+        segmented = settings.SEGMENTED_RENDER if segmented is None else segmented
+        if segmented:
+            return await self._assemble_segmented(
+                images, audio_files, output_path, subtitles, durations,
+                add_ken_burns, watermark_path, intro_path, monitor,
+                segment_dir, scene_numbers
+            )
+        
+        durations = [
+            (durations[i] if durations and i < len(durations) else None) or settings.VIDEO_DURATION_PER_IMAGE
+            for i in range(len(images))
+        ]
+        
+        # الحركة تُولَّد داخل العملية وتُبث إطاراتها بدل قائمة الصور و zoompan
+        renderer = self._motion_renderer() if add_ken_burns else None
+        
+        # الملفات الوسيطة في مساحة عمل خاصة بهذه العملية (تُحذف تلقائياً)
+        with render_workspace("assemble") as workspace:
+            frames = None
+            if renderer:
+                input_file = None
+                frames = renderer.sequence(list(zip(images, durations)))
+            else:
+                # إنشاء قائمة الصور مع المدد
+                input_file = await self._create_input_file(images, durations, workspace)
+            
+            # بناء أمر FFmpeg
+            cmd = self._build_ffmpeg_command(
+                input_file=input_file,
+                audio_files=audio_files,
+                output_path=output_path,
+                workspace=workspace,
+                subtitles=subtitles,
+                durations=durations,
+                add_ken_burns=add_ken_burns,
+                watermark_path=watermark_path,
+                intro_path=intro_path,
+                video_input=renderer.input_args() if renderer else None
+            )
+            
+            # تنفيذ الأمر
+            with stage_timer("assemble", "ffmpeg", scenes=len(images)):
+                await self._run_ffmpeg(cmd, monitor, progress_key="assemble", frames=frames)
+        
+        await self.build_previews(output_path, images[0] if images else None)
+        
+        return output_path
+    
+    async def _assemble_segmented(
+        self,
+        images: List[str],
+        audio_files: List[Optional[str]],
+        output_path: str,
+        subtitles: List[Dict] = None,
+        durations: List[float] = None,
+        ken_burns: bool = True,
+        watermark_path: str = "",
+        intro_path: str = "",
+        monitor: RenderMonitor = None,
+        segment_dir: str = None,
+        scene_numbers: List[int] = None
+    ) -> str:
+        """ترميز كل مشهد كمقطع مستقل بالتوازي ثم دمج المقاطع بـ concat -c copy"""
         
-        # حذف الملفات المؤقتة
-        self._cleanup(input_file)
+        # القوائم متوازية: المشهد i هو images[i] مع audio_files[i] و subtitles[i] و durations[i]
+        # segment_dir (من segment_dir(project_id)) تحفظ المقاطع لإعادة استخدامها عند تعديل مشهد،
+        # وإلا تُرمَّز في مساحة عمل تُحذف بعد الدمج
+        if segment_dir:
+            return await self._render_and_concat(
+                images, audio_files, output_path, segment_dir,
+                subtitles, durations, ken_burns, watermark_path, intro_path, monitor,
+                scene_numbers
+            )
+        with render_workspace("segments") as workspace:
+            return await self._render_and_concat(
+                images, audio_files, output_path, workspace,
+                subtitles, durations, ken_burns, watermark_path, intro_path, monitor,
+                scene_numbers
+            )
+    
+    async def _render_and_concat(
+        self,
+        images: List[str],
+        audio_files: List[Optional[str]],
+        output_path: str,
+        segment_dir: str,
+        subtitles: List[Dict] = None,
+        durations: List[float] = None,
+        ken_burns: bool = True,
+        watermark_path: str = "",
+        intro_path: str = "",
+        monitor: RenderMonitor = None,
+        scene_numbers: List[int] = None
+    ) -> str:
+        """ترميز المقاطع داخل segment_dir بالتوازي ثم دمجها"""
+        
+        def _at(items, i):
+            return items[i] if items and i < len(items) else None
+        
+        # التسمية نفسها في segment_path: المقدمة رقم 0 والمشهد برقمه (أو موضعه)
+        intro_output = self.segment_file(segment_dir, 0)
+        
+        tasks = [
+            asyncio.ensure_future(self.render_segment(
+                image_path=image,
+                audio_path=_at(audio_files, i),
+                output_path=self.segment_file(segment_dir, _at(scene_numbers, i) or i + 1),
+                duration=_at(durations, i),
+                subtitle_text=(_at(subtitles, i) or {}).get('text'),
+                ken_burns=ken_burns,
+                watermark_path=watermark_path,
+                monitor=monitor
+            ))
+            for i, image in enumerate(images)
+        ]
+        
+        if intro_path:
+            # المقدمة تُرمَّز مرة واحدة بنفس الإعدادات لتُدمج مع المقاطع دون إعادة ترميز
+            tasks.insert(0, asyncio.ensure_future(self.render_intro_segment(
+                intro_path, intro_output, monitor
+            )))
+        
+        try:
+            segments = await asyncio.gather(*tasks)
+        except BaseException:
+            # إيقاف بقية عمليات الترميز عند فشل أحدها
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+        
+        # التقدّم محسوب من ترميز المقاطع، والدمج نسخ سريع يُراقب للإلغاء فقط
+        output_path = await self.concat_segments(
+            segments, os.path.basename(output_path), monitor, report_progress=False
+        )
+        
+        await self.build_previews(output_path, images[0] if images else None)
         
         return output_path
     
-    async def _create_input_file(self, images: List[str]) -> str:
+    async def _create_input_file(
+        self,
+        images: List[str],
+        durations: List[float] = None,
+        workspace: str = "."
+    ) -> str:
         """إنشاء ملف الإدخال لـ FFmpeg"""
         
         lines = []
-        for img in images:
-            duration = settings.VIDEO_DURATION_PER_IMAGE
-            lines.append(f"file '{img}'")
+        for i, img in enumerate(images):
+            duration = durations[i] if durations else settings.VIDEO_DURATION_PER_IMAGE
+            lines.append(self._concat_entry(img))
             lines.append(f"duration {duration}")
         
         # تكرار آخر صورة
-        lines.append(f"file '{images[-1]}'")
+        lines.append(self._concat_entry(images[-1]))
         
         content = '\n'.join(lines)
-        input_file = "input_list.txt"
+        input_file = os.path.join(workspace, "input_list.txt")
         
         with open(input_file, 'w') as f:
             f.write(content)
@@ -71,56 +356,542 @@ class VideoEditorAgent:
         input_file: str,
         audio_files: List[str],
         output_path: str,
+        workspace: str = ".",
         subtitles: List[Dict] = None,
-        add_ken_burns: bool = True
+        durations: List[float] = None,
+        add_ken_burns: bool = True,
+        watermark_path: str = "",
+        intro_path: str = "",
+        video_input: list = None
     ) -> list:
-        """بناء أمر FFmpeg"""
+        """بناء أمر FFmpeg بمرور ترميز واحد (الملفات الوسيطة تُكتب في workspace)"""
         
-        cmd = ['ffmpeg', '-y', '-f', 'concat', '-safe', '0']
+        cmd = ['ffmpeg', '-y']
         
-        # ملف الإدخال
-        cmd.extend(['-i', input_file])
+        # ملف الإدخال (أو إطارات الحركة الجاهزة من stdin)
+        if video_input:
+            cmd.extend(video_input)
+        else:
+            cmd.extend(['-f', 'concat', '-safe', '0', '-i', input_file])
         
         # دمج ملفات الصوت
+        audio_files = [a for a in audio_files if a]
         if audio_files:
             # إنشاء ملف concat للصوت
-            audio_concat = self._concat_audio_files(audio_files)
-            cmd.extend(['-i', audio_concat])
+            audio_concat = self._concat_audio_files(audio_files, workspace)
+            cmd.extend(['-f', 'concat', '-safe', '0', '-i', audio_concat])
+        else:
+            cmd.extend(['-f', 'lavfi', '-i', self.SILENCE_SOURCE])
+        
+        # إضافة الترجمات بتوقيت تراكمي حسب مدة كل مشهد
+        subtitle_file = None
+        if subtitles:
+            timed, start = [], 0.0
+            for i, sub in enumerate(subtitles):
+                duration = durations[i] if durations and i < len(durations) else settings.VIDEO_DURATION_PER_IMAGE
+                timed.append({**sub, 'start_time': start, 'end_time': start + duration})
+                start += duration
+            subtitle_file = self._create_subtitle_file(timed, workspace)
+        
+        next_input = 2
+        watermark_input = intro_input = None
+        if watermark_path:
+            cmd.extend(['-i', watermark_path])
+            watermark_input, next_input = next_input, next_input + 1
+        if intro_path:
+            cmd.extend(['-i', intro_path])
+            intro_input = next_input
         
-        # إعدادات الفيديو
-        cmd.extend([
-            '-vf', f"scale={settings.VIDEO_WIDTH}:{settings.VIDEO_HEIGHT}:force_original_aspect_ratio=decrease,pad={settings.VIDEO_WIDTH}:{settings.VIDEO_HEIGHT}:(ow-iw)/2:(oh-ih)/2",
+        # Ken Burns عبر zoompan يحتاج عدد إطارات ثابتاً لكل صورة في قائمة concat
+        ken_burns_frames = 0
+        if add_ken_burns and not video_input and durations and len(set(durations)) == 1:
+            ken_burns_frames = int(durations[0] * self.profile['fps'])
+        
+        # كل النسخ من فك ترميز واحد للصور والصوت
+        outputs = self._output_specs(output_path)
+        graph, labels = self._build_filter_graph(
+            ken_burns_frames=ken_burns_frames,
+            subtitle_file=subtitle_file,
+            watermark_input=watermark_input,
+            intro_input=intro_input,
+            sizes=[(spec['width'], spec['height']) for spec, _ in outputs]
+        )
+        
+        cmd.extend(['-filter_complex', graph])
+        
+        # ملفات الإخراج
+        cmd.extend(self._output_args(outputs, labels, end_args=['-shortest']))
+        
+        return cmd
+    
+    def _video_chain(self, ken_burns_frames: int = 0, size: Tuple[int, int] = None) -> str:
+        """سلسلة التحجيم والحشو أو القص (و Ken Burns اختيارياً) حتى الصيغة الموحّدة للمقاطع"""
+        
+        width, height = size or (self.profile['width'], self.profile['height'])
+        fps = self.profile['fps']
+        
+        if abs(width / height - self.profile['width'] / self.profile['height']) > 0.01:
+            # نسخة بنسبة أبعاد مختلفة (مثل العمودية): الحشو يترك الصورة شريطاً صغيراً وسط إطار أسود،
+            # فتُكبَّر لتغطي الإطار ويُقص الزائد من المنتصف
+            chain = (
+                f"scale={width}:{height}:force_original_aspect_ratio=increase,"
+                f"crop={width}:{height},setsar=1"
+            )
+        else:
+            chain = (
+                f"scale={width}:{height}:force_original_aspect_ratio=decrease,"
+                f"pad={width}:{height}:(ow-iw)/2:(oh-ih)/2,setsar=1"
+            )
+        
+        if ken_burns_frames:
+            chain += (
+                f",zoompan=z='min(zoom+0.0015,1.5)':x='iw/2-(iw/zoom/2)':y='ih/2-(ih/zoom/2)'"
+                f":d={ken_burns_frames}:s={width}x{height}:fps={fps}"
+            )
+        
+        return chain + f",fps={fps},format=yuv420p"
+    
+    def _build_filter_graph(
+        self,
+        ken_burns_frames: int = 0,
+        subtitle_file: str = None,
+        watermark_input: int = None,
+        watermark_position: str = None,
+        intro_input: int = None,
+        sizes: List[Tuple[int, int]] = None
+    ) -> Tuple[str, List[Tuple[str, str]]]:
+        """بناء filter_complex واحد: تحجيم وحشو و Ken Burns وترجمة وعلامة مائية ومقدمة"""
+        
+        # الصورة في الإدخال 0 والصوت في الإدخال 1؛ يُرجع وسمَي (فيديو، صوت) لكل مقاس في sizes
+        # تُمرَّر إلى -map، والمقاسات تتفرع بـ split من فك ترميز واحد
+        sizes = sizes or [(self.profile['width'], self.profile['height'])]
+        filters = [f"[1:a]{self.AUDIO_FORMAT}[maina]"]
+        
+        videos = self._split("[0:v]", "src", len(sizes), filters)
+        audios = self._split("[maina]", "maina", len(sizes), filters, audio=True)
+        
+        if watermark_input is not None:
+            position = self.WATERMARK_POSITIONS.get(
+                watermark_position or settings.WATERMARK_POSITION,
+                self.WATERMARK_POSITIONS['bottomright']
+            )
+            marks = self._split(f"[{watermark_input}:v]", "mark", len(sizes), filters)
+        
+        if intro_input is not None:
+            # المقدمة قبل المحتوى (يُفترض أن تحتوي على مسار صوت)
+            filters.append(f"[{intro_input}:a]{self.AUDIO_FORMAT}[introa]")
+            intro_videos = self._split(f"[{intro_input}:v]", "introsrc", len(sizes), filters)
+            intro_audios = self._split("[introa]", "introa", len(sizes), filters, audio=True)
+        
+        outputs = []
+        for i, size in enumerate(sizes):
+            main = f"{videos[i]}{self._video_chain(ken_burns_frames, size)}"
+            if subtitle_file:
+                main += f",subtitles={subtitle_file}"
+            
+            filters.append(f"{main}[main{i}]")
+            video, audio = f"[main{i}]", audios[i]
+            
+            if watermark_input is not None:
+                filters.append(f"{video}{marks[i]}overlay={position}[marked{i}]")
+                video = f"[marked{i}]"
+            
+            if intro_input is not None:
+                filters.append(f"{intro_videos[i]}{self._video_chain(size=size)}[introv{i}]")
+                filters.append(
+                    f"[introv{i}]{intro_audios[i]}{video}{audio}concat=n=2:v=1:a=1[outv{i}][outa{i}]"
+                )
+                video, audio = f"[outv{i}]", f"[outa{i}]"
+            
+            outputs.append((video, audio))
+        
+        return ";".join(filters), outputs
+    
+    def _split(
+        self,
+        source: str,
+        prefix: str,
+        count: int,
+        filters: List[str],
+        audio: bool = False
+    ) -> List[str]:
+        """نسخة من المصدر لكل مخرج (split أو asplit)، والمصدر نفسه عند مخرج واحد"""
+        
+        if count == 1:
+            return [source]
+        
+        kind = "asplit" if audio else "split"
+        labels = [f"[{prefix}{i}]" for i in range(count)]
+        filters.append(f"{source}{kind}={count}{''.join(labels)}")
+        return labels
+    
+    def _output_args(
+        self,
+        outputs: List[Tuple[Dict, str]],
+        labels: List[Tuple[str, str]],
+        threads: int = None,
+        end_args: List[str] = ()
+    ) -> list:
+        """-map وإعدادات الترميز لكل ملف إخراج (الخيارات قبل المسار تخص ذلك الملف وحده)"""
+        
+        args = []
+        for (spec, path), (video, audio) in zip(outputs, labels):
+            args.extend(['-map', video, '-map', audio])
+            args.extend(self._encode_args(threads=threads, crf=spec.get('crf')))
+            args.extend([*end_args, path])
+        return args
+    
+    def _encode_args(self, threads: int = None, crf: int = None) -> list:
+        """إعدادات الترميز حسب ملف الترميز (متطابقة في كل المقاطع حتى يصح الدمج بـ -c copy)"""
+        
+        args = [
             '-c:v', 'libx264',
-            '-preset', 'fast',
-            '-crf', '23',
+            '-preset', self.profile['preset'],
+            '-crf', str(crf or self.profile['crf']),
             '-c:a', 'aac',
-            '-b:a', '128k'
-        ])
+            '-b:a', self.profile['audio_bitrate'],
+            '-ar', '44100',
+            '-ac', '2'
+        ]
         
-        # إضافة الترجمات
-        if subtitles:
-            subtitle_file = self._create_subtitle_file(subtitles)
-            cmd.extend(['-vf', f"subtitles={subtitle_file}"])
+        if self.profile['tune']:
+            args.extend(['-tune', self.profile['tune']])
         
-        # ملف الإخراج
-        cmd.append(output_path)
+        if threads:
+            args.extend(['-threads', str(threads)])
         
-        return cmd
+        return args
+    
+    def segment_dir(self, project_id: int) -> str:
+        """مجلد مقاطع المشروع المُرمَّزة (منفصل لكل ملف ترميز)"""
+        
+        segment_dir = os.path.join(
+            self.output_dir, f"project_{project_id}", "segments", self.profile['name']
+        )
+        os.makedirs(segment_dir, exist_ok=True)
+        
+        return segment_dir
+    
+    def segment_file(self, segment_dir: str, scene_number: int) -> str:
+        """اسم ملف المقطع داخل مجلده (0 للمقدمة)"""
+        return os.path.join(segment_dir, f"scene_{scene_number:04d}.mp4")
+    
+    def segment_path(self, project_id: int, scene_number: int) -> str:
+        """مسار مقطع المشهد المُرمَّز"""
+        return self.segment_file(self.segment_dir(project_id), scene_number)
+    
+    async def render_segment(
+        self,
+        image_path: str,
+        audio_path: str,
+        output_path: str,
+        duration: float = None,
+        subtitle_text: str = None,
+        ken_burns: bool = True,
+        watermark_path: str = None,
+        monitor: RenderMonitor = None
+    ) -> str:
+        """ترميز مقطع مشهد واحد (صورة + صوت) بإعدادات موحّدة تسمح بالدمج دون إعادة ترميز"""
+        
+        duration = duration or settings.VIDEO_DURATION_PER_IMAGE
+        has_audio = bool(audio_path) and os.path.exists(audio_path) and os.path.getsize(audio_path) > 0
+        watermark_path = settings.WATERMARK_PATH if watermark_path is None else watermark_path
+        fps = self.profile['fps']
+        
+        renderer = self._motion_renderer() if ken_burns and self.profile['ken_burns'] else None
+        frames = None
+        
+        if renderer:
+            # الإطارات تُولَّد داخل العملية وتُبث إلى stdin (مع نصف ثانية احتياطية لـ -shortest)
+            ken_burns_frames = 0
+            frames = renderer.frames(image_path, duration + 0.5)
+            cmd = ['ffmpeg', '-y', *renderer.input_args()]
+        elif ken_burns and self.profile['ken_burns']:
+            # zoompan يولّد الإطارات من صورة واحدة (مع ثانية احتياطية يقصّها -shortest أو -t)
+            ken_burns_frames = int((duration + 1) * fps)
+            cmd = ['ffmpeg', '-y', '-i', image_path]
+        else:
+            # الصورة تُقرأ بإطار واحد في الثانية ومرشح fps في السلسلة يكرر الإطارات حتى معدل الملف،
+            # فلا تُفك الصورة وتُحجَّم من جديد لكل إطار مُخرَج
+            ken_burns_frames = 0
+            cmd = [
+                'ffmpeg', '-y',
+                '-loop', '1', '-framerate', '1', '-i', image_path
+            ]
+        
+        if has_audio:
+            cmd.extend(['-i', audio_path])
+        else:
+            # صمت بنفس خصائص الصوت حتى تتطابق جميع المقاطع
+            cmd.extend(['-f', 'lavfi', '-i', self.SILENCE_SOURCE])
+        
+        if watermark_path:
+            cmd.extend(['-i', watermark_path])
+        
+        if has_audio:
+            end_args = ['-shortest']
+        else:
+            end_args = ['-t', str(duration)]
+        
+        # الكتابة في ملفات مؤقتة ثم إعادة التسمية حتى لا يبقى مقطع ناقص عند الفشل
+        outputs = self._output_specs(output_path)
+        partials = [(spec, self._partial_path(path)) for spec, path in outputs]
+        
+        try:
+            # عدد عمليات الترميز المتزامنة محدود لكل محرِّر
+            async with self._encode_slots:
+                with render_workspace("segment") as workspace:
+                    subtitle_file = None
+                    if subtitle_text:
+                        subtitle_file = self._write_srt(
+                            [{'start_time': 0, 'end_time': duration, 'text': subtitle_text}],
+                            os.path.join(workspace, "subtitles.srt")
+                        )
+                    
+                    graph, labels = self._build_filter_graph(
+                        ken_burns_frames=ken_burns_frames,
+                        subtitle_file=subtitle_file,
+                        watermark_input=2 if watermark_path else None,
+                        sizes=[(spec['width'], spec['height']) for spec, _ in outputs]
+                    )
+                    
+                    cmd.extend(['-filter_complex', graph])
+                    cmd.extend(self._output_args(
+                        partials, labels, threads=self.encode_threads, end_args=end_args
+                    ))
+                    
+                    with stage_timer("encode", "ffmpeg"):
+                        await self._run_ffmpeg(
+                            cmd, monitor, progress_key=output_path, frames=frames
+                        )
+            self._commit_outputs(partials, outputs)
+        finally:
+            self._cleanup(*(path for _, path in partials))
+        
+        return output_path
+    
+    async def render_intro_segment(
+        self,
+        intro_path: str,
+        output_path: str,
+        monitor: RenderMonitor = None
+    ) -> str:
+        """ترميز المقدمة بإعدادات المقاطع نفسها لتُدمج معها بـ -c copy"""
+        
+        outputs = self._output_specs(output_path)
+        partials = [(spec, self._partial_path(path)) for spec, path in outputs]
+        
+        filters = [f"[0:a]{self.AUDIO_FORMAT}[introa]"]
+        videos = self._split("[0:v]", "src", len(outputs), filters)
+        audios = self._split("[introa]", "introa", len(outputs), filters, audio=True)
+        for i, (spec, _) in enumerate(outputs):
+            filters.append(f"{videos[i]}{self._video_chain(size=(spec['width'], spec['height']))}[v{i}]")
+        
+        cmd = [
+            'ffmpeg', '-y',
+            '-i', intro_path,
+            '-filter_complex', ";".join(filters),
+            *self._output_args(
+                partials,
+                [(f"[v{i}]", audios[i]) for i in range(len(outputs))],
+                threads=self.encode_threads
+            )
+        ]
+        
+        try:
+            async with self._encode_slots:
+                with stage_timer("encode", "ffmpeg"):
+                    await self._run_ffmpeg(cmd, monitor)
+            self._commit_outputs(partials, outputs)
+        finally:
+            self._cleanup(*(path for _, path in partials))
+        
+        return output_path
+    
+    def preview_paths(self, output_path: str) -> Dict[str, str]:
+        """مسارات الصورة المصغّرة وورقة المعاينة وخريطتها بجانب الفيديو"""
+        
+        root, _ = os.path.splitext(output_path)
+        return {
+            'thumbnail': f"{root}_thumb.jpg",
+            'sprite': f"{root}_sprite.jpg",
+            'sprite_vtt': f"{root}_sprite.vtt"
+        }
+    
+    async def probe_duration(self, path: str) -> float:
+        """مدة ملف وسائط من بياناته الوصفية (ffprobe دون فك ترميز)"""
+        
+        process = await asyncio.create_subprocess_exec(
+            'ffprobe', '-v', 'error',
+            '-show_entries', 'format=duration',
+            '-of', 'default=noprint_wrappers=1:nokey=1',
+            path,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL
+        )
+        stdout, _ = await process.communicate()
+        
+        try:
+            return float(stdout.decode().strip())
+        except ValueError:
+            return 0.0
+    
+    def _sprite_grid(self, duration: float) -> Tuple[int, int, int]:
+        """(أعمدة، صفوف، عدد اللقطات) لشبكة لقطات تغطي duration"""
+        
+        count = max(1, math.ceil(duration / settings.PREVIEW_SPRITE_INTERVAL))
+        columns = min(settings.PREVIEW_SPRITE_COLUMNS, count)
+        return columns, math.ceil(count / columns), count
+    
+    async def build_previews(self, output_path: str, first_image: Optional[str]) -> Dict[str, str]:
+        """الصورة المصغّرة من صورة المشهد الأول مباشرة وورقة المعاينة من الفيديو النهائي"""
+        
+        paths = self.preview_paths(output_path)
+        created = {}
+        
+        try:
+            if first_image and os.path.exists(first_image):
+                await asyncio.to_thread(self._write_thumbnail, first_image, paths['thumbnail'])
+                created['thumbnail'] = paths['thumbnail']
+            
+            if self.preview_sprites and await self._write_sprite_sheet(
+                output_path, paths['sprite'], paths['sprite_vtt']
+            ):
+                created['sprite'] = paths['sprite']
+                created['sprite_vtt'] = paths['sprite_vtt']
+        except Exception as e:
+            # الصور المصغّرة إضافة، ولا تُفشل الفيديو نفسه
+            print(f"⚠️ تعذر إنشاء الصور المصغّرة: {e}")
+        
+        return created
+    
+    def _write_thumbnail(self, image_path: str, thumbnail_path: str):
+        """قص الصورة وتحجيمها بنسبة أبعاد الفيديو"""
+        
+        from PIL import Image, ImageOps
+        
+        width = settings.THUMBNAIL_WIDTH
+        height = round(width * self.profile['height'] / self.profile['width'])
+        
+        with Image.open(image_path) as image:
+            thumbnail = ImageOps.fit(image.convert("RGB"), (width, height), Image.LANCZOS)
+        thumbnail.save(thumbnail_path, "JPEG", quality=90)
+    
+    async def _write_sprite_sheet(self, video_path: str, sheet_path: str, vtt_path: str) -> bool:
+        """شبكة لقطات كل PREVIEW_SPRITE_INTERVAL ثانية من الفيديو النهائي مع خريطة WebVTT للتوقيتات"""
+        
+        # مرور فك ترميز واحد على الفيديو المكتمل بدل تفريع (split) في ترميز كل مقطع
+        duration = await self.probe_duration(video_path)
+        if duration <= 0:
+            return False
+        
+        interval = settings.PREVIEW_SPRITE_INTERVAL
+        columns, rows, count = self._sprite_grid(duration)
+        tile_w = settings.PREVIEW_SPRITE_WIDTH
+        tile_h = 2 * round(tile_w * self.profile['height'] / self.profile['width'] / 2)
+        
+        partial = self._partial_path(sheet_path)
+        cmd = [
+            'ffmpeg', '-y', '-i', video_path, '-an',
+            '-vf', f"fps=1/{interval},scale={tile_w}:{tile_h},tile={columns}x{rows}",
+            '-frames:v', '1', '-update', '1', '-q:v', '5', partial
+        ]
+        try:
+            with stage_timer("previews", "ffmpeg"):
+                await self._run_ffmpeg(cmd)
+            os.replace(partial, sheet_path)
+        finally:
+            self._cleanup(partial)
+        
+        name = os.path.basename(sheet_path)
+        lines = ["WEBVTT", ""]
+        for i in range(count):
+            x, y = (i % columns) * tile_w, (i // columns) * tile_h
+            lines.append(f"{self._vtt_time(i * interval)} --> {self._vtt_time(min((i + 1) * interval, duration))}")
+            lines.append(f"{name}#xywh={x},{y},{tile_w},{tile_h}")
+            lines.append("")
+        
+        with open(vtt_path, 'w', encoding='utf-8') as f:
+            f.write("\n".join(lines))
+        
+        return True
+    
+    def _vtt_time(self, seconds: float) -> str:
+        return self._format_time(seconds).replace(',', '.')
+    
+    def _partial_path(self, path: str) -> str:
+        """المسار المؤقت لمخرَج قبل اكتماله"""
+        
+        root, ext = os.path.splitext(path)
+        return f"{root}.part{ext}"
+    
+    def _commit_outputs(self, partials: List[Tuple[Dict, str]], outputs: List[Tuple[Dict, str]]):
+        """نقل المخرجات المكتملة إلى مساراتها النهائية (الأساسي أخيراً لأن وجوده يعني اكتمال الكل)"""
+        
+        for (_, partial), (_, path) in reversed(list(zip(partials, outputs))):
+            os.replace(partial, path)
+    
+    async def concat_segments(
+        self,
+        segments: List[str],
+        output_filename: str = None,
+        monitor: RenderMonitor = None,
+        report_progress: bool = True
+    ) -> str:
+        """دمج المقاطع الجاهزة بدون إعادة ترميز (concat demuxer + stream copy)"""
+        
+        output_filename = output_filename or f"video_{hash(str(segments))}.mp4"
+        output_path = os.path.join(self.output_dir, output_filename)
+        
+        # كل نسخة تُدمج من مقاطعها في نفس استدعاء FFmpeg (إدخال ومخرج لكل نسخة)
+        outputs = self._output_specs(output_path)
+        
+        with render_workspace("concat") as workspace:
+            cmd = ['ffmpeg', '-y']
+            for i, (spec, _) in enumerate(outputs):
+                list_file = os.path.join(workspace, f"segments_{i}.txt")
+                with open(list_file, 'w') as f:
+                    for segment in segments:
+                        if i:
+                            segment = self.rendition_path(segment, spec['name'])
+                        f.write(self._concat_entry(segment) + "\n")
+                cmd.extend(['-f', 'concat', '-safe', '0', '-i', list_file])
+            
+            for i, (_, path) in enumerate(outputs):
+                cmd.extend(['-map', f'{i}', '-c', 'copy', '-movflags', '+faststart', path])
+            
+            with stage_timer("concat", "ffmpeg", scenes=len(segments)):
+                await self._run_ffmpeg(
+                    cmd, monitor, progress_key="concat" if report_progress else None
+                )
+        
+        return output_path
     
-    def _concat_audio_files(self, audio_files: List[str]) -> str:
+    def _concat_entry(self, path: str) -> str:
+        """سطر ملف concat (المسار مطلق لأن ملف القائمة في مساحة العمل، مع تهريب ')"""
+        
+        escaped = os.path.abspath(path).replace("'", "'\\''")
+        return f"file '{escaped}'"
+    
+    def _concat_audio_files(self, audio_files: List[str], workspace: str = ".") -> str:
         """دمج ملفات الصوت"""
         
-        concat_file = "audio_concat.txt"
+        concat_file = os.path.join(workspace, "audio_concat.txt")
         
         with open(concat_file, 'w') as f:
             for audio in audio_files:
-                f.write(f"file '{audio}'\n")
+                f.write(self._concat_entry(audio) + "\n")
         
         return concat_file
     
-    def _create_subtitle_file(self, subtitles: List[Dict]) -> str:
+    def _create_subtitle_file(self, subtitles: List[Dict], workspace: str = ".") -> str:
         """إنشاء ملف الترجمات"""
         
+        return self._write_srt(subtitles, os.path.join(workspace, "subtitles.srt"))
+    
+    def _write_srt(self, subtitles: List[Dict], subtitle_file: str) -> str:
+        """كتابة ملف SRT"""
+        
         srt_content = ""
         
         for i, sub in enumerate(subtitles, 1):
@@ -130,8 +901,6 @@ class VideoEditorAgent:
             
             srt_content += f"{i}\n{start} --> {end}\n{text}\n\n"
         
-        subtitle_file = "subtitles.srt"
-        
         with open(subtitle_file, 'w', encoding='utf-8') as f:
             f.write(srt_content)
         
@@ -147,21 +916,120 @@ class VideoEditorAgent:
         
         return f"{hours:02d}:{minutes:02d}:{secs:02d},{millis:03d}"
     
-    async def _run_ffmpeg(self, cmd: list):
-        """تشغيل FFmpeg"""
+    async def _run_ffmpeg(
+        self,
+        cmd: list,
+        monitor: RenderMonitor = None,
+        progress_key: str = None,
+        frames: AsyncIterator[bytes] = None
+    ):
+        """تشغيل FFmpeg مع قراءة مخرجات -progress أثناء الترميز (تقدّم حي وإلغاء فوري)"""
+        
+        # كتل key=value على stdout عند كل تحديث، تنتهي كل كتلة بسطر progress=
+        cmd = [cmd[0], '-nostats', '-progress', 'pipe:1', *cmd[1:]]
         
-        process = await subprocess.create_subprocess_exec(
+        process = await asyncio.create_subprocess_exec(
             *cmd,
+            stdin=asyncio.subprocess.PIPE if frames is not None else asyncio.subprocess.DEVNULL,
             stdout=asyncio.subprocess.PIPE,
             stderr=asyncio.subprocess.PIPE
         )
         
-        stdout, stderr = await process.communicate()
+        # قراءة stderr بالتوازي حتى لا يمتلئ الأنبوب فيتوقف FFmpeg
+        stderr_tail = deque(maxlen=self.STDERR_TAIL_LINES)
+        stderr_task = asyncio.ensure_future(self._drain_stderr(process.stderr, stderr_tail))
+        helpers = [stderr_task]
+        if frames is not None:
+            helpers.append(asyncio.ensure_future(self._feed_frames(process, frames)))
+        
+        try:
+            block = {}
+            async for line in process.stdout:
+                key, _, value = line.decode('utf-8', errors='ignore').strip().partition('=')
+                block[key] = value
+                if key != 'progress':
+                    continue
+                
+                if monitor:
+                    if progress_key:
+                        await monitor.report(progress_key, self._progress_seconds(block))
+                    if await monitor.cancel_requested():
+                        raise RenderCancelled("تم إلغاء الترميز")
+                block = {}
+            
+            await process.wait()
+            await asyncio.gather(*helpers)
+        except BaseException:
+            # لا تترك FFmpeg يعمل بعد الإلغاء أو الفشل
+            for task in helpers:
+                task.cancel()
+            await self._stop_process(process)
+            raise
         
         if process.returncode != 0:
-            error_msg = stderr.decode('utf-8', errors='ignore')
+            error_msg = "".join(stderr_tail)
             raise Exception(f"فشل FFmpeg: {error_msg}")
     
+    async def _drain_stderr(self, stream: asyncio.StreamReader, tail: deque):
+        """قراءة stderr والاحتفاظ بآخر الأسطر فقط"""
+        
+        async for line in stream:
+            tail.append(line.decode('utf-8', errors='ignore'))
+    
+    async def _feed_frames(self, process: asyncio.subprocess.Process, frames: AsyncIterator[bytes]):
+        """كتابة الإطارات الخام إلى stdin مع احترام ضغط الأنبوب (drain)"""
+        
+        try:
+            async for chunk in frames:
+                process.stdin.write(chunk)
+                await process.stdin.drain()
+        except (BrokenPipeError, ConnectionResetError):
+            # FFmpeg أنهى القراءة مبكراً (-shortest)، ورمز الخروج يحدد النتيجة
+            pass
+        finally:
+            await frames.aclose()
+            process.stdin.close()
+    
+    def _motion_renderer(self):
+        """مولّد حركة Ken Burns داخل العملية بحجم المخرج الأساسي (None = zoompan)"""
+        
+        if settings.KEN_BURNS_RENDERER != "numpy":
+            return None
+        
+        # مع نواة واحدة يتنافس توليد الإطارات مع الترميز نفسه فيكون zoompan أسرع
+        if (os.cpu_count() or 1) <= 1:
+            return None
+        
+        from app.agents.ken_burns import KenBurnsRenderer
+        
+        # النسخ الإضافية تُحجَّم من هذه الإطارات في نفس الرسم البياني
+        return KenBurnsRenderer(self.profile['width'], self.profile['height'], self.profile['fps'])
+    
+    def _progress_seconds(self, block: Dict[str, str]) -> float:
+        """موضع الترميز بالثواني من كتلة -progress (out_time_ms بالميكروثانية أيضاً)"""
+        
+        for key in ('out_time_us', 'out_time_ms'):
+            try:
+                return max(0.0, int(block[key]) / 1_000_000)
+            except (KeyError, ValueError):
+                continue
+        return 0.0
+    
+    async def _stop_process(self, process: asyncio.subprocess.Process):
+        """إيقاف FFmpeg بلطف (SIGTERM) ثم قتله إن لم يخرج خلال المهلة"""
+        
+        if process.returncode is not None:
+            return
+        
+        try:
+            process.terminate()
+            await asyncio.wait_for(process.wait(), settings.FFMPEG_TERMINATE_GRACE_SECONDS)
+        except ProcessLookupError:
+            pass
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            process.kill()
+            await process.wait()
+    
     def _cleanup(self, *files):
         """حذف الملفات المؤقتة"""
         
@@ -177,15 +1045,19 @@ class VideoEditorAgent:
         intro_path: str,
         output_path: str
     ) -> str:
-        """إضافة مقدمة للفيديو"""
+        """إضافة مقدمة لفيديو مُركَّب مسبقاً (assemble_video يضيفها في نفس مرور الترميز)"""
         
         cmd = [
             'ffmpeg', '-y',
-            '-i', video_path,
             '-i', intro_path,
-            '-filter_complex', '[0:v][1:v] concat=n=2:v=1:a=1 [v] [a]',
+            '-i', video_path,
+            '-filter_complex',
+            f"[0:v]{self._video_chain()}[introv];[0:a]{self.AUDIO_FORMAT}[introa];"
+            f"[1:v]{self._video_chain()}[mainv];[1:a]{self.AUDIO_FORMAT}[maina];"
+            f"[introv][introa][mainv][maina]concat=n=2:v=1:a=1[v][a]",
             '-map', '[v]',
             '-map', '[a]',
+            *self._encode_args(),
             output_path
         ]
         
@@ -200,16 +1072,9 @@ class VideoEditorAgent:
         output_path: str,
         position: str = "bottomright"
     ) -> str:
-        """إضافة علامة مائية"""
-        
-        position_map = {
-            'topleft': '10:10',
-            'topright': 'W-w-10:10',
-            'bottomleft': '10:H-h-10',
-            'bottomright': 'W-w-10:H-h-10'
-        }
+        """إضافة علامة مائية لفيديو مُركَّب مسبقاً (assemble_video يضيفها في نفس مرور الترميز)"""
         
-        overlay = position_map.get(position, position_map['bottomright'])
+        overlay = self.WATERMARK_POSITIONS.get(position, self.WATERMARK_POSITIONS['bottomright'])
         
         cmd = [
             'ffmpeg', '-y',
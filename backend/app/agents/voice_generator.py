@@ -1,8 +1,12 @@
 """وكيل توليد الصوت"""
-import os
+import asyncio
+import shutil
 from typing import Optional
 from openai import AsyncOpenAI
-from .core.config import settings
+from app.core.config import settings
+from app.core.media_cache import audio_cache, cache_key
+from app.core.rate_limiter import get_limiter
+from app.core.metrics import stage_timer
 
 
 class VoiceGeneratorAgent:
@@ -10,8 +14,8 @@ class VoiceGeneratorAgent:
     
     def __init__(self):
         self.client = AsyncOpenAI(api_key=settings.OPENAI_API_KEY)
-        self.cache_dir = "generated_audio"
-        os.makedirs(self.cache_dir, exist_ok=True)
+        self.cache = audio_cache
+        self.cache_dir = audio_cache.cache_dir
     
     async def generate_voice(
         self,
@@ -27,26 +31,38 @@ class VoiceGeneratorAgent:
             else settings.ELEVENLABS_VOICE_ID
         )
         
+        key = cache_key(text, "elevenlabs", voice_id, settings.ELEVENLABS_MODEL_ID, "mp3_44100_128")
+        
+        cached_path = self.cache.get(key)
+        if cached_path:
+            return self._deliver(cached_path, output_path)
+        
         # استخدام ElevenLabs
         try:
             from elevenlabs import AsyncClient
             eleven_client = AsyncClient(api_key=settings.ELEVENLABS_API_KEY)
             
-            audio = await eleven_client.generate(
-                text=text,
-                voice_id=voice_id,
-                model_id=settings.ELEVENLABS_MODEL_ID,
-                output_format="mp3_44100_128"
-            )
+            async with get_limiter("elevenlabs"), stage_timer("tts", "elevenlabs"):
+                audio = await eleven_client.generate(
+                    text=text,
+                    voice_id=voice_id,
+                    model_id=settings.ELEVENLABS_MODEL_ID,
+                    output_format="mp3_44100_128"
+                )
             
-            # حفظ الملف
-            filename = f"voice_{hash(text)}.mp3"
-            filepath = os.path.join(self.cache_dir, filename)
+            # حفظ الملف في ذاكرة الأصوات
+            partial_path = self.cache.partial_path(key, ".mp3")
             
-            with open(filepath, 'wb') as f:
+            with open(partial_path, 'wb') as f:
                 f.write(audio)
             
-            return filepath
+            filepath = await self.cache.put_file(
+                key, partial_path, ".mp3",
+                meta={'provider': 'elevenlabs', 'voice': voice_id},
+                probe=True
+            )
+            
+            return self._deliver(filepath, output_path)
             
         except Exception as e:
             # Fallback to OpenAI TTS
@@ -60,41 +76,83 @@ class VoiceGeneratorAgent:
     ) -> str:
         """توليد الصوت باستخدام OpenAI TTS"""
         
-        response = await self.client.audio.speech.create(
-            model="tts-1",
-            voice="alloy",
-            input=text,
-            response_format="mp3"
+        key = cache_key(text, "openai", "tts-1", "alloy", "mp3")
+        
+        cached_path = self.cache.get(key)
+        if cached_path:
+            return self._deliver(cached_path, output_path)
+        
+        async with get_limiter("openai"), stage_timer("tts", "openai"):
+            response = await self.client.audio.speech.create(
+                model="tts-1",
+                voice="alloy",
+                input=text,
+                response_format="mp3"
+            )
+        
+        partial_path = self.cache.partial_path(key, ".mp3")
+        response.stream_to_file(partial_path)
+        
+        filepath = await self.cache.put_file(
+            key, partial_path, ".mp3",
+            meta={'provider': 'openai', 'voice': 'alloy'},
+            probe=True
         )
         
-        output_path = output_path or f"speech_{hash(text)}.mp3"
-        response.stream_to_file(output_path)
+        return self._deliver(filepath, output_path)
+    
+    def _deliver(self, cached_path: str, output_path: str = None) -> str:
+        """نسخ الملف المخزّن إلى المسار المطلوب إن حُدد"""
+        
+        if not output_path:
+            return cached_path
         
+        shutil.copyfile(cached_path, output_path)
         return output_path
     
+    async def generate_scene_voice(
+        self,
+        scene: dict,
+        language: str = "ar"
+    ) -> Optional[dict]:
+        """توليد صوت مشهد واحد"""
+        
+        text = scene.get('text', '')
+        if not text:
+            return None
+        
+        audio_path = await self.generate_voice(
+            text=text,
+            language=language
+        )
+        
+        # المدة المقيسة عند التخزين أدق من التقدير بعدد الكلمات
+        entry = self.cache.entry_for_path(audio_path)
+        duration = (entry or {}).get('meta', {}).get('duration') or self._estimate_duration(text)
+        
+        return {
+            'scene_number': scene.get('scene_number'),
+            'audio_path': audio_path,
+            'duration': duration
+        }
+    
     async def generate_scene_voices(
         self,
         scenes: list,
-        language: str = "ar"
+        language: str = "ar",
+        max_concurrency: int = 1
     ) -> list:
         """توليد صوت لكل مشهد"""
         
-        audio_files = []
+        semaphore = asyncio.Semaphore(max_concurrency)
         
-        for scene in scenes:
-            text = scene.get('text', '')
-            if text:
-                audio_path = await self.generate_voice(
-                    text=text,
-                    language=language
-                )
-                audio_files.append({
-                    'scene_number': scene.get('scene_number'),
-                    'audio_path': audio_path,
-                    'duration': self._estimate_duration(text)
-                })
+        async def _generate(scene):
+            async with semaphore:
+                return await self.generate_scene_voice(scene, language)
+        
+        results = await asyncio.gather(*[_generate(s) for s in scenes])
         
-        return audio_files
+        return [r for r in results if r]
     
     def _estimate_duration(self, text: str, wpm: int = 150) -> float:
         """تقدير مدة الصوت"""
@@ -1,13 +1,17 @@
 """نقاط النهاية للمشاريع"""
+import os
 from typing import List, Optional
 from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.core.config import settings
 from app.db.database import get_db
 from app.models.database import Project, Scene
-from app.schemas.project import ProjectCreate, ProjectUpdate, ProjectResponse, ProjectListResponse
+from app.schemas.project import (
+    ProjectCreate, ProjectUpdate, ProjectResponse, ProjectListResponse, SceneUpdate, SceneResponse
+)
 from app.services.project_service import ProjectService
-from app.workers.tasks import generate_video_task
+from app.workers.tasks import generate_video_task, rerender_scene_task
 
 
 router = APIRouter()
@@ -98,21 +102,44 @@ async def delete_project(
 async def start_generation(
     project_id: int,
     background_tasks: BackgroundTasks,
+    resume: bool = False,
     db: AsyncSession = Depends(get_db)
 ):
-    """بدء عملية التوليد"""
+    """بدء عملية التوليد (resume=true للاستئناف من آخر مرحلة مكتملة)"""
     service = ProjectService(db)
     project = await service.get_project(project_id)
     if not project:
         raise HTTPException(status_code=404, detail="المشروع غير موجود")
     
+    # مسح حالة الإلغاء السابقة حتى لا يتوقف التشغيل الجديد فوراً
+    if project.status == "cancelled":
+        await service.update_status(project_id, "pending", project.progress or 0)
+    
     # بدء مهمة التوليد
     background_tasks.add_task(
         generate_video_task.delay,
-        project_id=project_id
+        project_id=project_id,
+        resume=resume
     )
     
-    return {"message": "تم بدء عملية التوليد", "project_id": project_id}
+    return {"message": "تم بدء عملية التوليد", "project_id": project_id, "resume": resume}
+
+
+@router.post("/{project_id}/cancel")
+async def cancel_generation(
+    project_id: int,
+    db: AsyncSession = Depends(get_db)
+):
+    """إلغاء عملية التوليد الجارية (يتوقف الترميز خلال ثوانٍ)"""
+    service = ProjectService(db)
+    project = await service.get_project(project_id)
+    if not project:
+        raise HTTPException(status_code=404, detail="المشروع غير موجود")
+    
+    if not await service.cancel_project(project_id):
+        raise HTTPException(status_code=409, detail="المشروع منتهٍ ولا يمكن إلغاؤه")
+    
+    return {"message": "تم طلب إلغاء المشروع", "project_id": project_id}
 
 
 @router.get("/{project_id}/scenes")
@@ -124,3 +151,63 @@ async def get_project_scenes(
     service = ProjectService(db)
     scenes = await service.get_project_scenes(project_id)
     return {"scenes": scenes}
+
+
+def _checked_scene_image(path: str) -> str:
+    """مسار صورة المشهد المرسل من العميل: داخل ذاكرة الصور وصورة صالحة فعلاً، وإلا 422"""
+    
+    from PIL import Image
+    
+    # المسار يُمرَّر لاحقاً إلى FFmpeg و Pillow، فلا يُقبل أي ملف آخر يستطيع العامل قراءته
+    root = os.path.realpath(settings.IMAGE_CACHE_DIR)
+    real_path = os.path.realpath(os.path.join(root, path))
+    if os.path.commonpath([root, real_path]) != root or not os.path.isfile(real_path):
+        raise HTTPException(status_code=422, detail="الصورة يجب أن تكون من ذاكرة الصور المولّدة")
+    
+    try:
+        with Image.open(real_path) as image:
+            image.verify()
+    except Exception:
+        raise HTTPException(status_code=422, detail="الملف ليس صورة صالحة")
+    
+    return real_path
+
+
+@router.patch("/{project_id}/scenes/{scene_number}", response_model=SceneResponse)
+async def update_scene(
+    project_id: int,
+    scene_number: int,
+    scene_data: SceneUpdate,
+    background_tasks: BackgroundTasks,
+    db: AsyncSession = Depends(get_db)
+):
+    """تعديل مشهد وإعادة ترميز مقطعه فقط ثم دمجه مع بقية المقاطع"""
+    service = ProjectService(db)
+    project = await service.get_project(project_id)
+    if not project:
+        raise HTTPException(status_code=404, detail="المشروع غير موجود")
+    
+    if scene_data.image_path:
+        scene_data.image_path = _checked_scene_image(scene_data.image_path)
+    
+    # حجز المشروع بعبارة UPDATE مشروطة واحدة: طلبان متزامنان لا يمرّان معاً
+    # (وتُمسح حالة الإلغاء السابقة في نفس الكتابة)
+    previous_status = project.status
+    claimed = await service.update_fields(
+        project_id, unless_status=ProjectService.BUSY_STATUSES, status="editing"
+    )
+    if not claimed:
+        raise HTTPException(status_code=409, detail="المشروع قيد التوليد حالياً")
+    
+    scene = await service.update_scene(project_id, scene_number, scene_data)
+    if not scene:
+        await service.update_fields(project_id, status=previous_status)
+        raise HTTPException(status_code=404, detail="المشهد غير موجود")
+    
+    background_tasks.add_task(
+        rerender_scene_task.delay,
+        project_id=project_id,
+        scene_number=scene_number
+    )
+    
+    return scene
@@ -2,7 +2,7 @@
 import os
 from functools import lru_cache
 from pathlib import Path
-from typing import List
+from typing import Dict, List
 
 from pydantic import Field
 from pydantic_settings import BaseSettings
@@ -38,6 +38,8 @@ class Settings(BaseSettings):
     # إعدادات OpenAI
     OPENAI_MODEL: str = "gpt-4-turbo-preview"
     OPENAI_MAX_TOKENS: int = 4000
+    LONG_SCRIPT_MIN_MINUTES: int = 10  # من هذه المدة يُكتب مخطط أولاً ثم أقسامه بالتوازي (0 = تعطيل)
+    LONG_SCRIPT_SECTION_MINUTES: int = 3  # مدة القسم الواحد في السكريبت الطويل تقريباً
     
     # إعدادات DALL-E
     DALL_E_MODEL: str = "dall-e-3"
@@ -55,6 +57,122 @@ class Settings(BaseSettings):
     VIDEO_FPS: int = 30
     VIDEO_DURATION_PER_IMAGE: int = 5  # ثوانٍ لكل صورة
     
+    # ملفات تعريف الترميز (تُختار لكل مشروع عبر عمود quality)، والقيم الغائبة تأخذ إعدادات الفيديو أعلاه
+    DEFAULT_RENDER_PROFILE: str = "standard"
+    RENDER_PROFILES: Dict[str, Dict] = Field(default={
+        "draft": {
+            "width": 854, "height": 480, "fps": 24,
+            "preset": "ultrafast", "tune": "fastdecode", "crf": 30,
+            "audio_bitrate": "96k", "ken_burns": False
+        },
+        "standard": {
+            "preset": "fast", "tune": "", "crf": 23,
+            "audio_bitrate": "128k", "ken_burns": True
+        },
+        "final": {
+            "width": 1920, "height": 1080, "fps": 30,
+            "preset": "slow", "tune": "film", "crf": 18,
+            "audio_bitrate": "192k", "ken_burns": True
+        },
+    })
+    RENDER_PROFILE_ALIASES: Dict[str, str] = Field(default={
+        "preview": "draft",
+        "480p": "draft",
+        "1080p": "standard",
+        "high": "final",
+    })
+    
+    # حركة Ken Burns: zoompan = فلتر FFmpeg، numpy = قص وتكبير داخل العملية وبث الإطارات إلى FFmpeg
+    # (zoompan الافتراضي: numpy أبطأ منه في benchmarks/ken_burns_benchmark، ولا يُستخدم مع نواة واحدة)
+    KEN_BURNS_RENDERER: str = "zoompan"
+    KEN_BURNS_ZOOM: float = 1.2  # أقصى تكبير خلال المشهد
+    # خيوط توليد الإطارات المشتركة بين كل المقاطع (افتراضياً عدد الأنوية)
+    KEN_BURNS_WORKERS: int = Field(default_factory=lambda: os.cpu_count() or 1)
+    KEN_BURNS_CHUNK_FRAMES: int = 12  # إطارات كل دفعة تُرسل إلى FFmpeg
+    
+    # الصورة المصغّرة من صورة المشهد الأول، وورقة معاينة التنقل (sprite) بمرور واحد على الفيديو النهائي
+    PREVIEW_SPRITES: bool = True
+    PREVIEW_SPRITE_INTERVAL: float = 2.0  # ثوانٍ بين لقطات ورقة المعاينة
+    PREVIEW_SPRITE_WIDTH: int = 160  # عرض اللقطة الواحدة
+    PREVIEW_SPRITE_COLUMNS: int = 10
+    THUMBNAIL_WIDTH: int = 1280
+    
+    # نسخ إضافية بمقاسات أخرى تُرمَّز في نفس مرور FFmpeg (split) بجانب مخرج ملف الترميز
+    RENDITIONS: Dict[str, Dict] = Field(default={
+        "1080p": {"width": 1920, "height": 1080},
+        "720p": {"width": 1280, "height": 720, "crf": 24},
+        "vertical": {"width": 1080, "height": 1920},
+    })
+    OUTPUT_RENDITIONS: List[str] = []  # النسخ المطلوبة لكل مشروع (فارغ = المخرج الأساسي فقط)
+    
+    WATERMARK_PATH: str = ""  # صورة العلامة المائية (فارغ = بدون)
+    WATERMARK_POSITION: str = "bottomright"
+    INTRO_VIDEO_PATH: str = ""  # فيديو المقدمة (فارغ = بدون)
+    
+    # إعدادات خط الإنتاج
+    IMAGE_CONCURRENCY: int = 4  # أقصى عدد صور تُولَّد في نفس الوقت
+    VOICE_CONCURRENCY: int = 4  # أقصى عدد مقاطع صوتية تُولَّد في نفس الوقت
+    STREAM_SCRIPT: bool = True  # بث السكريبت وبدء صور وأصوات كل مشهد فور اكتمال نصه
+    STREAMING_PIPELINE: bool = False  # ترميز كل مشهد فور جاهزية صورته وصوته
+    SEGMENTED_RENDER: bool = True  # ترميز مقطع لكل مشهد بالتوازي ثم الدمج بدون إعادة ترميز
+    SEGMENT_ENCODE_CONCURRENCY: int = 0  # أقصى عدد مقاطع تُرمَّز في نفس الوقت (0 = الأنوية / الخيوط)
+    SEGMENT_ENCODE_THREADS: int = 4  # خيوط x264 لكل عملية ترميز
+    RENDER_WORKSPACE_DIR: str = ""  # مجلد مساحات العمل المؤقتة (فارغ = مجلد النظام المؤقت)
+    RENDER_WORKSPACE_TMPFS: bool = False  # استخدام /dev/shm عند توفره إذا لم يُحدد المجلد
+    PROGRESS_MIN_INTERVAL_SECONDS: float = 2.0  # أقل فاصل بين كتابات التقدّم بنفس الحالة
+    RENDER_CANCEL_POLL_SECONDS: float = 2.0  # الفاصل بين فحوص طلب الإلغاء أثناء الترميز
+    FFMPEG_TERMINATE_GRACE_SECONDS: float = 5.0  # مهلة خروج FFmpeg بعد SIGTERM قبل قتله
+    
+    # إعدادات التخزين المؤقت
+    IMAGE_CACHE_DIR: str = "generated_images"
+    IMAGE_CACHE_MAX_MB: int = 2048  # الحد الأقصى لحجم ذاكرة الصور (إخلاء LRU)
+    AUDIO_CACHE_DIR: str = "generated_audio"
+    AUDIO_CACHE_MAX_MB: int = 1024  # الحد الأقصى لحجم ذاكرة المقاطع الصوتية
+    SCRIPT_CACHE_DIR: str = "generated_scripts"
+    SCRIPT_CACHE_TTL_SECONDS: int = 24 * 60 * 60  # صلاحية السكريبت المخزّن (0 = تعطيل)
+    SCRIPT_CACHE_LOCK_SECONDS: int = 10 * 60  # بعدها يُعتبر قفل توليد السكريبت متروكاً (عملية توقفت)
+    
+    # حدود المزوّدين المشتركة على مستوى العملية (طلبات متزامنة + طلبات في الدقيقة، 0 = بلا حد)
+    DEFAULT_PROVIDER_MAX_IN_FLIGHT: int = 4
+    PROVIDER_LIMITS: Dict[str, Dict[str, int]] = Field(default={
+        "dall-e": {"max_in_flight": 4, "rpm": 15},
+        "huggingface": {"max_in_flight": 2, "rpm": 30},
+        "local-sd": {"max_in_flight": 1, "rpm": 0},
+        "openai": {"max_in_flight": 8, "rpm": 500},
+        "elevenlabs": {"max_in_flight": 2, "rpm": 100},
+        "edge-tts": {"max_in_flight": 4, "rpm": 0},
+        "groq": {"max_in_flight": 4, "rpm": 30},
+        "ollama": {"max_in_flight": 1, "rpm": 0},
+        "gemini": {"max_in_flight": 2, "rpm": 15},
+    })
+    
+    # صحة مزوّدي النصوص: نافذة متحركة وقاطع دائرة لكل مزوّد، وطلب تحوّط اختياري عند البطء
+    PROVIDER_HEALTH_WINDOW: int = 20  # عدد آخر الطلبات المحسوبة لكل مزوّد
+    PROVIDER_FAILURE_RATE: float = 0.5  # معدل الأخطاء الذي يفتح الدائرة
+    PROVIDER_MIN_REQUESTS: int = 4  # أقل عدد طلبات قبل الحكم على المزوّد
+    PROVIDER_OPEN_SECONDS: float = 60.0  # مدة استبعاد المزوّد قبل طلب تجريبي
+    LLM_HEDGE_REQUESTS: bool = False  # طلب ثانٍ للمزوّد الاحتياطي عند تجاوز p90 (يضاعف الاستهلاك)
+    LLM_HEDGE_MIN_SECONDS: float = 5.0  # أقل انتظار قبل طلب التحوّط
+    
+    # مجمّع اتصالات HTTP
+    HTTP_POOL_MAX_CONNECTIONS: int = 100
+    HTTP_POOL_MAX_PER_HOST: int = 20
+    HTTP_KEEPALIVE_SECONDS: int = 60
+    HTTP_CONNECT_TIMEOUT_SECONDS: int = 10
+    HTTP_TIMEOUT_SECONDS: int = 120
+    HTTP_PROVIDER_TIMEOUTS: Dict[str, int] = Field(default={
+        "ollama": 600,  # النماذج المحلية قد تستغرق وقتاً طويلاً
+        "huggingface": 180,
+    })
+    
+    # المقاييس (تُجمَّع عبر Redis بين عمال Celery والخادم وتُصدَّر على /api/metrics)
+    METRICS_SHARED: bool = True
+    METRICS_FLUSH_SECONDS: int = 10
+    METRICS_BUCKETS: List[float] = Field(default=[
+        0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600
+    ])
+    PERSIST_STAGE_TIMINGS: bool = True  # حفظ زمن كل مرحلة في جدول api_logs
+    
     # إعدادات YouTube
     YOUTUBE_DEFAULT_CATEGORY: str = "22"  # People & Blogs
     YOUTUBE_DEFAULT_PRIVACY: str = "public"
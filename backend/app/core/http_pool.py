@@ -0,0 +1,84 @@
+"""مجمّع اتصالات HTTP طويلة العمر لكل مزوّد (keep-alive وحدود وأزمنة مهلة قابلة للضبط)"""
+import asyncio
+import weakref
+from typing import Dict
+
+from app.core.config import settings
+
+
+# الجلسات مرتبطة بحلقة الأحداث، لذا تُحفظ لكل حلقة على حدة
+# (FastAPI حلقة واحدة طوال عمر الخادم، ومهام Celery حلقة لكل مهمة)
+_sessions = weakref.WeakKeyDictionary()
+_httpx_clients = weakref.WeakKeyDictionary()
+
+
+def _timeout_for(name: str) -> float:
+    return settings.HTTP_PROVIDER_TIMEOUTS.get(name, settings.HTTP_TIMEOUT_SECONDS)
+
+
+def get_session(name: str):
+    """جلسة aiohttp مشتركة للمزوّد في الحلقة الحالية"""
+    
+    import aiohttp
+    
+    loop = asyncio.get_running_loop()
+    sessions: Dict[str, aiohttp.ClientSession] = _sessions.setdefault(loop, {})
+    
+    session = sessions.get(name)
+    if session is None or session.closed:
+        connector = aiohttp.TCPConnector(
+            limit=settings.HTTP_POOL_MAX_CONNECTIONS,
+            limit_per_host=settings.HTTP_POOL_MAX_PER_HOST,
+            keepalive_timeout=settings.HTTP_KEEPALIVE_SECONDS,
+            ttl_dns_cache=300
+        )
+        session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(
+                total=_timeout_for(name),
+                connect=settings.HTTP_CONNECT_TIMEOUT_SECONDS
+            )
+        )
+        sessions[name] = session
+    
+    return session
+
+
+def get_httpx_client(name: str = "default"):
+    """عميل httpx مشترك في الحلقة الحالية"""
+    
+    import httpx
+    
+    loop = asyncio.get_running_loop()
+    clients: Dict[str, httpx.AsyncClient] = _httpx_clients.setdefault(loop, {})
+    
+    client = clients.get(name)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=settings.HTTP_POOL_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.HTTP_POOL_MAX_PER_HOST,
+                keepalive_expiry=settings.HTTP_KEEPALIVE_SECONDS
+            ),
+            timeout=httpx.Timeout(
+                _timeout_for(name),
+                connect=settings.HTTP_CONNECT_TIMEOUT_SECONDS
+            )
+        )
+        clients[name] = client
+    
+    return client
+
+
+async def close_http_pools():
+    """إغلاق جميع اتصالات الحلقة الحالية (عند إيقاف الخادم أو نهاية مهمة العامل)"""
+    
+    loop = asyncio.get_running_loop()
+    
+    for session in _sessions.pop(loop, {}).values():
+        if not session.closed:
+            await session.close()
+    
+    for client in _httpx_clients.pop(loop, {}).values():
+        if not client.is_closed:
+            await client.aclose()
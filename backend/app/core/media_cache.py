@@ -0,0 +1,251 @@
+"""ذاكرة تخزين مؤقت للوسائط على القرص (مفاتيح حسب المحتوى + إخلاء LRU بحد للحجم)"""
+import asyncio
+import glob
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Dict, Optional
+
+from app.core.config import settings
+
+
+def cache_key(*parts) -> str:
+    """مفتاح ثابت بين العمليات (بخلاف hash() العشوائي لكل عملية)"""
+    
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(str(part).encode('utf-8'))
+        digest.update(b'\x00')
+    return digest.hexdigest()
+
+
+async def probe_media(path: str) -> Dict:
+    """قياس مدة الملف وترميزه عبر ffprobe (قاموس فارغ إن تعذر ذلك)"""
+    
+    try:
+        process = await asyncio.create_subprocess_exec(
+            'ffprobe', '-v', 'error',
+            '-show_entries', 'format=duration:stream=codec_name',
+            '-of', 'json',
+            path,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE
+        )
+        stdout, _ = await process.communicate()
+        info = json.loads(stdout or b'{}')
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+    
+    result = {}
+    
+    duration = info.get('format', {}).get('duration')
+    if duration:
+        result['duration'] = float(duration)
+    
+    streams = info.get('streams') or []
+    if streams and streams[0].get('codec_name'):
+        result['codec'] = streams[0]['codec_name']
+    
+    return result
+
+
+class MediaCache:
+    """مخزن ملفات وسائط مع فهرس JSON وحد أقصى للحجم وإخلاء الأقدم استخداماً"""
+    
+    INDEX_FILE = "index.json"
+    INDEX_SAVE_INTERVAL = 5  # ثوانٍ بين حفظ الفهرس بعد القراءات
+    
+    def __init__(self, cache_dir: str, max_size_mb: int):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_size_mb * 1024 * 1024
+        os.makedirs(self.cache_dir, exist_ok=True)
+        
+        self._lock = threading.Lock()
+        self._index_path = os.path.join(self.cache_dir, self.INDEX_FILE)
+        self._index: Dict[str, Dict] = self._load_index()
+        self._last_save = 0.0
+    
+    def path_for(self, key: str, ext: str) -> str:
+        """مسار الملف الخاص بالمفتاح"""
+        return os.path.join(self.cache_dir, f"{key}{ext}")
+    
+    def partial_path(self, key: str, ext: str) -> str:
+        """مسار مؤقت للكتابة قبل التسجيل (لا يُعامل كملف مخزّن)"""
+        return f"{self.path_for(key, ext)}.part"
+    
+    def get(self, key: str) -> Optional[str]:
+        """إرجاع مسار الملف المخزّن أو None"""
+        
+        entry = self.get_entry(key)
+        return entry['path'] if entry else None
+    
+    def entry_for_path(self, path: str) -> Optional[Dict]:
+        """سجل الملف انطلاقاً من مساره داخل الذاكرة"""
+        
+        if os.path.dirname(os.path.abspath(path)) != os.path.abspath(self.cache_dir):
+            return None
+        return self.get_entry(os.path.splitext(os.path.basename(path))[0])
+    
+    def get_entry(self, key: str) -> Optional[Dict]:
+        """إرجاع سجل المفتاح (المسار والبيانات الوصفية) وتحديث وقت آخر استخدام"""
+        
+        with self._lock:
+            entry = self._index.get(key) or self._adopt(key)
+            if not entry:
+                return None
+            
+            path = os.path.join(self.cache_dir, entry['file'])
+            if not os.path.exists(path):
+                # حُذف الملف من خارج الفهرس
+                self._index.pop(key, None)
+                self._save_index()
+                return None
+            
+            entry['last_access'] = time.time()
+            if time.time() - self._last_save > self.INDEX_SAVE_INTERVAL:
+                self._save_index()
+            
+            return {**entry, 'path': path}
+    
+    def put_bytes(self, key: str, data: bytes, ext: str, meta: Dict = None) -> str:
+        """تخزين محتوى جديد وإرجاع مساره"""
+        
+        path = self.path_for(key, ext)
+        partial_path = f"{path}.part"
+        
+        with open(partial_path, 'wb') as f:
+            f.write(data)
+        os.replace(partial_path, path)
+        
+        return self.add(key, path, meta)
+    
+    async def put_file(
+        self,
+        key: str,
+        partial_path: str,
+        ext: str,
+        meta: Dict = None,
+        probe: bool = False
+    ) -> str:
+        """نقل ملف مكتمل من partial_path وتسجيله (مع قياس مدته وترميزه عند probe)"""
+        
+        meta = dict(meta or {})
+        if probe:
+            meta.update(await probe_media(partial_path))
+        
+        path = self.path_for(key, ext)
+        os.replace(partial_path, path)
+        
+        return self.add(key, path, meta)
+    
+    def add(self, key: str, path: str, meta: Dict = None) -> str:
+        """تسجيل ملف مكتوب مسبقاً في path_for(key, ext)"""
+        
+        with self._lock:
+            self._merge_disk_index()
+            self._index[key] = {
+                'file': os.path.basename(path),
+                'size': os.path.getsize(path),
+                'last_access': time.time(),
+                'meta': meta or {}
+            }
+            self._evict_locked()
+            self._save_index()
+        
+        return path
+    
+    def evict(self) -> int:
+        """إخلاء الملفات الأقدم استخداماً حتى يعود الحجم تحت الحد، وإرجاع عدد المحذوف"""
+        
+        with self._lock:
+            self._merge_disk_index()
+            removed = self._evict_locked()
+            self._save_index()
+        return removed
+    
+    def _evict_locked(self) -> int:
+        total = sum(entry['size'] for entry in self._index.values())
+        removed = 0
+        
+        for key, entry in sorted(self._index.items(), key=lambda item: item[1]['last_access']):
+            if total <= self.max_bytes:
+                break
+            
+            try:
+                os.remove(os.path.join(self.cache_dir, entry['file']))
+            except FileNotFoundError:
+                pass
+            
+            total -= entry['size']
+            del self._index[key]
+            removed += 1
+        
+        return removed
+    
+    def _adopt(self, key: str) -> Optional[Dict]:
+        """تسجيل ملف كتبته عملية أخرى ولم يصل بعد إلى فهرس هذه العملية"""
+        
+        for path in glob.glob(os.path.join(self.cache_dir, f"{key}.*")):
+            if path.endswith('.part'):
+                continue
+            entry = {
+                'file': os.path.basename(path),
+                'size': os.path.getsize(path),
+                'last_access': time.time(),
+                'meta': {}
+            }
+            self._index[key] = entry
+            return entry
+        
+        return None
+    
+    def _load_index(self) -> Dict[str, Dict]:
+        try:
+            with open(self._index_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return self._rebuild_index()
+    
+    def _merge_disk_index(self):
+        """دمج ما كتبته العمليات الأخرى في الفهرس قبل الإخلاء والحفظ"""
+        
+        try:
+            with open(self._index_path, 'r', encoding='utf-8') as f:
+                disk_index = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return
+        
+        for key, entry in disk_index.items():
+            current = self._index.get(key)
+            if not current or entry['last_access'] > current['last_access']:
+                self._index[key] = entry
+    
+    def _rebuild_index(self) -> Dict[str, Dict]:
+        """إعادة بناء الفهرس من الملفات الموجودة"""
+        
+        index = {}
+        for filename in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, filename)
+            if filename == self.INDEX_FILE or filename.endswith('.part') or not os.path.isfile(path):
+                continue
+            key = os.path.splitext(filename)[0]
+            index[key] = {
+                'file': filename,
+                'size': os.path.getsize(path),
+                'last_access': os.path.getmtime(path),
+                'meta': {}
+            }
+        return index
+    
+    def _save_index(self):
+        partial_path = f"{self._index_path}.{os.getpid()}.part"
+        with open(partial_path, 'w', encoding='utf-8') as f:
+            json.dump(self._index, f, ensure_ascii=False)
+        os.replace(partial_path, self._index_path)
+        self._last_save = time.time()
+
+
+image_cache = MediaCache(settings.IMAGE_CACHE_DIR, settings.IMAGE_CACHE_MAX_MB)
+audio_cache = MediaCache(settings.AUDIO_CACHE_DIR, settings.AUDIO_CACHE_MAX_MB)
@@ -0,0 +1,281 @@
+"""قياس زمن مراحل خط الإنتاج واستدعاءات المزوّدين وتصديرها بصيغة Prometheus النصية"""
+import asyncio
+import contextvars
+import json
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from app.core.config import settings
+
+
+STAGE_DURATION = "autocreator_stage_duration_seconds"
+STAGE_TOTAL = "autocreator_stage_total"
+
+FAMILIES = {
+    STAGE_DURATION: ("histogram", "Duration of pipeline stages and provider calls in seconds"),
+    STAGE_TOTAL: ("counter", "Pipeline stages and provider calls by outcome"),
+}
+
+# سجلات التشغيل الحالي (تُورَث إلى المهام الفرعية التي ينشئها gather)
+_current_trace: contextvars.ContextVar = contextvars.ContextVar("stage_trace", default=None)
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class MetricsRegistry:
+    """عدّادات ومدرّجات تكرارية على مستوى العملية، تُجمَّع عبر Redis بين العمال والخادم"""
+    
+    REDIS_KEY = "autocreator:metrics"
+    
+    def __init__(
+        self,
+        buckets: List[float],
+        redis_url: str = "",
+        flush_interval: float = 10.0
+    ):
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        self.redis_url = redis_url
+        self.flush_interval = flush_interval
+        
+        self._lock = threading.Lock()
+        # قيم السلاسل محلياً، والزيادات التي لم تُرسل بعد إلى Redis
+        self._series: Dict[Tuple[str, str], float] = defaultdict(float)
+        self._pending: Dict[Tuple[str, str], float] = defaultdict(float)
+        self._last_flush = time.monotonic()
+        self._redis = None
+        self._redis_retry_at = 0.0
+    
+    def observe_stage(
+        self,
+        stage: str,
+        provider: str,
+        seconds: float,
+        status: str = "ok"
+    ):
+        """تسجيل زمن مرحلة أو استدعاء مزوّد"""
+        
+        labels = {"stage": stage, "provider": provider}
+        
+        with self._lock:
+            # كل الحدود تُسجَّل (ولو بصفر) حتى يكتمل المدرّج عند التصدير
+            for bound in self.buckets:
+                self._inc(
+                    f"{STAGE_DURATION}_bucket",
+                    {**labels, "le": _format_value(bound)},
+                    1.0 if seconds <= bound else 0.0
+                )
+            self._inc(f"{STAGE_DURATION}_sum", labels, seconds)
+            self._inc(f"{STAGE_DURATION}_count", labels)
+            self._inc(STAGE_TOTAL, {**labels, "status": status})
+            
+            flush_due = self.redis_url and time.monotonic() - self._last_flush >= self.flush_interval
+            if flush_due:
+                # حتى لا تُجدوَل دفعة أخرى قبل أن تبدأ هذه
+                self._last_flush = time.monotonic()
+        
+        if flush_due:
+            self._flush_in_background()
+    
+    def _flush_in_background(self):
+        """الإرسال إلى Redis اتصال شبكي متزامن، فلا يُنفَّذ على خيط حلقة الأحداث"""
+        
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # خيط عادي خارج أي حلقة: لا شيء يُحجب
+            self.flush()
+            return
+        
+        loop.run_in_executor(None, self.flush)
+    
+    def flush(self):
+        """إرسال الزيادات المتراكمة إلى Redis دفعة واحدة"""
+        
+        if not self.redis_url:
+            return
+        
+        with self._lock:
+            pending, self._pending = self._pending, defaultdict(float)
+            self._last_flush = time.monotonic()
+        
+        if not pending:
+            return
+        
+        client = self._client()
+        try:
+            if client is None:
+                raise ConnectionError("Redis unavailable")
+            pipe = client.pipeline(transaction=False)
+            for (name, labels), value in pending.items():
+                pipe.hincrbyfloat(self.REDIS_KEY, f"{name}|{labels}", value)
+            pipe.execute()
+        except Exception:
+            # إعادة الزيادات لمحاولة لاحقة
+            with self._lock:
+                for series, value in pending.items():
+                    self._pending[series] += value
+            self._redis_failed()
+    
+    def render(self) -> str:
+        """تصدير جميع السلاسل بصيغة Prometheus النصية"""
+        
+        self.flush()
+        series = self._read_shared()
+        if series is None:
+            with self._lock:
+                series = dict(self._series)
+        
+        lines = []
+        for family, (metric_type, help_text) in FAMILIES.items():
+            samples = [
+                (name, json.loads(labels), value)
+                for (name, labels), value in series.items()
+                if name == family or name.startswith(f"{family}_")
+            ]
+            if not samples:
+                continue
+            
+            lines.append(f"# HELP {family} {help_text}")
+            lines.append(f"# TYPE {family} {metric_type}")
+            
+            for name, labels, value in sorted(samples, key=self._sample_order):
+                label_text = ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items())
+                lines.append(f"{name}{{{label_text}}} {_format_value(value)}")
+        
+        return "\n".join(lines) + "\n"
+    
+    def _inc(self, name: str, labels: Dict[str, str], value: float = 1.0):
+        series = (name, json.dumps(labels, sort_keys=True))
+        self._series[series] += value
+        if self.redis_url:
+            self._pending[series] += value
+    
+    def _sample_order(self, sample):
+        name, labels, _ = sample
+        base = sorted((k, v) for k, v in labels.items() if k != "le")
+        suffix = next((i for i, s in enumerate(("_bucket", "_sum", "_count")) if name.endswith(s)), 0)
+        le = labels.get("le")
+        return (base, suffix, float(le) if le else 0.0)
+    
+    def _read_shared(self) -> Optional[Dict[Tuple[str, str], float]]:
+        if not self.redis_url:
+            return None
+        
+        client = self._client()
+        if client is None:
+            return None
+        
+        try:
+            raw = client.hgetall(self.REDIS_KEY)
+        except Exception:
+            self._redis_failed()
+            return None
+        
+        series = {}
+        for field, value in raw.items():
+            name, _, labels = field.decode().partition("|")
+            series[(name, labels)] = float(value)
+        return series
+    
+    def _client(self):
+        if time.monotonic() < self._redis_retry_at:
+            return None
+        
+        if self._redis is None:
+            try:
+                import redis
+            except ImportError:
+                self.redis_url = ""
+                return None
+            self._redis = redis.Redis.from_url(
+                self.redis_url,
+                socket_connect_timeout=1,
+                socket_timeout=1
+            )
+        return self._redis
+    
+    def _redis_failed(self):
+        # تجنّب حجب خط الإنتاج بمهلات الاتصال المتكررة
+        self._redis_retry_at = time.monotonic() + self.flush_interval
+
+
+class stage_timer:
+    """قياس زمن مرحلة عبر with أو async with، وتسجيله في المقاييس وسجل التشغيل الحالي"""
+    
+    def __init__(self, stage: str, provider: str = "local", **details):
+        self.stage = stage
+        self.provider = provider
+        self.details = details
+        self._started = 0.0
+    
+    def __enter__(self):
+        self._started = time.perf_counter()
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        seconds = time.perf_counter() - self._started
+        
+        if exc_type is None:
+            status = "ok"
+        elif issubclass(exc_type, asyncio.CancelledError):
+            status = "cancelled"
+        else:
+            status = "error"
+        
+        metrics.observe_stage(self.stage, self.provider, seconds, status)
+        
+        records = _current_trace.get()
+        if records is not None:
+            records.append({
+                'stage': self.stage,
+                'provider': self.provider,
+                'status': status,
+                'duration_ms': int(seconds * 1000),
+                'error': str(exc) if exc else None,
+                'finished_at': datetime.utcnow().isoformat(),
+                **self.details
+            })
+        
+        return False
+    
+    async def __aenter__(self):
+        return self.__enter__()
+    
+    async def __aexit__(self, exc_type, exc, tb):
+        return self.__exit__(exc_type, exc, tb)
+
+
+class StageTrace:
+    """تجميع سجلات مراحل تشغيل واحد لحفظها لاحقاً في APILog"""
+    
+    def __init__(self):
+        self.records: List[Dict] = []
+        self._token = None
+    
+    def start(self) -> "StageTrace":
+        self._token = _current_trace.set(self.records)
+        return self
+    
+    def stop(self) -> List[Dict]:
+        if self._token is not None:
+            _current_trace.reset(self._token)
+            self._token = None
+        return self.records
+
+
+metrics = MetricsRegistry(
+    settings.METRICS_BUCKETS,
+    redis_url=settings.REDIS_URL if settings.METRICS_SHARED else "",
+    flush_interval=settings.METRICS_FLUSH_SECONDS
+)
@@ -0,0 +1,251 @@
+"""صحة المزوّدين - زمن استجابة ومعدل أخطاء متحركان، قاطع دائرة، وتحويل تلقائي مع طلب تحوّط"""
+import asyncio
+import threading
+import time
+from collections import deque
+from typing import Awaitable, Callable, Dict, List, Optional, TypeVar
+
+from app.core.config import settings
+
+
+T = TypeVar("T")
+
+
+class ProviderUnavailable(Exception):
+    """كل المزوّدين المرشحين دوائرهم مفتوحة"""
+
+
+class ProviderHealth:
+    """نافذة آخر الطلبات لمزوّد واحد وحالة قاطع الدائرة (closed / open / half_open)"""
+    
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+    
+    def __init__(
+        self,
+        name: str,
+        window: int,
+        failure_rate: float,
+        min_requests: int,
+        open_seconds: float
+    ):
+        self.name = name
+        self.failure_rate = failure_rate
+        self.min_requests = max(1, min_requests)
+        self.open_seconds = open_seconds
+        
+        self._lock = threading.Lock()
+        # (نجاح؟، الزمن بالثواني)
+        self._results = deque(maxlen=max(1, window))
+        self._state = self.CLOSED
+        self._opened_at = 0.0
+        self._probing = False
+    
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state()
+    
+    def available(self) -> bool:
+        """هل يمكن إرسال طلب الآن (دون حجز الطلب التجريبي)"""
+        
+        with self._lock:
+            state = self._current_state()
+            return state == self.CLOSED or (state == self.HALF_OPEN and not self._probing)
+    
+    def acquire(self) -> bool:
+        """حجز الإذن بطلب؛ في half_open يُسمح بطلب تجريبي واحد فقط"""
+        
+        with self._lock:
+            state = self._current_state()
+            if state == self.CLOSED:
+                return True
+            if state == self.HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            return False
+    
+    def release(self):
+        """تحرير الطلب التجريبي دون نتيجة (مثلاً عند إلغاء طلب التحوّط الخاسر)"""
+        
+        with self._lock:
+            self._probing = False
+    
+    def record_success(self, seconds: float):
+        with self._lock:
+            self._results.append((True, seconds))
+            if self._state != self.CLOSED:
+                # نجح الطلب التجريبي: نافذة جديدة حتى لا تعيد الأخطاء القديمة فتح الدائرة
+                self._results.clear()
+                self._results.append((True, seconds))
+                self._state = self.CLOSED
+            self._probing = False
+    
+    def record_failure(self, seconds: float):
+        with self._lock:
+            self._results.append((False, seconds))
+            self._probing = False
+            
+            if self._current_state() == self.HALF_OPEN:
+                self._open()
+            elif (
+                len(self._results) >= self.min_requests
+                and self._error_rate() >= self.failure_rate
+            ):
+                self._open()
+    
+    def error_rate(self) -> float:
+        with self._lock:
+            return self._error_rate()
+    
+    def latency(self, quantile: float) -> Optional[float]:
+        """زمن الطلبات الناجحة عند الشريحة المطلوبة (None قبل توفر عيّنات كافية)"""
+        
+        with self._lock:
+            samples = sorted(seconds for ok, seconds in self._results if ok)
+        if len(samples) < self.min_requests:
+            return None
+        return samples[min(len(samples) - 1, int(quantile * len(samples)))]
+    
+    def stats(self) -> Dict:
+        """حالة المزوّد الحالية"""
+        
+        p50, p90 = self.latency(0.5), self.latency(0.9)
+        with self._lock:
+            return {
+                "provider": self.name,
+                "state": self._current_state(),
+                "requests": len(self._results),
+                "error_rate": round(self._error_rate(), 3),
+                "p50_seconds": round(p50, 3) if p50 is not None else None,
+                "p90_seconds": round(p90, 3) if p90 is not None else None
+            }
+    
+    def _current_state(self) -> str:
+        if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.open_seconds:
+            self._state = self.HALF_OPEN
+            self._probing = False
+        return self._state
+    
+    def _open(self):
+        self._state = self.OPEN
+        self._opened_at = time.monotonic()
+    
+    def _error_rate(self) -> float:
+        if not self._results:
+            return 0.0
+        return sum(1 for ok, _ in self._results if not ok) / len(self._results)
+
+
+_health: Dict[str, ProviderHealth] = {}
+_registry_lock = threading.Lock()
+
+
+def get_health(provider: str) -> ProviderHealth:
+    """سجل صحة المزوّد المشترك (يُنشأ مرة واحدة لكل عملية)"""
+    
+    with _registry_lock:
+        health = _health.get(provider)
+        if health is None:
+            health = ProviderHealth(
+                provider,
+                window=settings.PROVIDER_HEALTH_WINDOW,
+                failure_rate=settings.PROVIDER_FAILURE_RATE,
+                min_requests=settings.PROVIDER_MIN_REQUESTS,
+                open_seconds=settings.PROVIDER_OPEN_SECONDS
+            )
+            _health[provider] = health
+        return health
+
+
+class ProviderRouter:
+    """ترتيب المزوّدين حسب صحتهم وتنفيذ الطلب مع التحويل عند الفشل وطلب تحوّط اختياري"""
+    
+    def __init__(self, hedge: bool = None, hedge_min_seconds: float = None):
+        self.hedge = settings.LLM_HEDGE_REQUESTS if hedge is None else hedge
+        self.hedge_min_seconds = (
+            settings.LLM_HEDGE_MIN_SECONDS if hedge_min_seconds is None else hedge_min_seconds
+        )
+    
+    def ranked(self, names: List[str]) -> List[str]:
+        """المزوّدون المتاحون مرتبين: الأقل أخطاءً أولاً ثم حسب ترتيب التفضيل"""
+        
+        # معدل الأخطاء بدقة 10% حتى لا تقلب الفروق الصغيرة ترتيب التفضيل
+        available = [name for name in names if get_health(name).available()]
+        return sorted(
+            available,
+            key=lambda name: (round(get_health(name).error_rate(), 1), names.index(name))
+        )
+    
+    async def call(self, names: List[str], fn: Callable[[str], Awaitable[T]]) -> T:
+        """تنفيذ fn(name) على أفضل مزوّد، والانتقال للتالي عند الفشل"""
+        
+        candidates = self.ranked(names)
+        if not candidates:
+            raise ProviderUnavailable(f"كل المزوّدين غير متاحين مؤقتاً: {', '.join(names)}")
+        
+        last_error: Optional[BaseException] = None
+        tried = set()
+        while candidates:
+            name = candidates.pop(0)
+            if name in tried or not get_health(name).acquire():
+                continue
+            
+            backup = candidates[0] if self.hedge and candidates else None
+            try:
+                return await self._hedged(name, backup, fn, tried)
+            except Exception as e:
+                print(f"⚠️ فشل المزوّد {name}: {str(e)}")
+                last_error = e
+        
+        if last_error is None:
+            raise ProviderUnavailable(f"كل المزوّدين غير متاحين مؤقتاً: {', '.join(names)}")
+        raise last_error
+    
+    async def _attempt(self, name: str, fn: Callable[[str], Awaitable[T]]) -> T:
+        health = get_health(name)
+        started = time.monotonic()
+        try:
+            result = await fn(name)
+        except asyncio.CancelledError:
+            # الطلب الخاسر في التحوّط ليس فشلاً للمزوّد
+            health.release()
+            raise
+        except Exception:
+            health.record_failure(time.monotonic() - started)
+            raise
+        
+        health.record_success(time.monotonic() - started)
+        return result
+    
+    async def _hedged(self, name: str, backup: Optional[str], fn, tried: set):
+        """الطلب الأساسي، ومع تجاوزه p90 المعتاد يُرسل طلب ثانٍ للاحتياطي ويُعتمد الأسرع"""
+        
+        tried.add(name)
+        primary = asyncio.create_task(self._attempt(name, fn))
+        
+        delay = get_health(name).latency(0.9) if backup else None
+        if delay is None:
+            return await primary
+        
+        tasks = {primary: name}
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=max(delay, self.hedge_min_seconds))
+            if not done and get_health(backup).acquire():
+                print(f"⏱️ {name} تجاوز p90 ({delay:.1f}s)، طلب تحوّط إلى {backup}")
+                tried.add(backup)
+                tasks[asyncio.create_task(self._attempt(backup, fn))] = backup
+            
+            pending = set(tasks)
+            error: Optional[BaseException] = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
@@ -0,0 +1,148 @@
+"""جدولة الطلبات لكل مزوّد - حد للطلبات المتزامنة ودلو رموز لمعدل الطلبات في الدقيقة"""
+import asyncio
+import threading
+import time
+from collections import deque
+from typing import Dict
+
+from app.core.config import settings
+
+
+class ProviderLimiter:
+    """حد مشترك لمزوّد واحد على مستوى العملية (يعمل عبر حلقات أحداث متعددة)"""
+    
+    def __init__(self, name: str, max_in_flight: int, requests_per_minute: int = 0):
+        self.name = name
+        self.max_in_flight = max(1, max_in_flight)
+        self.requests_per_minute = requests_per_minute
+        
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._waiters = deque()
+        
+        # دلو الرموز: سعة صغيرة حتى لا تتجمع دفعة كبيرة بعد فترة خمول
+        self._capacity = float(max(1, min(self.max_in_flight, requests_per_minute or 1)))
+        self._tokens = self._capacity
+        self._refill_rate = requests_per_minute / 60.0
+        self._last_refill = time.monotonic()
+        self._paused_until = 0.0
+    
+    async def __aenter__(self):
+        await self.acquire()
+        return self
+    
+    async def __aexit__(self, exc_type, exc, tb):
+        self.release()
+    
+    async def acquire(self):
+        """انتظار مكان شاغر ثم رمز من الدلو"""
+        
+        await self._acquire_slot()
+        try:
+            await self._acquire_token()
+        except BaseException:
+            self.release()
+            raise
+    
+    def release(self):
+        """تحرير المكان وتسليمه مباشرة لأول منتظر إن وُجد"""
+        
+        with self._lock:
+            while self._waiters:
+                loop, future = self._waiters.popleft()
+                if future.done():
+                    continue
+                try:
+                    loop.call_soon_threadsafe(self._grant, future)
+                    return
+                except RuntimeError:
+                    # حلقة المنتظر أُغلقت
+                    continue
+            self._in_flight -= 1
+    
+    def pause(self, seconds: float):
+        """إيقاف إصدار الرموز مؤقتاً (مثلاً بعد استجابة 429 مع Retry-After)"""
+        
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._tokens = 0.0
+    
+    def stats(self) -> Dict:
+        """حالة المحدِّد الحالية"""
+        
+        with self._lock:
+            return {
+                "provider": self.name,
+                "in_flight": self._in_flight,
+                "waiting": len(self._waiters),
+                "max_in_flight": self.max_in_flight,
+                "requests_per_minute": self.requests_per_minute
+            }
+    
+    async def _acquire_slot(self):
+        loop = asyncio.get_running_loop()
+        
+        with self._lock:
+            if self._in_flight < self.max_in_flight:
+                self._in_flight += 1
+                return
+            future = loop.create_future()
+            self._waiters.append((loop, future))
+        
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # سُلِّم المكان بعد الإلغاء، يجب إعادته
+                self.release()
+            raise
+    
+    def _grant(self, future: asyncio.Future):
+        if future.cancelled():
+            self.release()
+        else:
+            future.set_result(None)
+    
+    async def _acquire_token(self):
+        if not self.requests_per_minute:
+            return
+        
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                if now >= self._paused_until:
+                    self._tokens = min(
+                        self._capacity,
+                        self._tokens + (now - max(self._last_refill, self._paused_until)) * self._refill_rate
+                    )
+                    self._last_refill = now
+                    
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        return
+                    
+                    wait = (1 - self._tokens) / self._refill_rate
+                else:
+                    wait = self._paused_until - now
+            
+            await asyncio.sleep(wait)
+
+
+_limiters: Dict[str, ProviderLimiter] = {}
+_registry_lock = threading.Lock()
+
+
+def get_limiter(provider: str) -> ProviderLimiter:
+    """المحدِّد المشترك للمزوّد (يُنشأ مرة واحدة لكل عملية)"""
+    
+    with _registry_lock:
+        limiter = _limiters.get(provider)
+        if limiter is None:
+            limits = settings.PROVIDER_LIMITS.get(provider, {})
+            limiter = ProviderLimiter(
+                provider,
+                max_in_flight=limits.get("max_in_flight", settings.DEFAULT_PROVIDER_MAX_IN_FLIGHT),
+                requests_per_minute=limits.get("rpm", 0)
+            )
+            _limiters[provider] = limiter
+        return limiter
@@ -0,0 +1,214 @@
+"""ذاكرة السكريبتات المؤقتة - صلاحية زمنية (TTL) ودمج الطلبات المتطابقة المتزامنة"""
+import asyncio
+import copy
+import json
+import os
+import time
+import weakref
+from typing import Awaitable, Callable, Dict, Optional
+
+from app.core.config import settings
+from app.core.media_cache import cache_key
+
+
+class ScriptCache:
+    """تخزين السكريبتات على القرص مع single-flight لكل مفتاح (داخل العملية وبين العمليات)"""
+    
+    # فترة فحص ظهور السكريبت الذي تولّده عملية أخرى
+    LOCK_POLL_SECONDS = 0.5
+    
+    def __init__(self, cache_dir: str, ttl_seconds: int, lock_seconds: float = 600):
+        self.cache_dir = cache_dir
+        self.ttl_seconds = ttl_seconds
+        self.lock_seconds = lock_seconds
+        os.makedirs(self.cache_dir, exist_ok=True)
+        
+        # الطلبات الجارية لكل حلقة أحداث (مهام Celery تنشئ حلقة جديدة لكل مهمة)
+        self._inflight = weakref.WeakKeyDictionary()
+    
+    def key(self, *parts) -> str:
+        """مفتاح السكريبت من مدخلاته (الموضوع، المدة، الأسلوب، اللغة، النموذج)"""
+        return cache_key("script", *parts)
+    
+    def get(self, key: str) -> Optional[Dict]:
+        """إرجاع السكريبت المخزّن إن كان ضمن مدة الصلاحية"""
+        
+        if self.ttl_seconds <= 0:
+            return None
+        
+        path = self._path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                record = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        
+        if time.time() - record.get('created_at', 0) > self.ttl_seconds:
+            self._remove(path)
+            return None
+        
+        return record.get('script')
+    
+    def set(self, key: str, script: Dict):
+        """تخزين سكريبت (عدا المُنقَذ من رد مقطوع حتى لا يتكرر نقصه لكل طلب مطابق)"""
+        
+        if self.ttl_seconds <= 0 or script.get('salvaged'):
+            return
+        
+        path = self._path(key)
+        partial_path = f"{path}.{os.getpid()}.part"
+        
+        with open(partial_path, 'w', encoding='utf-8') as f:
+            json.dump({'created_at': time.time(), 'script': script}, f, ensure_ascii=False)
+        os.replace(partial_path, path)
+    
+    def flight(self, key: str) -> "ScriptFlight":
+        """توليد مشترك للمفتاح يستخدمه المولّد الكامل والبث معاً"""
+        return ScriptFlight(self, key)
+    
+    async def get_or_create(
+        self,
+        key: str,
+        factory: Callable[[], Awaitable[Dict]]
+    ) -> Dict:
+        """إرجاع السكريبت من الذاكرة، أو مشاركة استدعاء جارٍ، أو توليده مرة واحدة"""
+        
+        flight = self.flight(key)
+        shared = await flight.join()
+        if shared is not None:
+            return shared
+        
+        try:
+            script = await factory()
+        except BaseException as e:
+            flight.fail(e)
+            raise
+        
+        flight.done(script)
+        return copy.deepcopy(script)
+    
+    def purge_expired(self) -> int:
+        """حذف السكريبتات المنتهية الصلاحية"""
+        
+        removed = 0
+        for filename in os.listdir(self.cache_dir):
+            if not filename.endswith('.json'):
+                continue
+            path = os.path.join(self.cache_dir, filename)
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    created_at = json.load(f).get('created_at', 0)
+            except (OSError, json.JSONDecodeError):
+                created_at = 0
+            if time.time() - created_at > self.ttl_seconds:
+                self._remove(path)
+                removed += 1
+        return removed
+    
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.json")
+    
+    def _lock(self, key: str) -> bool:
+        """حجز توليد المفتاح بين العمليات بملف قفل (O_EXCL) بجانب السكريبت"""
+        
+        if self.ttl_seconds <= 0:
+            # بلا تخزين لا تستطيع العمليات الأخرى قراءة النتيجة فلا فائدة من انتظارها
+            return True
+        
+        path = f"{self._path(key)}.lock"
+        for _ in range(2):
+            try:
+                fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                try:
+                    age = time.time() - os.path.getmtime(path)
+                except FileNotFoundError:
+                    continue
+                if age < self.lock_seconds:
+                    return False
+                # قفل عملية توقفت أثناء التوليد
+                self._remove(path)
+                continue
+            
+            with os.fdopen(fd, 'w') as f:
+                f.write(str(os.getpid()))
+            return True
+        return False
+    
+    def _unlock(self, key: str):
+        if self.ttl_seconds > 0:
+            self._remove(f"{self._path(key)}.lock")
+    
+    def _remove(self, path: str):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+class ScriptFlight:
+    """توليد سكريبت واحد لمفتاح: أول طلب يصبح مالكه، والطلبات المطابقة تنتظر نتيجته"""
+    
+    def __init__(self, cache: ScriptCache, key: str):
+        self.cache = cache
+        self.key = key
+        self._future: Optional[asyncio.Future] = None
+        self._inflight: Optional[Dict] = None
+    
+    async def join(self) -> Optional[Dict]:
+        """السكريبت المخزّن أو نتيجة طلب مطابق جارٍ، أو None إذا كان على هذا الطلب توليده"""
+        
+        loop = asyncio.get_running_loop()
+        self._inflight = self.cache._inflight.setdefault(loop, {})
+        
+        while True:
+            cached = self.cache.get(self.key)
+            if cached is not None:
+                return cached
+            
+            if self.key in self._inflight:
+                # طلب مطابق قيد التنفيذ: انتظار نتيجته بدلاً من استدعاء النموذج مرة أخرى
+                return copy.deepcopy(await asyncio.shield(self._inflight[self.key]))
+            
+            if self.cache._lock(self.key):
+                self._future = loop.create_future()
+                self._inflight[self.key] = self._future
+                return None
+            
+            # عملية أخرى (عامل أو الخادم) تولّده: انتظار ظهوره في الذاكرة، أو توليده هنا إن حرّرت قفلها دونه
+            await asyncio.sleep(self.cache.LOCK_POLL_SECONDS)
+    
+    def done(self, script: Dict):
+        """تخزين السكريبت المكتمل وتسليمه للمنتظرين"""
+        
+        if self._future is None or self._future.done():
+            return
+        
+        self.cache.set(self.key, script)
+        self.cache._unlock(self.key)
+        # المالك يواصل تعديل مشاهده أثناء المعالجة
+        self._future.set_result(copy.deepcopy(script))
+        self._inflight.pop(self.key, None)
+    
+    def fail(self, error: BaseException):
+        """إنهاء التوليد دون نتيجة (خطأ أو إلغاء)"""
+        
+        if self._future is None or self._future.done():
+            return
+        
+        self.cache._unlock(self.key)
+        
+        if not isinstance(error, Exception):
+            # إلغاء المالك لا يعني إلغاء المنتظرين: يصلهم خطأ عادي يعالجونه كأي فشل في التوليد
+            error = RuntimeError("أُلغي توليد السكريبت المشترك قبل اكتماله")
+        self._future.set_exception(error)
+        # تجنّب تحذير "exception was never retrieved" عند غياب المنتظرين
+        self._future.exception()
+        self._inflight.pop(self.key, None)
+
+
+script_cache = ScriptCache(
+    settings.SCRIPT_CACHE_DIR,
+    settings.SCRIPT_CACHE_TTL_SECONDS,
+    settings.SCRIPT_CACHE_LOCK_SECONDS
+)
@@ -0,0 +1,53 @@
+"""مساحات عمل معزولة لملفات FFmpeg الوسيطة (مجلد لكل عملية ترميز مع تنظيف مضمون)"""
+import os
+import shutil
+import tempfile
+import time
+from contextlib import contextmanager
+
+from app.core.config import settings
+
+
+WORKSPACE_PREFIX = "autocreator_"
+
+
+def workspace_root() -> str:
+    """المجلد الأب لمساحات العمل (tmpfs عند تفعيله وتوفره)"""
+    
+    if settings.RENDER_WORKSPACE_DIR:
+        root = settings.RENDER_WORKSPACE_DIR
+    elif settings.RENDER_WORKSPACE_TMPFS and os.path.isdir("/dev/shm"):
+        root = "/dev/shm/autocreator"
+    else:
+        root = os.path.join(tempfile.gettempdir(), "autocreator")
+    
+    os.makedirs(root, exist_ok=True)
+    return root
+
+
+@contextmanager
+def render_workspace(name: str = "render"):
+    """مجلد خاص بعملية واحدة يُحذف بكل محتواه عند الخروج حتى عند الفشل أو الإلغاء"""
+    
+    path = tempfile.mkdtemp(prefix=f"{WORKSPACE_PREFIX}{name}_", dir=workspace_root())
+    try:
+        yield path
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def sweep_stale_workspaces(max_age_seconds: int) -> int:
+    """حذف مساحات العمل المتروكة من عمال توقفوا فجأة، وإرجاع عددها"""
+    
+    root = workspace_root()
+    cutoff = time.time() - max_age_seconds
+    removed = 0
+    
+    for entry in os.scandir(root):
+        if not entry.name.startswith(WORKSPACE_PREFIX) or not entry.is_dir():
+            continue
+        if entry.stat().st_mtime < cutoff:
+            shutil.rmtree(entry.path, ignore_errors=True)
+            removed += 1
+    
+    return removed
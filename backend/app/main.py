@@ -1,7 +1,10 @@
 # AutoCreator AI Backend
 # FastAPI Application for AI-Powered Content Creation
 
+import asyncio
+
 from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 
@@ -9,6 +12,8 @@ from app.core.config import settings
 from app.db.database import engine, Base
 from app.api import router as api_router
 from app.workers.celery_app import celery_app
+from app.core.http_pool import close_http_pools
+from app.core.metrics import metrics
 
 
 @asynccontextmanager
@@ -28,6 +33,7 @@ async def lifespan(app: FastAPI):
     
     # إيقاف التشغيل
     print("🛑 إيقاف الخادم...")
+    await close_http_pools()
 
 
 # إنشاء تطبيق FastAPI
@@ -77,6 +83,15 @@ async def health_check():
     }
 
 
+@app.get("/api/metrics", response_class=PlainTextResponse)
+async def metrics_endpoint():
+    """مقاييس زمن المراحل والمزوّدين بصيغة Prometheus"""
+    return PlainTextResponse(
+        await asyncio.to_thread(metrics.render),
+        media_type="text/plain; version=0.0.4"
+    )
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(
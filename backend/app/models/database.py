@@ -33,6 +33,9 @@ class Project(Base):
     video_path = Column(String(1000))
     video_url = Column(String(1000))
     thumbnail_url = Column(String(1000))
+    thumbnail_path = Column(String(1000))  # الصورة المصغّرة المولَّدة محلياً بجانب الفيديو
+    preview_sprite_path = Column(String(1000))  # ورقة لقطات المعاينة (وخريطتها .vtt بجانبها)
+    renditions = Column(JSON)  # {الاسم: {path, width, height}} لكل نسخة مُرمَّزة
     youtube_video_id = Column(String(100))
     
     # البيانات الوسيطة (JSON)
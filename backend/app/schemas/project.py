@@ -1,17 +1,35 @@
 """مخططات Pydantic للمشاريع"""
 from datetime import datetime
-from typing import List, Optional
-from pydantic import BaseModel, Field
+from typing import Any, Dict, List, Optional
+from pydantic import BaseModel, Field, field_validator
 
+from app.core.config import settings
 from app.models.database import Project, Scene
 
 
+def _render_profile_name(value: Optional[str]) -> Optional[str]:
+    """اسم ملف ترميز معروف (أو أحد أسمائه البديلة)، وإلا خطأ تحقق يُعاد كـ 422"""
+    
+    if value is None:
+        return value
+    
+    # resolve_render_profile يرجع بصمت إلى الملف الافتراضي، فالاسم الخاطئ يُرفض هنا
+    name = value.lower()
+    known = list(settings.RENDER_PROFILES) + list(settings.RENDER_PROFILE_ALIASES)
+    if name not in known:
+        raise ValueError(f"ملف ترميز غير معروف، المتاح: {', '.join(known)}")
+    return name
+
+
 class ProjectCreate(BaseModel):
     """إنشاء مشروع جديد"""
     topic: str = Field(..., min_length=5, max_length=500, description="موضوع الفيديو")
     style: str = Field(default="documentary", description="أسلوب الفيديو")
     duration: int = Field(default=5, ge=1, le=30, description="المدة بالدقائق")
     language: str = Field(default="ar", description="اللغة")
+    quality: str = Field(default="standard", description="ملف الترميز: draft أو standard أو final")
+    
+    check_quality = field_validator("quality")(_render_profile_name)
 
 
 class ProjectUpdate(BaseModel):
@@ -20,6 +38,9 @@ class ProjectUpdate(BaseModel):
     description: Optional[str] = None
     style: Optional[str] = None
     duration: Optional[int] = None
+    quality: Optional[str] = None
+    
+    check_quality = field_validator("quality")(_render_profile_name)
 
 
 class ProjectResponse(BaseModel):
@@ -33,7 +54,12 @@ class ProjectResponse(BaseModel):
     language: str
     style: str
     duration: int
+    quality: Optional[str]
     video_path: Optional[str]
+    renditions: Optional[Dict[str, Any]] = None
+    thumbnail_url: Optional[str] = None
+    thumbnail_path: Optional[str] = None
+    preview_sprite_path: Optional[str] = None
     video_url: Optional[str]
     youtube_video_id: Optional[str]
     created_at: datetime
@@ -67,6 +93,13 @@ class SceneResponse(BaseModel):
         from_attributes = True
 
 
+class SceneUpdate(BaseModel):
+    """تعديل مشهد (يُعاد توليد ما تغيّر فقط ثم ترميز مقطعه)"""
+    script_text: Optional[str] = Field(default=None, min_length=1, description="نص التعليق الصوتي والترجمة")
+    visual_prompt: Optional[str] = Field(default=None, min_length=1, description="وصف الصورة (يُعاد توليدها)")
+    image_path: Optional[str] = Field(default=None, description="صورة من ذاكرة الصور المولّدة بدل التوليد")
+
+
 class ScriptData(BaseModel):
     """بيانات السكريبت"""
     title: str
@@ -0,0 +1,94 @@
+"""كاتب تقدّم المشروع - دمج تحديثات الحالة المتقاربة في عبارة UPDATE واحدة"""
+import asyncio
+import time
+from typing import Dict, Optional
+
+from sqlalchemy import func
+
+from app.core.config import settings
+from app.services.project_service import ProjectService
+
+
+class ProgressWriter:
+    """تأجيل تحديثات التقدّم المتقاربة ودمجها مع الأعمدة الأخرى في كتابة واحدة"""
+    
+    TERMINAL_STATUSES = ("completed", "failed", "cancelled")
+    
+    def __init__(
+        self,
+        service: ProjectService,
+        project_id: int,
+        min_interval: float = None,
+        lock: Optional[asyncio.Lock] = None
+    ):
+        self.service = service
+        self.project_id = project_id
+        self.min_interval = (
+            settings.PROGRESS_MIN_INTERVAL_SECONDS if min_interval is None else min_interval
+        )
+        # جلسة قاعدة البيانات مشتركة مع مهام المشاهد
+        self._lock = lock or asyncio.Lock()
+        
+        self._pending: Dict = {}
+        self._status: Optional[str] = None
+        self._last_write = 0.0
+        # يصبح True عند رفض الكتابة لأن المستخدم ألغى المشروع
+        self.cancelled = False
+    
+    async def set(self, status: str, progress: int, **fields):
+        """تحديث الحالة والتقدّم؛ يُكتب فوراً عند تغيّر الحالة أو وجود أعمدة أخرى،
+        وإلا يُؤجَّل حتى مرور min_interval أو الكتابة التالية"""
+        
+        self._pending.update(status=status, progress=progress, **fields)
+        if status == "completed":
+            self._pending['completed_at'] = func.now()
+        
+        if (
+            fields
+            or status != self._status
+            or status in self.TERMINAL_STATUSES
+            or time.monotonic() - self._last_write >= self.min_interval
+        ):
+            await self.flush()
+    
+    async def update(self, **fields):
+        """كتابة أعمدة فوراً مع أي تقدّم مؤجَّل في نفس العبارة"""
+        
+        self._pending.update(fields)
+        await self.flush()
+    
+    async def fail(self, error_message: str, **fields) -> bool:
+        """تسجيل الفشل ورسالة الخطأ في كتابة واحدة؛ يُرجع False إن رُفضت لأن المشروع ملغى"""
+        
+        self._pending = {}
+        
+        async with self._lock:
+            # قد يكون الخطأ نفسه من قاعدة البيانات فتبقى المعاملة معلّقة
+            await self.service.db.rollback()
+            written = await self.service.update_error(
+                self.project_id, error_message, progress=0, **fields
+            )
+            if not written:
+                self.cancelled = True
+            
+            self._status = "failed" if written else "cancelled"
+            self._last_write = time.monotonic()
+            return written
+    
+    async def flush(self):
+        """كتابة كل ما هو مؤجَّل بعبارة UPDATE واحدة"""
+        
+        async with self._lock:
+            if not self._pending:
+                return
+            
+            values, self._pending = self._pending, {}
+            # الإلغاء من الواجهة لا يُستبدل بتحديث تقدّم متأخر
+            written = await self.service.update_fields(
+                self.project_id, unless_status=("cancelled",), **values
+            )
+            if not written:
+                self.cancelled = True
+            
+            self._status = values.get('status', self._status)
+            self._last_write = time.monotonic()
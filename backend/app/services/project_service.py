@@ -1,15 +1,18 @@
 """خدمة إدارة المشاريع"""
-from typing import List, Optional, Tuple
+from typing import List, Optional, Sequence, Tuple
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func
+from sqlalchemy import select, func, delete, update
 
-from app.models.database import Project, Scene, User
-from app.schemas.project import ProjectCreate, ProjectUpdate
+from app.models.database import Project, Scene, User, APILog
+from app.schemas.project import ProjectCreate, ProjectUpdate, SceneUpdate
 
 
 class ProjectService:
     """خدمة إدارة المشاريع"""
     
+    # حالات يعمل فيها عامل على المشروع فلا يُبدأ عليه تشغيل آخر
+    BUSY_STATUSES = ("generating", "processing", "editing", "uploading")
+    
     def __init__(self, db: AsyncSession):
         self.db = db
     
@@ -66,6 +69,7 @@ class ProjectService:
             style=project_data.style,
             duration=project_data.duration,
             language=project_data.language,
+            quality=project_data.quality,
             status="pending",
             progress=0
         )
@@ -99,29 +103,57 @@ class ProjectService:
         
         return project
     
+    async def update_fields(
+        self,
+        project_id: int,
+        unless_status: Sequence[str] = (),
+        **values
+    ) -> bool:
+        """تحديث أعمدة المشروع بعبارة UPDATE واحدة ضمن معاملة واحدة (بدون SELECT أو refresh)"""
+        
+        if not values:
+            return False
+        
+        query = update(Project).where(Project.id == project_id)
+        if unless_status:
+            # لا يُكتب شيء إذا كانت حالة المشروع إحدى هذه الحالات (مثلاً بعد إلغائه)
+            query = query.where(Project.status.notin_(unless_status))
+        
+        result = await self.db.execute(query.values(**values))
+        await self.db.commit()
+        
+        return result.rowcount > 0
+    
+    async def get_status(self, project_id: int) -> Optional[str]:
+        """حالة المشروع فقط (استعلام خفيف لفحص الإلغاء أثناء التنفيذ)"""
+        
+        result = await self.db.execute(
+            select(Project.status).where(Project.id == project_id)
+        )
+        return result.scalar_one_or_none()
+    
+    async def cancel_project(self, project_id: int) -> bool:
+        """طلب إلغاء مشروع قيد التنفيذ (العامل يلاحظ الحالة ويوقف الترميز)"""
+        
+        return await self.update_fields(
+            project_id,
+            unless_status=("completed", "failed", "cancelled"),
+            status="cancelled"
+        )
+    
     async def update_status(
         self,
         project_id: int,
         status: str,
         progress: int = 0
-    ) -> Optional[Project]:
+    ) -> bool:
         """تحديث حالة المشروع"""
         
-        project = await self.get_project(project_id)
-        if not project:
-            return None
-        
-        project.status = status
-        project.progress = progress
-        
+        values = {'status': status, 'progress': progress}
         if status == "completed":
-            project.completed_at = func.now()
+            values['completed_at'] = func.now()
         
-        await self.db.flush()
-        await self.db.commit()
-        await self.db.refresh(project)
-        
-        return project
+        return await self.update_fields(project_id, **values)
     
     async def update_script_data(
         self,
@@ -130,11 +162,7 @@ class ProjectService:
     ):
         """تحديث بيانات السكريبت"""
         
-        project = await self.get_project(project_id)
-        if project:
-            project.script_data = script_data
-            await self.db.flush()
-            await self.db.commit()
+        await self.update_fields(project_id, script_data=script_data)
     
     async def update_video_path(
         self,
@@ -143,11 +171,7 @@ class ProjectService:
     ):
         """تحديث مسار الفيديو"""
         
-        project = await self.get_project(project_id)
-        if project:
-            project.video_path = video_path
-            await self.db.flush()
-            await self.db.commit()
+        await self.update_fields(project_id, video_path=video_path)
     
     async def update_youtube_info(
         self,
@@ -157,12 +181,7 @@ class ProjectService:
     ):
         """تحديث معلومات يوتيوب"""
         
-        project = await self.get_project(project_id)
-        if project:
-            project.youtube_video_id = video_id
-            project.video_url = url
-            await self.db.flush()
-            await self.db.commit()
+        await self.update_fields(project_id, youtube_video_id=video_id, video_url=url)
     
     async def update_processing_time(
         self,
@@ -171,26 +190,29 @@ class ProjectService:
     ):
         """تحديث وقت المعالجة"""
         
-        project = await self.get_project(project_id)
-        if project:
-            project.processing_time_seconds = int(seconds)
-            await self.db.flush()
-            await self.db.commit()
+        await self.update_fields(project_id, processing_time_seconds=int(seconds))
     
     async def update_error(
         self,
         project_id: int,
-        error_message: str
-    ):
-        """تحديث رسالة الخطأ"""
+        error_message: str,
+        **values
+    ) -> bool:
+        """تحديث رسالة الخطأ (مع أي أعمدة إضافية في نفس العبارة)؛ يُرجع False إن كان المشروع ملغى"""
         
-        project = await self.get_project(project_id)
-        if project:
-            project.status = "failed"
-            project.script_data = project.script_data or {}
-            project.script_data['error'] = error_message
-            await self.db.flush()
-            await self.db.commit()
+        result = await self.db.execute(
+            select(Project.script_data).where(Project.id == project_id)
+        )
+        script_data = result.scalar_one_or_none() or {}
+        
+        # خطأ الإلغاء نفسه (توقف ffmpeg مثلاً) لا يستبدل "cancelled" بـ failed
+        return await self.update_fields(
+            project_id,
+            unless_status=("cancelled",),
+            status="failed",
+            script_data={**script_data, 'error': error_message},
+            **values
+        )
     
     async def delete_project(self, project_id: int) -> bool:
         """حذف مشروع"""
@@ -236,3 +258,175 @@ class ProjectService:
         await self.db.refresh(scene)
         
         return scene
+    
+    async def save_script_scenes(
+        self,
+        project_id: int,
+        scenes: List[dict]
+    ) -> List[Scene]:
+        """حفظ مشاهد السكريبت كصفوف Scene (سكريبت جديد يُلغي الوسائط السابقة)"""
+        
+        await self.db.execute(delete(Scene).where(Scene.project_id == project_id))
+        
+        rows = [self._script_scene(project_id, scene) for scene in scenes]
+        self.db.add_all(rows)
+        
+        await self.db.execute(
+            update(Project)
+            .where(Project.id == project_id)
+            .values(images_data={}, voice_data={}, video_path=None)
+        )
+        
+        await self.db.flush()
+        await self.db.commit()
+        
+        return rows
+    
+    async def add_script_scene(
+        self,
+        project_id: int,
+        scene: dict
+    ) -> Scene:
+        """إضافة مشهد واحد من سكريبت يُبث (بعد save_script_scenes بقائمة فارغة)"""
+        
+        row = self._script_scene(project_id, scene)
+        self.db.add(row)
+        
+        await self.db.flush()
+        await self.db.commit()
+        
+        return row
+    
+    def _script_scene(self, project_id: int, scene: dict) -> Scene:
+        return Scene(
+            project_id=project_id,
+            scene_number=scene.get('scene_number'),
+            script_text=scene.get('text', ''),
+            visual_prompt=scene.get('visual_prompt'),
+            subtitle_text=scene.get('text'),
+            duration_seconds=scene.get('duration_seconds', 5.0)
+        )
+    
+    async def get_scene(
+        self,
+        project_id: int,
+        scene_number: int
+    ) -> Optional[Scene]:
+        """الحصول على مشهد برقمه"""
+        
+        result = await self.db.execute(
+            select(Scene)
+            .where(Scene.project_id == project_id)
+            .where(Scene.scene_number == scene_number)
+        )
+        return result.scalars().first()
+    
+    async def update_scene(
+        self,
+        project_id: int,
+        scene_number: int,
+        scene_data: SceneUpdate
+    ) -> Optional[Scene]:
+        """تعديل مشهد مع مسح الوسائط التي لم تعد مطابقة ليُعاد توليدها وحدها"""
+        
+        scene = await self.get_scene(project_id, scene_number)
+        if not scene:
+            return None
+        
+        update_data = scene_data.dict(exclude_unset=True)
+        
+        if update_data.get('script_text') and update_data['script_text'] != scene.script_text:
+            scene.script_text = update_data['script_text']
+            scene.subtitle_text = update_data['script_text']
+            scene.audio_path = None
+        
+        if update_data.get('visual_prompt') and update_data['visual_prompt'] != scene.visual_prompt:
+            scene.visual_prompt = update_data['visual_prompt']
+            scene.image_path = None
+        
+        if update_data.get('image_path'):
+            scene.image_path = update_data['image_path']
+        
+        # السكريبت المحفوظ هو مصدر المشاهد عند إعادة التركيب
+        project = await self.get_project(project_id)
+        if project and project.script_data:
+            scenes = [
+                {**item, 'text': scene.script_text, 'visual_prompt': scene.visual_prompt}
+                if item.get('scene_number') == scene_number else item
+                for item in project.script_data.get('scenes', [])
+            ]
+            project.script_data = {**project.script_data, 'scenes': scenes}
+        
+        await self.db.flush()
+        await self.db.commit()
+        await self.db.refresh(scene)
+        
+        return scene
+    
+    async def checkpoint_scene_image(
+        self,
+        project_id: int,
+        scene_number: int,
+        image_path: str
+    ):
+        """تسجيل صورة المشهد فور توليدها"""
+        
+        scene = await self.get_scene(project_id, scene_number)
+        if scene:
+            scene.image_path = image_path
+        
+        project = await self.get_project(project_id)
+        if project:
+            # إسناد قاموس جديد حتى يلتقط SQLAlchemy التغيير في عمود JSON
+            project.images_data = {**(project.images_data or {}), str(scene_number): image_path}
+        
+        await self.db.flush()
+        await self.db.commit()
+    
+    async def checkpoint_scene_voice(
+        self,
+        project_id: int,
+        scene_number: int,
+        audio_path: str,
+        duration: float
+    ):
+        """تسجيل صوت المشهد فور توليده"""
+        
+        scene = await self.get_scene(project_id, scene_number)
+        if scene:
+            scene.audio_path = audio_path
+            scene.duration_seconds = duration
+        
+        project = await self.get_project(project_id)
+        if project:
+            project.voice_data = {
+                **(project.voice_data or {}),
+                str(scene_number): {'audio_path': audio_path, 'duration': duration}
+            }
+        
+        await self.db.flush()
+        await self.db.commit()
+    
+    async def log_stage_timings(
+        self,
+        user_id: int,
+        project_id: int,
+        records: List[dict]
+    ):
+        """حفظ أزمنة مراحل تشغيل واحد في جدول api_logs"""
+        
+        self.db.add_all([
+            APILog(
+                user_id=user_id,
+                endpoint=f"pipeline/{record['stage']}/{record['provider']}",
+                method="STAGE",
+                request_data={'project_id': project_id, **record},
+                status_code=500 if record['status'] == "error" else 200,
+                error_message=record.get('error'),
+                processing_time_ms=record['duration_ms']
+            )
+            for record in records
+        ])
+        
+        await self.db.flush()
+        await self.db.commit()
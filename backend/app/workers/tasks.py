@@ -5,6 +5,8 @@ from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.db.database import async_session_maker
 from app.agents.orchestrator import OrchestratorAgent
+from app.core.http_pool import close_http_pools
+from app.core.metrics import metrics
 
 
 @shared_task(
@@ -13,9 +15,12 @@ from app.agents.orchestrator import OrchestratorAgent
     default_retry_delay=60,
     acks_late=True
 )
-def generate_video_task(self, project_id: int):
+def generate_video_task(self, project_id: int, resume: bool = False):
     """مهمة توليد الفيديو"""
     
+    # إعادة المحاولة تستأنف من أول مخرَج ناقص بدلاً من البدء من الصفر
+    resume = resume or self.request.retries > 0
+    
     async def _execute():
         async with async_session_maker() as session:
             # استرجاع بيانات المشروع
@@ -27,6 +32,10 @@ def generate_video_task(self, project_id: int):
             if not project:
                 return {"success": False, "error": "المشروع غير موجود"}
             
+            if project.status == "cancelled":
+                # أُلغي قبل أن يبدأ العامل (أو بين محاولتين)
+                return {"success": False, "cancelled": True}
+            
             # إنشاء Orchestrator وتنفيذ خط الإنتاج
             orchestrator = OrchestratorAgent(session)
             
@@ -37,28 +46,108 @@ def generate_video_task(self, project_id: int):
                 style=project.style,
                 duration_minutes=project.duration,
                 language=project.language,
-                auto_publish=False
+                auto_publish=False,
+                resume=resume,
+                render_profile=project.quality
             )
             
+            if result.get("cancelled"):
+                # الإلغاء طلب المستخدم وليس فشلاً، فلا إعادة محاولة
+                return result
+            
+            if not result.get("success"):
+                # فشل خط الإنتاج: إطلاق استثناء لتفعيل إعادة المحاولة
+                raise Exception(result.get("error"))
+            
             return result
     
+    async def _run():
+        try:
+            return await _execute()
+        finally:
+            # الجلسات المشتركة مرتبطة بحلقة هذه المهمة
+            await close_http_pools()
+            # إرسال مقاييس المهمة حتى تظهر على /api/metrics في الخادم
+            await asyncio.to_thread(metrics.flush)
+    
     try:
-        result = asyncio.run(_execute())
+        result = asyncio.run(_run())
         return result
     except Exception as e:
         # إعادة المحاولة في حالة الفشل
         raise self.retry(exc=e)
 
 
+@shared_task(
+    bind=True,
+    max_retries=2,
+    default_retry_delay=30,
+    acks_late=True
+)
+def rerender_scene_task(self, project_id: int, scene_number: int):
+    """مهمة إعادة ترميز مشهد معدَّل ودمجه مع المقاطع المحفوظة"""
+    
+    async def _execute():
+        async with async_session_maker() as session:
+            from app.services.project_service import ProjectService
+            
+            service = ProjectService(session)
+            project = await service.get_project(project_id)
+            
+            if not project:
+                return {"success": False, "error": "المشروع غير موجود"}
+            
+            orchestrator = OrchestratorAgent(session)
+            
+            result = await orchestrator.rerender_scene(
+                project_id=project_id,
+                user_id=project.user_id,
+                scene_number=scene_number,
+                language=project.language,
+                render_profile=project.quality
+            )
+            
+            if not result.get("success") and not result.get("cancelled"):
+                raise Exception(result.get("error"))
+            
+            return result
+    
+    async def _run():
+        try:
+            return await _execute()
+        finally:
+            await close_http_pools()
+            await asyncio.to_thread(metrics.flush)
+    
+    try:
+        return asyncio.run(_run())
+    except Exception as e:
+        raise self.retry(exc=e)
+
+
 @shared_task
 def cleanup_old_files(days: int = 7):
     """تنظيف الملفات القديمة"""
     
     import os
+    import shutil
     import time
     from datetime import datetime, timedelta
     
-    directories = ["generated_images", "generated_audio", "output_videos"]
+    from app.core.media_cache import image_cache, audio_cache
+    from app.core.script_cache import script_cache
+    from app.core.workspace import sweep_stale_workspaces
+    
+    # الصور والأصوات تُدار بذاكرة مؤقتة محدودة الحجم (LRU) بدلاً من الحذف حسب العمر
+    evicted_images = image_cache.evict()
+    evicted_audio = audio_cache.evict()
+    expired_scripts = script_cache.purge_expired()
+    
+    # مساحات عمل تركها عامل توقف فجأة (الترميز لا يتجاوز حد مدة المهمة)
+    stale_workspaces = sweep_stale_workspaces(max_age_seconds=24 * 60 * 60)
+    
+    directories = ["output_videos"]
+    stale_segments = 0
     cutoff_time = time.time() - (days * 24 * 60 * 60)
     
     for directory in directories:
@@ -74,8 +163,32 @@ def cleanup_old_files(days: int = 7):
                 if file_time < cutoff_time:
                     os.remove(filepath)
                     print(f"🗑️ حذف ملف قديم: {filepath}")
+            
+            elif os.path.isdir(filepath) and filename.startswith("project_"):
+                # مقاطع المشاهد المحفوظة لإعادة الترميز: يُحذف المجلد إذا لم يُكتب فيه شيء منذ المهلة
+                # (أحدث ملف فيه هو المعيار حتى لا يُحذف مشروع قيد الترميز)
+                newest = max(
+                    (
+                        os.path.getmtime(os.path.join(root, name))
+                        for root, _, names in os.walk(filepath)
+                        for name in names
+                    ),
+                    default=os.path.getmtime(filepath)
+                )
+                
+                if newest < cutoff_time:
+                    shutil.rmtree(filepath, ignore_errors=True)
+                    stale_segments += 1
+                    print(f"🗑️ حذف مقاطع مشروع قديمة: {filepath}")
     
-    return {"cleaned": True}
+    return {
+        "cleaned": True,
+        "evicted_images": evicted_images,
+        "evicted_audio": evicted_audio,
+        "expired_scripts": expired_scripts,
+        "stale_workspaces": stale_workspaces,
+        "stale_segments": stale_segments
+    }
 
 
 @shared_task
@@ -0,0 +1,110 @@
+"""مقارنة زمن ترميز حركة Ken Burns: فلتر zoompan مقابل المولّد داخل العملية (NumPy)
+
+التشغيل من مجلد backend:
+    python -m benchmarks.ken_burns_benchmark --scenes 4 --duration 5 --profile standard
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image
+
+from app.agents.ken_burns import KenBurnsRenderer
+from app.agents.video_editor import VideoEditorAgent
+
+
+def _make_image(path: str, width: int, height: int, seed: int):
+    """صورة اختبار بتدرج وتفاصيل حتى لا يكون الترميز سهلاً بشكل غير واقعي"""
+    
+    image = Image.radial_gradient("L").resize((width, height))
+    noise = Image.effect_noise((width, height), 40 + seed * 5)
+    Image.merge("RGB", (image, noise, image.rotate(90 * seed).resize((width, height)))).save(path)
+
+
+async def _encode(editor: VideoEditorAgent, cmd: list, frames=None) -> float:
+    started = time.perf_counter()
+    await editor._run_ffmpeg(cmd, frames=frames)
+    return time.perf_counter() - started
+
+
+async def _zoompan_scene(editor: VideoEditorAgent, image_path: str, duration: float) -> float:
+    frames = int(duration * editor.profile['fps'])
+    cmd = [
+        'ffmpeg', '-y', '-i', image_path,
+        '-filter_complex', f"[0:v]{editor._video_chain(frames)}[v]",
+        '-map', '[v]', '-frames:v', str(frames),
+        *editor._encode_args(threads=editor.encode_threads),
+        '-an', '-f', 'null', '-'
+    ]
+    return await _encode(editor, cmd)
+
+
+async def _numpy_scene(editor: VideoEditorAgent, image_path: str, duration: float) -> float:
+    profile = editor.profile
+    renderer = KenBurnsRenderer(profile['width'], profile['height'], profile['fps'])
+    cmd = [
+        'ffmpeg', '-y', *renderer.input_args(),
+        '-vf', 'format=yuv420p',
+        *editor._encode_args(threads=editor.encode_threads),
+        '-an', '-f', 'null', '-'
+    ]
+    return await _encode(editor, cmd, renderer.frames(image_path, duration))
+
+
+async def _run_mode(editor: VideoEditorAgent, scene, images, duration) -> float:
+    """كل المشاهد بالتوازي ضمن حد الترميز المتزامن للمحرِّر، كما في الترميز المقطعي"""
+    
+    async def _one(image_path):
+        async with editor._encode_slots:
+            return await scene(editor, image_path, duration)
+    
+    started = time.perf_counter()
+    await asyncio.gather(*(_one(path) for path in images))
+    return time.perf_counter() - started
+
+
+async def main(args):
+    editor = VideoEditorAgent(args.profile)
+    profile = editor.profile
+    
+    with tempfile.TemporaryDirectory() as workspace:
+        images = []
+        for i in range(args.scenes):
+            path = os.path.join(workspace, f"scene_{i}.png")
+            _make_image(path, args.source_width, args.source_height, i)
+            images.append(path)
+        
+        frames = int(args.duration * profile['fps']) * args.scenes
+        results = {}
+        for name, scene in (("zoompan", _zoompan_scene), ("numpy", _numpy_scene)):
+            wall = await _run_mode(editor, scene, images, args.duration)
+            results[name] = {
+                "wall_seconds": round(wall, 3),
+                "fps": round(frames / wall, 1)
+            }
+    
+    results["speedup"] = round(results["zoompan"]["wall_seconds"] / results["numpy"]["wall_seconds"], 2)
+    print(json.dumps({
+        "profile": profile['name'],
+        "size": f"{profile['width']}x{profile['height']}",
+        "scenes": args.scenes,
+        "duration_per_scene": args.duration,
+        "encode_concurrency": editor.encode_concurrency,
+        "results": results
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scenes", type=int, default=4)
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument("--profile", default="standard")
+    parser.add_argument("--source-width", type=int, default=1792)
+    parser.add_argument("--source-height", type=int, default=1024)
+    asyncio.run(main(parser.parse_args()))
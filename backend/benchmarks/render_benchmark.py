@@ -0,0 +1,243 @@
+"""قياس أداء VideoEditorAgent بمدخلات اصطناعية من lavfi (بدون شبكة)
+
+التشغيل من مجلد backend:
+    python -m benchmarks.render_benchmark --scenes 3 10 --durations 5 --profiles draft standard final
+    python -m benchmarks.render_benchmark --output new.json --baseline old.json --tolerance 0.1
+
+الخروج برمز 1 عند انخفاض fps عن النتائج السابقة، أو عندما يكون ترميز draft المقسّم أبطأ من المرور الواحد.
+كل حالة تعمل في عملية فرعية مستقلة حتى تكون قيم CPU و peak RSS خاصة بها.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.agents.video_editor import VideoEditorAgent
+
+
+def _ffmpeg(*args: str):
+    subprocess.run(['ffmpeg', '-y', '-v', 'error', *args], check=True)
+
+
+def _make_inputs(workspace: str, scenes: int, duration: float, width: int, height: int):
+    """صور اختبار (testsrc2) وأصوات نغمة وصمت بالتناوب لكل مشهد"""
+    
+    images, audio_files = [], []
+    for i in range(scenes):
+        image = os.path.join(workspace, f"scene_{i}.png")
+        _ffmpeg(
+            '-f', 'lavfi', '-i', f"testsrc2=size={width}x{height}:rate=1",
+            '-ss', str(i), '-frames:v', '1', image
+        )
+        images.append(image)
+        
+        audio = os.path.join(workspace, f"scene_{i}.wav")
+        source = (
+            f"sine=frequency={220 * (i % 4 + 1)}:sample_rate=44100:duration={duration}"
+            if i % 2 == 0 else
+            f"anullsrc=channel_layout=stereo:sample_rate=44100:d={duration}"
+        )
+        _ffmpeg('-f', 'lavfi', '-i', source, '-t', str(duration), audio)
+        audio_files.append(audio)
+    
+    return images, audio_files
+
+
+async def _render(case: dict, workspace: str, images: list, audio_files: list) -> float:
+    editor = VideoEditorAgent(case['profile'])
+    editor.output_dir = workspace
+    
+    started = time.perf_counter()
+    await editor.assemble_video(
+        images=images,
+        audio_files=audio_files,
+        output_filename="benchmark.mp4",
+        subtitles=[{'text': f"المشهد {i + 1}"} for i in range(case['scenes'])],
+        durations=[case['duration']] * case['scenes'],
+        segmented=case['segmented'],
+        watermark_path="",
+        intro_path=""
+    )
+    return time.perf_counter() - started
+
+
+def run_case(case: dict) -> dict:
+    """تنفيذ حالة واحدة داخل هذه العملية (تُستدعى من عملية فرعية)"""
+    
+    with tempfile.TemporaryDirectory() as workspace:
+        # المدخلات تُولَّد قبل لقطات getrusage حتى لا يُحسب وقت CPU لعمليات ffmpeg الخاصة بها
+        images, audio_files = _make_inputs(
+            workspace, case['scenes'], case['duration'], case['source_width'], case['source_height']
+        )
+        
+        before_self = resource.getrusage(resource.RUSAGE_SELF)
+        before_children = resource.getrusage(resource.RUSAGE_CHILDREN)
+        
+        wall = asyncio.run(_render(case, workspace, images, audio_files))
+        
+        after_self = resource.getrusage(resource.RUSAGE_SELF)
+        after_children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    
+    editor = VideoEditorAgent(case['profile'])
+    profile = editor.profile
+    frames = int(case['scenes'] * case['duration'] * profile['fps'])
+    cpu = sum(
+        (getattr(after, field) - getattr(before, field))
+        for before, after in ((before_self, after_self), (before_children, after_children))
+        for field in ('ru_utime', 'ru_stime')
+    )
+    
+    # ru_maxrss بالكيلوبايت على Linux وبالبايت على macOS
+    rss_unit = 1 if sys.platform == "darwin" else 1024
+    
+    return {
+        **case,
+        "size": f"{profile['width']}x{profile['height']}",
+        "renditions": len(editor.renditions),
+        "frames": frames,
+        # الوقت يبدأ بعد تجهيز المدخلات فلا يدخل توليدها في القياس
+        "wall_seconds": round(wall, 3),
+        "fps": round(frames / wall, 2),
+        "cpu_seconds": round(cpu, 3),
+        "peak_rss_mb": round(
+            max(after_self.ru_maxrss, after_children.ru_maxrss) * rss_unit / (1024 * 1024), 1
+        ),
+    }
+
+
+def _case_id(case: dict) -> str:
+    mode = "segmented" if case['segmented'] else "single"
+    return f"{case['profile']}/{case['scenes']}x{case['duration']}s/{mode}"
+
+
+def _run_isolated(case: dict) -> dict:
+    """تشغيل الحالة في عملية جديدة (peak RSS للعمليات الفرعية لا يُصفَّر داخل العملية نفسها)"""
+    
+    result = subprocess.run(
+        [sys.executable, '-m', 'benchmarks.render_benchmark', '--case', json.dumps(case)],
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        capture_output=True,
+        text=True
+    )
+    if result.returncode != 0:
+        return {**case, "error": result.stderr.strip().splitlines()[-1:]}
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def _environment() -> dict:
+    version = subprocess.run(['ffmpeg', '-version'], capture_output=True, text=True).stdout
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "ffmpeg": version.splitlines()[0] if version else None,
+    }
+
+
+def compare(results: list, baseline: dict, tolerance: float) -> list:
+    """الحالات التي انخفض فيها fps بأكثر من tolerance مقارنة بنتائج سابقة"""
+    
+    previous = {r['id']: r for r in baseline.get('results', []) if 'fps' in r}
+    regressions = []
+    for result in results:
+        old = previous.get(result['id'])
+        if old and 'fps' in result and result['fps'] < old['fps'] * (1 - tolerance):
+            regressions.append({
+                "id": result['id'],
+                "fps": result['fps'],
+                "baseline_fps": old['fps'],
+                "change": round(result['fps'] / old['fps'] - 1, 3)
+            })
+    return regressions
+
+
+def segmented_regressions(results: list, profiles=("draft",), tolerance: float = 0.1) -> list:
+    """الحالات التي كان فيها الترميز المقسّم أبطأ من المرور الواحد لنفس المدخلات (للملفات السريعة)"""
+    
+    # المرور الواحد هو خط الأساس: المقاطع المتوازية يجب ألا تجعل ملف draft أبطأ منه
+    single = {
+        (r['profile'], r['scenes'], r['duration']): r
+        for r in results if not r.get('segmented') and 'wall_seconds' in r
+    }
+    regressions = []
+    for result in results:
+        if not result.get('segmented') or result.get('profile') not in profiles or 'wall_seconds' not in result:
+            continue
+        baseline = single.get((result['profile'], result['scenes'], result['duration']))
+        if baseline and result['wall_seconds'] > baseline['wall_seconds'] * (1 + tolerance):
+            regressions.append({
+                "id": result['id'],
+                "wall_seconds": result['wall_seconds'],
+                "single_pass_seconds": baseline['wall_seconds'],
+                "change": round(result['wall_seconds'] / baseline['wall_seconds'] - 1, 3)
+            })
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scenes", type=int, nargs="+", default=[3, 10])
+    parser.add_argument("--durations", type=float, nargs="+", default=[5.0])
+    parser.add_argument("--profiles", nargs="+", default=["draft", "standard", "final"])
+    parser.add_argument("--modes", nargs="+", choices=["segmented", "single"], default=["segmented", "single"])
+    parser.add_argument("--source-width", type=int, default=1792)
+    parser.add_argument("--source-height", type=int, default=1024)
+    parser.add_argument("--output", help="ملف JSON للنتائج (افتراضياً stdout)")
+    parser.add_argument("--baseline", help="نتائج سابقة للمقارنة")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="أقصى انخفاض مسموح في fps")
+    parser.add_argument("--case", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    
+    if args.case:
+        print(json.dumps(run_case(json.loads(args.case))))
+        return
+    
+    results = []
+    for profile, scenes, duration, mode in itertools.product(
+        args.profiles, args.scenes, args.durations, args.modes
+    ):
+        case = {
+            "profile": profile,
+            "scenes": scenes,
+            "duration": duration,
+            "segmented": mode == "segmented",
+            "source_width": args.source_width,
+            "source_height": args.source_height,
+        }
+        result = {"id": _case_id(case), **_run_isolated(case)}
+        results.append(result)
+        print(f"{result['id']}: {result.get('fps', result.get('error'))} fps", file=sys.stderr)
+    
+    report = {"environment": _environment(), "results": results}
+    
+    # يُقاس فقط عند تشغيل الوضعين معاً
+    report["segmented_regressions"] = segmented_regressions(results, tolerance=args.tolerance)
+    exit_code = 1 if report["segmented_regressions"] else 0
+    
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            report["regressions"] = compare(results, json.load(f), args.tolerance)
+        if report["regressions"]:
+            exit_code = 1
+    
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output)
+    else:
+        print(output)
+    
+    sys.exit(exit_code)
+
+
+if __name__ == "__main__":
+    main()
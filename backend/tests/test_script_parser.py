@@ -0,0 +1,159 @@
+"""اختبارات تحليل رد النموذج للسكريبت"""
+import asyncio
+import json
+
+import pytest
+
+from app.agents.script_parser import SceneStreamParser, ScriptStream, extract_json, parse_script
+
+
+SCRIPT = {
+    "title": "عنوان \"مقتبس\" {مع أقواس}",
+    "description": "وصف",
+    "scenes": [
+        {"text": "أ [ب] }", "visual_prompt": "p1", "meta": {"scenes": [1, 2]}},
+        {"scene_number": 7, "text": "نص مع \\\" شرطة", "visual_prompt": "p2"},
+        {"text": "ج", "visual_prompt": "p3"}
+    ],
+    "tags": ["t1", "t2"]
+}
+
+
+@pytest.mark.parametrize("text, expected, salvaged", [
+    # JSON سليم
+    ('{"a": 1, "b": [1, 2]}', {"a": 1, "b": [1, 2]}, False),
+    # أسوار Markdown ونص قبل الكائن وبعده
+    ('إليك السكريبت:\n```json\n{"a": 1}\n```\nبالتوفيق', {"a": 1}, False),
+    # فواصل زائدة قبل ] و }
+    ('{"a": [1, 2,], "b": {"c": 3,},}', {"a": [1, 2], "b": {"c": 3}}, False),
+    # تعليقات، دون المساس بمحتوى السلاسل
+    ('{"a": 1, // تعليق\n"b": "x // y", /* كتلة */ "c": 2}', {"a": 1, "b": "x // y", "c": 2}, False),
+    # فواصل ناقصة بين القيم المتجاورة
+    ('{"a": 1 "b": 2}', {"a": 1, "b": 2}, False),
+    ('{"s": [{"x": 1} {"y": 2}]}', {"s": [{"x": 1}, {"y": 2}]}, False),
+    ('{"s": ["a" "b"], "n": [1 2 -3], "l": [true false null]}',
+     {"s": ["a", "b"], "n": [1, 2, -3], "l": [True, False, None]}, False),
+    # أسطر جديدة خام داخل السلاسل
+    ('{"a": "سطر1\nسطر2"}', {"a": "سطر1\nسطر2"}, False),
+    # أقواس وعلامات تنصيص مهرَّبة داخل السلاسل
+    ('{"a": "} ] \\" {", "b": 1}', {"a": "} ] \" {", "b": 1}, False),
+    # رد مقطوع: يُبقى ما اكتمل وتُغلق الأقواس المفتوحة
+    ('{"title": "T", "scenes": [{"text": "a"}, {"text": "b"}, {"text": "c',
+     {"title": "T", "scenes": [{"text": "a"}, {"text": "b"}]}, True),
+    # القطع بعد آخر كائن أو مصفوفة مغلقة فقط: المصفوفة غير المغلقة تُحذف كلها
+    ('{"scenes": [{"text": "a"}], "tags": ["x", "y"', {"scenes": [{"text": "a"}]}, True),
+    # عيب لا يُصلح في منتصف الرد: القطع قبل موضعه
+    ('{"scenes": [{"text": "a"}, {"text": "b" :: }], "tags": []}', {"scenes": [{"text": "a"}]}, True),
+])
+def test_extract_json(text, expected, salvaged):
+    assert extract_json(text) == (expected, salvaged)
+
+
+@pytest.mark.parametrize("text", [
+    "لا يوجد JSON هنا",
+    '{"title": "مقطوع قبل أي قيمة مكتملة',
+])
+def test_extract_json_rejects(text):
+    with pytest.raises(ValueError):
+        extract_json(text)
+
+
+def test_parse_script_marks_salvaged():
+    script = parse_script('{"title": "T", "scenes": [{"text": "a"}, {"text": "b')
+    assert script == {"title": "T", "scenes": [{"text": "a", "scene_number": 1}], "salvaged": True}
+    assert "salvaged" not in parse_script(json.dumps(SCRIPT))
+
+
+@pytest.mark.parametrize("indent", [None, 2])
+def test_stream_parser_one_character_at_a_time(indent):
+    text = "```json\n" + json.dumps(SCRIPT, ensure_ascii=False, indent=indent) + "\n```"
+    parser = SceneStreamParser()
+    
+    delivered = []
+    for i, char in enumerate(text):
+        for scene in parser.feed(char):
+            delivered.append((i, scene))
+    
+    # كل مشهد يُسلَّم عند حرف } الذي يغلقه تحديداً
+    assert [text[i] for i, _ in delivered] == ["}"] * 3
+    assert [scene["text"] for _, scene in delivered] == [s["text"] for s in SCRIPT["scenes"]]
+    assert [scene["scene_number"] for _, scene in delivered] == [1, 2, 3]
+    
+    script = parser.finish()
+    assert script["title"] == SCRIPT["title"]
+    assert script["scenes"] == [scene for _, scene in delivered]
+
+
+@pytest.mark.parametrize("numbers", [
+    # رقم مكرر
+    [1, 1, 2],
+    # أرقام نصية
+    ["1", "2", "3"],
+    # 0 رقم المقدمة
+    [0, 1, 2],
+])
+def test_scene_numbers_follow_position(numbers):
+    script = {"scenes": [{"scene_number": n, "text": str(i)} for i, n in enumerate(numbers)]}
+    text = json.dumps(script)
+    
+    parser = SceneStreamParser()
+    delivered = [scene for char in text for scene in parser.feed(char)]
+    assert [scene["scene_number"] for scene in delivered] == [1, 2, 3]
+    assert [scene["scene_number"] for scene in parser.finish()["scenes"]] == [1, 2, 3]
+    assert [scene["scene_number"] for scene in parse_script(text)["scenes"]] == [1, 2, 3]
+    
+    async def replay():
+        # سكريبت جاهز من الذاكرة المؤقتة
+        return [scene async for scene in ScriptStream(None, script=json.loads(text))]
+    
+    assert [scene["scene_number"] for scene in asyncio.run(replay())] == [1, 2, 3]
+
+
+def test_stream_parser_finish_adds_scenes_missing_from_stream():
+    parser = SceneStreamParser()
+    # "scenes" ليس أول مفتاح ومصفوفة مفتاح آخر تسبقه لا تُعامل كمشاهد
+    text = '{"other": [{"text": "x"}], "scenes": [{"text": "a"}, {"text": "b"'
+    for char in text:
+        parser.feed(char)
+    
+    assert [scene["text"] for scene in parser.scenes] == ["a"]
+    script = parser.finish()
+    assert [scene["text"] for scene in script["scenes"]] == ["a"]
+    assert script["salvaged"] is True
+
+
+def test_stream_parser_matches_scenes_by_position():
+    # المشهد الأوسط لا يُصلح: البث يسلّم ما بعده، والتحليل الكامل يُقطع قبله
+    text = '{"scenes": [{"text": "a"}, {"text": "b" :: }, {"text": "c"}], "tags": []}'
+    completed = []
+    
+    async def deltas():
+        yield text
+    
+    async def consume():
+        stream = ScriptStream(deltas(), on_complete=completed.append)
+        return [scene async for scene in stream]
+    
+    scenes = asyncio.run(consume())
+    assert [(scene["text"], scene["scene_number"]) for scene in scenes] == [("a", 1), ("c", 3)]
+    assert completed[0]["scenes"] == scenes
+    assert completed[0]["salvaged"] is True
+
+
+def test_script_stream_delivers_scenes_then_script():
+    text = json.dumps(SCRIPT, ensure_ascii=False)
+    completed = []
+    
+    async def deltas():
+        for i in range(0, len(text), 7):
+            yield text[i:i + 7]
+    
+    async def consume():
+        stream = ScriptStream(deltas(), on_complete=completed.append)
+        scenes = [scene async for scene in stream]
+        return stream, scenes
+    
+    stream, scenes = asyncio.run(consume())
+    assert [scene["scene_number"] for scene in scenes] == [1, 2, 3]
+    assert completed == [stream.script]
+    assert stream.script["scenes"] == scenes
@@ -1,19 +1,21 @@
 """مولد صوت مبسط - HTTP APIs فقط (لا يحتاج Rust)"""
 import os
 import asyncio
+import shutil
 import aiohttp
 from pathlib import Path
 from typing import Dict, List, Optional
 
 from app.core.config_render import settings
+from app.core.media_cache import audio_cache, cache_key
 
 
 class SimpleVoiceGenerator:
     """مولد صوت بسيط - يستخدم HTTP APIs فقط"""
     
     def __init__(self):
-        self.cache_dir = "generated_audio"
-        os.makedirs(self.cache_dir, exist_ok=True)
+        self.cache = audio_cache
+        self.cache_dir = audio_cache.cache_dir
         
         # قائمة الأصوات لـ Edge TTS
         self.voices = {
@@ -37,19 +39,34 @@ class SimpleVoiceGenerator:
     ) -> str:
         """生成语音 - 使用简单的占位符方法"""
         
-        output_path = output_path or f"voice_{hash(text)}.mp3"
+        voice = self.voices.get(language, {}).get("default", "zh-CN-XiaoxiaoNeural")
+        
+        # 与 FreeVoiceGenerator 使用相同的缓存键 (默认语速和音量)
+        key = cache_key(text, "edge-tts", voice, "+0%", "+0%")
+        
+        cached_path = self.cache.get(key)
+        if cached_path:
+            return self._deliver(cached_path, output_path)
         
         # 方法1: 如果有edge-tts库
         try:
             import edge_tts
-            voice = self.voices.get(language, {}).get("default", "zh-CN-XiaoxiaoNeural")
+            partial_path = self.cache.partial_path(key, ".mp3")
             communicate = edge_tts.Communicate(text, voice)
-            await communicate.save(output_path)
-            print(f"✅ Edge TTS生成成功: {output_path}")
-            return output_path
+            await communicate.save(partial_path)
+            audio_path = await self.cache.put_file(
+                key, partial_path, ".mp3",
+                meta={'provider': 'edge-tts', 'voice': voice, 'rate': "+0%", 'volume': "+0%"},
+                probe=True
+            )
+            print(f"✅ Edge TTS生成成功: {audio_path}")
+            return self._deliver(audio_path, output_path)
         except ImportError:
             pass
         
+        # 占位符不登记到缓存
+        output_path = output_path or os.path.join(self.cache_dir, f"placeholder_{key[:16]}.mp3")
+        
         # 方法2: 使用HTTP API (如果有密钥)
         if settings.GROQ_API_KEY or settings.HUGGINGFACE_API_KEY:
             return await self._generate_http_tts(text, output_path, language)
@@ -57,6 +74,15 @@ class SimpleVoiceGenerator:
         # 方法3: 创建占位符
         return await self._create_placeholder(text, output_path)
     
+    def _deliver(self, cached_path: str, output_path: str = None) -> str:
+        """如指定了输出路径则从缓存复制"""
+        
+        if not output_path:
+            return cached_path
+        
+        shutil.copyfile(cached_path, output_path)
+        return output_path
+    
     async def _generate_http_tts(
         self,
         text: str,
@@ -105,13 +131,13 @@ class SimpleVoiceGenerator:
             if text:
                 audio_path = await self.generate_voice(
                     text=text,
-                    language=language,
-                    output_path=f"scene_{i+1}_voice.mp3"
+                    language=language
                 )
+                entry = self.cache.entry_for_path(audio_path)
                 audio_files.append({
                     'scene_number': scene.get('scene_number', i+1),
                     'audio_path': audio_path,
-                    'duration': self._estimate_duration(text)
+                    'duration': (entry or {}).get('meta', {}).get('duration') or self._estimate_duration(text)
                 })
         
         return audio_files